@@ -0,0 +1,346 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from fastapi import HTTPException, Request, status
+from fastapi.responses import JSONResponse
+
+import metrics
+from loop_monitor import monitor
+
+logger = logging.getLogger(__name__)
+
+# Admission control can be switched off entirely (e.g. for load tests of the
+# handlers themselves)
+admission_enabled = os.environ.get("ADMISSION_ENABLED", "1").lower() not in ("0", "false", "no")
+
+# Event loop lag above which cache misses are shed, and the (higher) lag
+# above which every request except health checks is shed
+shed_lag = float(os.environ.get("ADMISSION_SHED_LAG_MS", 250)) / 1000
+critical_lag = float(os.environ.get("ADMISSION_CRITICAL_LAG_MS", 1000)) / 1000
+
+# Requests in progress across the worker before new ones are shed
+max_in_flight = int(os.environ.get("ADMISSION_MAX_IN_FLIGHT", 512))
+
+# Use the first X-Forwarded-For hop as the client address (only behind a
+# trusted proxy)
+trust_forwarded = os.environ.get("ADMISSION_TRUST_FORWARDED", "0").lower() in ("1", "true", "yes")
+
+# Number of client token buckets kept per policy; the least recently seen
+# clients are dropped first (a dropped bucket is equivalent to a full one)
+max_clients = int(os.environ.get("ADMISSION_MAX_CLIENTS", 10000))
+
+# Paths that are never rate limited or shed
+exempt_paths = ("/health", "/ready", "/metrics")
+
+# Long-lived streams (path prefixes): admitted like other requests but not
+# counted as in progress once open (they cap their own subscribers)
+stream_paths = ("/destinations/flights/stream", "/export/")
+
+ADMISSION_REJECTED = metrics.registry.counter(
+    "tourease_admission_rejected_total",
+    "Requests rejected by admission control",
+    ["policy", "reason"],
+)
+ADMISSION_ACTIVE = metrics.registry.gauge(
+    "tourease_admission_active",
+    "Cache-miss computations running under each policy's concurrency limit",
+    ["policy"],
+)
+ADMISSION_QUEUED = metrics.registry.gauge(
+    "tourease_admission_queued",
+    "Cache-miss computations waiting for a concurrency slot",
+    ["policy"],
+)
+ADMISSION_WAIT = metrics.registry.histogram(
+    "tourease_admission_wait_seconds",
+    "Time spent waiting for a concurrency slot",
+    ["policy"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+
+
+class Overloaded(HTTPException):
+    """
+    503 raised when a request is shed; carries a Retry-After header.
+    """
+
+    def __init__(self, reason: str, retry_after: float = 1.0):
+        self.reason = reason
+        super().__init__(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Service overloaded ({reason}), retry later",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+
+
+class RateLimited(HTTPException):
+    def __init__(self, retry_after: float):
+        super().__init__(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Rate limit exceeded",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+
+
+def _env(name, key, default, cast=float):
+    value = os.environ.get(f"ADMISSION_{name.upper().replace('-', '_')}_{key}")
+    return cast(value) if value is not None else default
+
+
+# Whether the warning about a proxy in front without trust_forwarded has
+# been logged (once per worker)
+_warned_forwarded = False
+
+
+def _warn_untrusted_forwarding(scope, client):
+    global _warned_forwarded
+    for key, _ in scope.get("headers", ()):
+        if key in (b"x-forwarded-for", b"forwarded"):
+            _warned_forwarded = True
+            logger.warning(
+                "Request from %s has a %s header but ADMISSION_TRUST_FORWARDED is off: "
+                "if it is a proxy, all clients behind it share one rate limit bucket",
+                client, key.decode("latin-1"),
+            )
+            return
+
+
+def client_address(scope) -> str:
+    if trust_forwarded:
+        for key, value in scope.get("headers", ()):
+            if key == b"x-forwarded-for":
+                return value.decode("latin-1").split(",")[0].strip()
+    client = scope.get("client")
+    address = client[0] if client else "unknown"
+    if not trust_forwarded and not _warned_forwarded:
+        _warn_untrusted_forwarding(scope, address)
+    return address
+
+
+class TokenBucketLimiter:
+    """
+    Per-client token buckets: each client may make ``rate`` requests per
+    second on average, with bursts of up to ``burst``.
+    """
+
+    def __init__(self, rate: float, burst: float, max_clients: int = max_clients):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        # client -> (tokens, last refill); ordered by last use for eviction
+        self._buckets: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def acquire(self, client: str, now: Optional[float] = None) -> float:
+        """
+        Take a token for ``client``. Returns 0 when allowed, otherwise the
+        number of seconds until a token is available.
+        """
+        now = time.monotonic() if now is None else now
+        tokens, updated = self._buckets.pop(client, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        if tokens >= 1:
+            self._buckets[client] = (tokens - 1, now)
+            wait = 0.0
+        else:
+            self._buckets[client] = (tokens, now)
+            wait = (1 - tokens) / self.rate
+        if len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+        return wait
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class ConcurrencyLimiter:
+    """
+    Caps concurrent work with a bounded wait queue: callers beyond
+    ``max_queue`` waiters, or that wait longer than ``max_wait`` seconds, are
+    shed instead of queueing indefinitely.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, max_wait: float):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.active = 0
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        ADMISSION_ACTIVE.labels(name).set_function(lambda: self.active)
+        ADMISSION_QUEUED.labels(name).set_function(lambda: self.waiting)
+        self._wait = ADMISSION_WAIT.labels(name)
+
+    @asynccontextmanager
+    async def slot(self):
+        if self._semaphore.locked():
+            if self.waiting >= self.max_queue:
+                ADMISSION_REJECTED.labels(self.name, "queue_full").inc()
+                raise Overloaded("queue full", self.max_wait)
+            started = time.perf_counter()
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.max_wait)
+            except asyncio.TimeoutError:
+                ADMISSION_REJECTED.labels(self.name, "queue_timeout").inc()
+                raise Overloaded("queue timeout", self.max_wait)
+            finally:
+                self.waiting -= 1
+            self._wait.observe(time.perf_counter() - started)
+        else:
+            await self._semaphore.acquire()
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
+
+class AdmissionPolicy:
+    """
+    Admission settings for one router.
+
+    Used as a router dependency it applies the per-client rate limit to every
+    request. ``cold_path()`` wraps the expensive part of a handler (cache
+    misses, upstream calls): it sheds the work when the event loop is lagging
+    and bounds how much of it runs at once, so cached hits keep being served
+    while misses are turned away first.
+
+    Every setting can be overridden with ``ADMISSION_<NAME>_<SETTING>``
+    environment variables, e.g. ``ADMISSION_DESTINATIONS_RATE``.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rate: float = 50,
+        burst: float = 100,
+        max_concurrency: int = 8,
+        max_queue: int = 32,
+        max_wait: float = 5.0,
+        shed_lag: float = shed_lag,
+    ):
+        self.name = name
+        self.rate = _env(name, "RATE", rate)
+        self.burst = _env(name, "BURST", burst)
+        self.shed_lag = _env(name, "SHED_LAG_MS", shed_lag * 1000) / 1000
+        self.limiter = TokenBucketLimiter(self.rate, self.burst)
+        self.concurrency = ConcurrencyLimiter(
+            name,
+            _env(name, "CONCURRENCY", max_concurrency, int),
+            _env(name, "QUEUE", max_queue, int),
+            _env(name, "MAX_WAIT", max_wait),
+        )
+
+    def settings(self) -> dict:
+        return {
+            "rate": self.rate,
+            "burst": self.burst,
+            "max_concurrency": self.concurrency.max_concurrency,
+            "max_queue": self.concurrency.max_queue,
+            "max_wait": self.concurrency.max_wait,
+            "shed_lag_ms": self.shed_lag * 1000,
+        }
+
+    async def __call__(self, request: Request):
+        if not admission_enabled or self.rate <= 0:
+            return
+        wait = self.limiter.acquire(client_address(request.scope))
+        if wait:
+            ADMISSION_REJECTED.labels(self.name, "rate_limited").inc()
+            raise RateLimited(wait)
+
+    def admit_cold(self):
+        """
+        Shed a cache miss while the event loop is lagging. Enough on its own
+        for misses computed synchronously on the loop.
+        """
+        if not admission_enabled:
+            return
+        lag = monitor.current_lag()
+        if lag > self.shed_lag:
+            ADMISSION_REJECTED.labels(self.name, "loop_lag").inc()
+            raise Overloaded("event loop lag", lag)
+
+    @asynccontextmanager
+    async def cold_path(self):
+        """
+        Admit a cache miss that awaits (e.g. an upstream call) and hold one
+        of the policy's concurrency slots while it runs.
+        """
+        self.admit_cold()
+        if not admission_enabled:
+            yield
+            return
+        async with self.concurrency.slot():
+            yield
+
+
+_policies: Dict[str, AdmissionPolicy] = {}
+
+
+def policy(name: str, **settings) -> AdmissionPolicy:
+    """
+    Create (or return) the admission policy for a router.
+    """
+    if name not in _policies:
+        _policies[name] = AdmissionPolicy(name, **settings)
+    return _policies[name]
+
+
+def policies() -> Dict[str, dict]:
+    return {name: p.settings() for name, p in _policies.items()}
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware shedding load for the whole worker before routing: when
+    too many requests are in progress or the event loop is critically behind,
+    new requests get 503 with Retry-After. Health, readiness and metrics
+    endpoints are always admitted.
+    """
+
+    def __init__(self, app, max_in_flight=max_in_flight, critical_lag=critical_lag):
+        self.app = app
+        self.max_in_flight = max_in_flight
+        self.critical_lag = critical_lag
+        self.in_flight = 0
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or not admission_enabled
+            or scope["path"] in exempt_paths
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        if self.max_in_flight and self.in_flight >= self.max_in_flight:
+            ADMISSION_REJECTED.labels("global", "in_flight").inc()
+            await self._reject(Overloaded("too many requests in progress"), scope, receive, send)
+            return
+        lag = monitor.current_lag()
+        if lag > self.critical_lag:
+            ADMISSION_REJECTED.labels("global", "loop_lag").inc()
+            await self._reject(Overloaded("event loop lag", lag), scope, receive, send)
+            return
+        if scope["path"].startswith(stream_paths):
+            await self.app(scope, receive, send)
+            return
+
+        self.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.in_flight -= 1
+
+    async def _reject(self, exc, scope, receive, send):
+        response = JSONResponse({"detail": exc.detail}, status_code=exc.status_code, headers=exc.headers)
+        await response(scope, receive, send)
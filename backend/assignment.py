@@ -0,0 +1,250 @@
+"""
+Assignment of guides to tour requests.
+
+Guides are turned into arrays once per catalog version: a guide x language
+matrix, a guide x weekday matrix, specialization codes and a quality score
+from rating and experience. A guide can take a request if they speak its
+language and work on its weekday; among those, guides with a matching
+specialization score higher.
+
+Requests sharing a language, weekday and specialization (a profile) share
+one vectorized scoring pass over all guides, which yields the profile's
+feasible guides sorted by score. Each day is then solved greedily: requests
+with the fewest feasible guides go first (larger groups first among equals),
+and each takes the best guide with capacity left. A pointer per profile
+skips guides that are fully booked; capacity only goes down during a day, so
+this costs linear time overall. Requests left over then try a one-step
+augmenting path: take a feasible guide whose request can move to another
+guide with capacity.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import date
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Requests a guide can take per day unless the caller sets it
+default_daily_capacity = int(os.environ.get("ASSIGN_GUIDE_DAILY_CAPACITY", 2))
+# Feasible guides tried per leftover request in the augmenting pass
+augment_candidates = int(os.environ.get("ASSIGN_AUGMENT_CANDIDATES", 50))
+
+# Score weights: rating and experience make up the quality score in [0, 1]
+RATING_WEIGHT = 0.7
+EXPERIENCE_WEIGHT = 0.3
+# Experience beyond this many years doesn't score higher
+EXPERIENCE_CAP = 20
+SPECIALIZATION_BONUS = 0.5
+
+WEEKDAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+
+
+class TourRequest(NamedTuple):
+    date: date
+    language: str
+    specialization: Optional[str]
+    group_size: int
+
+
+class GuideMatrix:
+    """
+    Array view of the guides of one tour_guides table.
+    """
+
+    def __init__(self, table):
+        self.table = table
+        n = len(table)
+        self.ids: List[Optional[str]] = []
+        self.language_codes: Dict[str, int] = {}
+        self.specialization_codes: Dict[str, int] = {}
+        language_pairs = []
+        specializations = np.full(n, -1, dtype=np.int32)
+        self.days = np.zeros((n, len(WEEKDAYS)), dtype=bool)
+        rating = np.zeros(n, dtype=np.float32)
+        experience = np.zeros(n, dtype=np.float32)
+        for i, row in enumerate(table):
+            self.ids.append(row.get("id"))
+            for language in row.get("languages") or ():
+                if isinstance(language, str):
+                    code = self.language_codes.setdefault(language.casefold(), len(self.language_codes))
+                    language_pairs.append((i, code))
+            specialization = row.get("specialization")
+            if isinstance(specialization, str):
+                specializations[i] = self.specialization_codes.setdefault(
+                    specialization.casefold(), len(self.specialization_codes)
+                )
+            availability = row.get("availability")
+            days = availability.get("days") if isinstance(availability, dict) else None
+            for day in days or ():
+                if isinstance(day, str) and day.casefold() in WEEKDAYS:
+                    self.days[i, WEEKDAYS.index(day.casefold())] = True
+            rating[i] = row.get("rating") or 0
+            experience[i] = row.get("experience_years") or 0
+        self.languages = np.zeros((n, len(self.language_codes)), dtype=bool)
+        if language_pairs:
+            pairs = np.array(language_pairs, dtype=np.int64)
+            self.languages[pairs[:, 0], pairs[:, 1]] = True
+        self.specializations = specializations
+        self.quality = (
+            RATING_WEIGHT * np.clip(rating / 5, 0, 1)
+            + EXPERIENCE_WEIGHT * np.minimum(experience, EXPERIENCE_CAP) / EXPERIENCE_CAP
+        ).astype(np.float32)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def profile(self, language: str, weekday: int, specialization: Optional[str]):
+        """
+        Feasible guides for a request profile, best first, with their scores
+        and whether their specialization matches.
+        """
+        code = self.language_codes.get(language.casefold())
+        if code is None:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, np.zeros(0, dtype=np.float32), np.zeros(0, dtype=bool)
+        feasible = self.languages[:, code] & self.days[:, weekday]
+        scores = self.quality.copy()
+        matches = np.zeros(len(self), dtype=bool)
+        if specialization:
+            wanted = specialization.casefold()
+            # Same rule as the specialization filter of the guide list
+            by_code = np.array([wanted in name for name in self.specialization_codes] + [False], dtype=bool)
+            matches = by_code[self.specializations]
+            scores += SPECIALIZATION_BONUS * matches
+        candidates = np.flatnonzero(feasible)
+        order = np.argsort(-scores[candidates], kind="stable")
+        candidates = candidates[order]
+        return candidates, scores[candidates], matches[candidates]
+
+
+class Profile:
+    """
+    Feasible guides of one profile and the position of the first one that
+    may still have capacity on the day being solved.
+    """
+
+    __slots__ = ("candidates", "scores", "matches", "pointer")
+
+    def __init__(self, candidates, scores, matches):
+        self.candidates = candidates.tolist()
+        self.scores = scores.tolist()
+        self.matches = matches.tolist()
+        self.pointer = 0
+
+    def next_available(self, capacity) -> int:
+        # Position of the best guide with capacity left, -1 when none
+        candidates = self.candidates
+        pointer = self.pointer
+        while pointer < len(candidates) and capacity[candidates[pointer]] == 0:
+            pointer += 1
+        self.pointer = pointer
+        return pointer if pointer < len(candidates) else -1
+
+
+def assign(matrix: GuideMatrix, requests: Sequence[TourRequest], daily_capacity: int = default_daily_capacity):
+    """
+    Assign guides to requests (blocking; call off the event loop). Returns
+    per request its guide's row, score and whether the specialization
+    matched (None when unassigned), and the reason for each unassigned
+    request by position.
+    """
+    started = time.perf_counter()
+    profile_keys = []
+    profiles: Dict[tuple, Tuple] = {}
+    for request in requests:
+        key = (request.language.casefold(), request.date.weekday(), (request.specialization or "").casefold())
+        profile_keys.append(key)
+        if key not in profiles:
+            profiles[key] = matrix.profile(request.language, key[1], request.specialization)
+    language_known = {key: key[0] in matrix.language_codes for key in profiles}
+
+    by_date: Dict[date, List[int]] = {}
+    for index, request in enumerate(requests):
+        by_date.setdefault(request.date, []).append(index)
+
+    chosen: List[Optional[Tuple[int, float, bool]]] = [None] * len(requests)
+    for day_requests in by_date.values():
+        day_profiles = {key: Profile(*profiles[key]) for key in {profile_keys[i] for i in day_requests}}
+        capacity = [daily_capacity] * len(matrix)
+        holders: Dict[int, List[int]] = {}
+        # Scarcest requests first, then larger groups
+        day_requests.sort(key=lambda i: (len(day_profiles[profile_keys[i]].candidates), -requests[i].group_size, i))
+        leftover = []
+        for i in day_requests:
+            profile = day_profiles[profile_keys[i]]
+            position = profile.next_available(capacity)
+            if position < 0:
+                leftover.append(i)
+                continue
+            guide = profile.candidates[position]
+            capacity[guide] -= 1
+            holders.setdefault(guide, []).append(i)
+            chosen[i] = (guide, profile.scores[position], profile.matches[position])
+
+        # One-step augmenting paths: a leftover request takes a feasible
+        # guide whose request moves to a guide with capacity left
+        for i in leftover:
+            profile = day_profiles[profile_keys[i]]
+            for position in range(min(len(profile.candidates), augment_candidates)):
+                guide = profile.candidates[position]
+                moved = False
+                for other in holders.get(guide, ()):
+                    other_profile = day_profiles[profile_keys[other]]
+                    alternative = other_profile.next_available(capacity)
+                    if alternative < 0:
+                        continue
+                    new_guide = other_profile.candidates[alternative]
+                    capacity[new_guide] -= 1
+                    holders[guide].remove(other)
+                    holders.setdefault(new_guide, []).append(other)
+                    chosen[other] = (new_guide, other_profile.scores[alternative], other_profile.matches[alternative])
+                    holders[guide].append(i)
+                    chosen[i] = (guide, profile.scores[position], profile.matches[position])
+                    moved = True
+                    break
+                if moved:
+                    break
+
+    unassigned_reasons = {}
+    for i, result in enumerate(chosen):
+        if result is None:
+            key = profile_keys[i]
+            if not language_known[key]:
+                unassigned_reasons[i] = f"No guide speaks {requests[i].language}"
+            elif len(profiles[key][0]) == 0:
+                unassigned_reasons[i] = f"No guide speaking {requests[i].language} works on {WEEKDAYS[key[1]].title()}s"
+            else:
+                unassigned_reasons[i] = "Every matching guide is fully booked that day"
+    logger.debug("Assigned %d of %d requests over %d profiles in %.0f ms", len(requests) - len(unassigned_reasons),
+                 len(requests), len(profiles), (time.perf_counter() - started) * 1000)
+    return chosen, unassigned_reasons
+
+
+_matrix: Optional[GuideMatrix] = None
+_build_lock = threading.Lock()
+
+
+def matrix_for(table) -> GuideMatrix:
+    """
+    The guide arrays for a tour_guides table, built once per table
+    (blocking; call off the event loop).
+    """
+    global _matrix
+    with _build_lock:
+        if _matrix is None or _matrix.table is not table:
+            started = time.perf_counter()
+            _matrix = GuideMatrix(table)
+            logger.info("Guide matrix built for %d guides in %.0f ms",
+                        len(_matrix), (time.perf_counter() - started) * 1000)
+        return _matrix
+
+
+def current() -> Optional[GuideMatrix]:
+    """
+    The last built guide matrix (None before the first build).
+    """
+    return _matrix
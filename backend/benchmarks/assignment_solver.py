@@ -0,0 +1,100 @@
+"""
+Time the guide assignment solver on a large synthetic catalog.
+
+    python benchmarks/assignment_solver.py --guides 20000 --requests 5000 --days 7
+
+Guides and requests are drawn with skewed languages and specializations, so
+some profiles are scarce and others plentiful. Reports the time to build the
+guide arrays, the time to solve, how many requests were placed and how many
+placed requests got a guide of the wanted specialization.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+# Add parent directory to path to import the backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import assignment
+import catalog
+
+LANGUAGES = ["English", "Spanish", "French", "German", "Italian", "Japanese", "Mandarin", "Arabic", "Portuguese", "Korean"]
+# Earlier entries are more common
+LANGUAGE_WEIGHTS = [40, 20, 12, 8, 6, 4, 4, 3, 2, 1]
+SPECIALIZATIONS = ["Historical Tours", "Food Tours", "Nature Tours", "Art Tours", "Adventure Tours",
+                   "Architecture Tours", "Night Tours", "Wine Tours"]
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+
+def synthetic_guides(count, rng):
+    return [
+        {
+            "id": f"tg-{i:06d}",
+            "name": f"Guide {i}",
+            "age": rng.randrange(20, 70),
+            "languages": list({*rng.choices(LANGUAGES, LANGUAGE_WEIGHTS, k=rng.randrange(1, 4))}),
+            "specialization": rng.choice(SPECIALIZATIONS),
+            "experience_years": rng.randrange(0, 30),
+            "bio": "",
+            "contact": {"email": f"guide{i}@example.com", "phone": "+1 555 0100"},
+            "availability": {"days": rng.sample(DAYS, rng.randrange(2, 6)), "hours": "9:00-17:00"},
+            "certifications": [],
+            "profile_image": "",
+            "rating": round(rng.uniform(3, 5), 1),
+            "tours_conducted": rng.randrange(500),
+            "created_at": "2024-01-01T00:00:00",
+            "updated_at": "2024-01-01T00:00:00",
+        }
+        for i in range(count)
+    ]
+
+
+def synthetic_requests(count, days, rng):
+    start = date(2025, 6, 2)
+    return [
+        assignment.TourRequest(
+            start + timedelta(days=rng.randrange(days)),
+            rng.choices(LANGUAGES, LANGUAGE_WEIGHTS)[0],
+            rng.choice(SPECIALIZATIONS + [None]),
+            rng.randrange(1, 30),
+        )
+        for _ in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--guides", type=int, default=20000)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--days", type=int, default=7, help="Days the requests are spread over")
+    parser.add_argument("--capacity", type=int, default=assignment.default_daily_capacity)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    table = catalog.build_catalog({"tour_guides": synthetic_guides(args.guides, rng)}).tour_guides
+    requests = synthetic_requests(args.requests, args.days, rng)
+
+    started = time.perf_counter()
+    matrix = assignment.matrix_for(table)
+    built = time.perf_counter() - started
+
+    started = time.perf_counter()
+    chosen, reasons = assignment.assign(matrix, requests, args.capacity)
+    solved = time.perf_counter() - started
+
+    placed = [result for result in chosen if result is not None]
+    matched = sum(1 for result in placed if result[2])
+    print(f"guides:       {args.guides:,} ({len(matrix.language_codes)} languages)")
+    print(f"requests:     {args.requests:,} over {args.days} days, capacity {args.capacity}/guide/day")
+    print(f"build:        {built * 1000:,.0f} ms")
+    print(f"solve:        {solved * 1000:,.0f} ms")
+    print(f"assigned:     {len(placed):,} ({len(reasons):,} unassigned)")
+    print(f"specialty:    {matched:,} of the assigned got a guide of the wanted specialization")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Measure booking throughput of the booking engine and check that capacity is
+never exceeded, with one or more worker processes sharing one booking log.
+
+    python benchmarks/bookings_throughput.py --bookings 20000 --concurrency 200
+    python benchmarks/bookings_throughput.py --workers 4 --no-fsync
+
+Each booking is a hold followed by a confirm (two logged operations). Tours
+have little capacity so many requests are turned away, and the log is
+replayed at the end to verify that no tour date was oversold.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+# Add parent directory to path to import the backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bookings
+
+
+async def run_worker(path, args, seed):
+    engine = bookings.BookingEngine(path, fsync=args.fsync)
+    await engine.open()
+    rng = random.Random(seed)
+    first_day = date.today() + timedelta(days=1)
+    counts = {"booked": 0, "full": 0}
+    queue = asyncio.Queue()
+    for _ in range(args.bookings // args.workers):
+        queue.put_nowait((
+            f"tour-{rng.randrange(args.tours):04d}",
+            first_day + timedelta(days=rng.randrange(args.days)),
+            rng.randint(1, 4),
+        ))
+
+    async def client():
+        while not queue.empty():
+            tour_id, day, seats = queue.get_nowait()
+            try:
+                booking = await engine.reserve(tour_id, day, seats, args.capacity)
+                await engine.confirm(booking.id)
+                counts["booked"] += 1
+            except bookings.BookingConflict:
+                counts["full"] += 1
+
+    await asyncio.gather(*(client() for _ in range(args.concurrency)))
+    await engine.close()
+    return counts
+
+
+def worker_main(path, args, seed, results):
+    results.put(asyncio.run(run_worker(path, args, seed)))
+
+
+async def verify(path):
+    engine = bookings.BookingEngine(path)
+    await engine.open()
+    worst = max((held + confirmed for days in engine.counters.values() for held, confirmed in days.values()),
+                default=0)
+    await engine.close()
+    return len(engine.bookings), worst
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--bookings", type=int, default=20_000, help="Booking attempts in total")
+    parser.add_argument("--concurrency", type=int, default=200, help="Concurrent clients per worker")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes sharing the log")
+    parser.add_argument("--tours", type=int, default=50)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--capacity", type=int, default=12)
+    parser.add_argument("--no-fsync", dest="fsync", action="store_false")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bookings.log")
+        started = time.perf_counter()
+        if args.workers == 1:
+            results = [asyncio.run(run_worker(path, args, args.seed))]
+        else:
+            queue = multiprocessing.Queue()
+            processes = [
+                multiprocessing.Process(target=worker_main, args=(path, args, args.seed + i, queue))
+                for i in range(args.workers)
+            ]
+            for process in processes:
+                process.start()
+            results = [queue.get() for _ in processes]
+            for process in processes:
+                process.join()
+        wall = time.perf_counter() - started
+        stored, worst = asyncio.run(verify(path))
+        log_bytes = os.path.getsize(path)
+
+    booked = sum(counts["booked"] for counts in results)
+    full = sum(counts["full"] for counts in results)
+    print(f"workers:                {args.workers} x {args.concurrency} clients (fsync {'on' if args.fsync else 'off'})")
+    print(f"attempts:               {booked + full:,} ({booked:,} booked, {full:,} full)")
+    print(f"throughput:             {(booked + full) / wall:,.0f} attempts/s, {booked / wall:,.0f} bookings/s")
+    print(f"log:                    {stored:,} bookings, {log_bytes / 1e6:.1f} MB")
+    print(f"fullest tour date:      {worst} of {args.capacity} places")
+    if worst > args.capacity:
+        print("OVERSOLD")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Compare the memory used by the catalog's columnar tables with the plain
+list-of-dicts representation produced by json.load.
+
+    python benchmarks/catalog_memory.py --count 1000000
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+# Add parent directory to path to import the backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import catalog
+
+REGIONS = {
+    "Europe": ["Western Europe", "Southern Europe", "Northern Europe", "Eastern Europe"],
+    "Asia": ["Eastern Asia", "South-Eastern Asia", "Southern Asia", "Western Asia"],
+    "Americas": ["North America", "South America", "Caribbean", "Central America"],
+    "Africa": ["Northern Africa", "Western Africa", "Eastern Africa", "Southern Africa"],
+    "Oceania": ["Australia and New Zealand", "Polynesia", "Melanesia", "Micronesia"],
+}
+LANGUAGES = ["English", "French", "Spanish", "German", "Japanese", "Mandarin", "Arabic", "Portuguese", "Hindi", "Swahili"]
+CURRENCIES = ["Euro", "United States Dollar", "Japanese Yen", "Pound Sterling", "Indian Rupee", "Brazilian Real"]
+TIMEZONES = [f"UTC{sign}{hour:02d}:00" for sign in "+-" for hour in range(13)]
+
+
+def synthetic_destination(i, rng, base_time):
+    region = rng.choice(list(REGIONS))
+    stamp = (base_time + timedelta(seconds=rng.randrange(86400 * 365))).isoformat()
+    return {
+        "id": f"dest-{i:07d}",
+        "name": f"Destination {i}",
+        "capital": f"Capital City {i}",
+        "region": region,
+        "subregion": rng.choice(REGIONS[region]),
+        "population": rng.randrange(10_000, 300_000_000),
+        "languages": rng.sample(LANGUAGES, rng.randint(1, 3)),
+        "currencies": rng.sample(CURRENCIES, 1),
+        "flag": f"https://flagcdn.com/w320/{i:07d}.png",
+        "coordinates": [round(rng.uniform(-90, 90), 4), round(rng.uniform(-180, 180), 4)],
+        "timezones": rng.sample(TIMEZONES, rng.randint(1, 4)),
+        "created_at": stamp,
+        "updated_at": stamp,
+    }
+
+
+def traced():
+    gc.collect()
+    return tracemalloc.get_traced_memory()[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    base_time = datetime(2025, 1, 1)
+    tracemalloc.start()
+
+    # Round-trip each record through JSON so strings aren't shared, as with json.load
+    before = traced()
+    records = [
+        json.loads(json.dumps(synthetic_destination(i, rng, base_time)))
+        for i in range(args.count)
+    ]
+    dict_bytes = traced() - before
+
+    before = traced()
+    started = time.perf_counter()
+    table = catalog.Table.from_records("destinations", catalog.DESTINATION_SCHEMA, records, {})
+    build_seconds = time.perf_counter() - started
+    table_bytes = traced() - before
+
+    # Responses must be unchanged by the columnar encoding
+    for i in rng.sample(range(args.count), min(1000, args.count)):
+        assert table.to_dict(i) == records[i], records[i]["id"]
+
+    tracemalloc.stop()
+    print(f"records:           {args.count:,}")
+    print(f"list of dicts:     {dict_bytes / 2**20:,.1f} MiB ({dict_bytes / args.count:,.0f} B/record)")
+    print(f"columnar table:    {table_bytes / 2**20:,.1f} MiB ({table_bytes / args.count:,.0f} B/record)")
+    print(f"reduction:         {dict_bytes / table_bytes:.1f}x")
+    print(f"build time:        {build_seconds:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Stream a large synthetic catalog through GET /export/{entity} over HTTP and
+track the server's memory while it runs.
+
+    python benchmarks/export_stream.py --rows 1000000 --format csv --gzip
+
+The API runs with uvicorn in a background thread of this process; the client
+reads the response in chunks and discards them, so resident memory growth
+during the export is the export's own.
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+# Add parent directory to path to import the backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Rate limits and load shedding aren't what is measured here
+os.environ.setdefault("ADMISSION_ENABLED", "0")
+
+import httpx
+import uvicorn
+
+import catalog
+import main as api
+
+WORDS = ["river", "old town", "market", "castle", "harbour", "wine", "street food", "museum", "sunset", "hills"]
+LANGUAGES = ["English", "Spanish", "French", "German", "Italian", "Japanese"]
+
+
+def rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def synthetic_tours(rows, rng):
+    return [
+        {
+            "id": f"tour-{i:07d}",
+            "name": f"{rng.choice(WORDS).title()} {rng.choice(WORDS)} tour",
+            "description": " ".join(rng.choice(WORDS) for _ in range(12)),
+            "duration_hours": rng.choice([2.0, 3.0, 4.0, 6.0]),
+            "price": round(rng.uniform(20, 300), 2),
+            "location": f"City {rng.randrange(2000)}",
+            "max_participants": rng.randrange(5, 40),
+            "guide_id": f"tg-{rng.randrange(5000):04d}",
+            "rating": round(rng.uniform(3, 5), 1),
+            "languages": rng.sample(LANGUAGES, 2),
+            "includes": ["Guide"],
+            "meeting_point": "Main square",
+            "created_at": "2024-01-01T00:00:00",
+            "updated_at": "2024-01-01T00:00:00",
+        }
+        for i in range(rows)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--format", choices=["ndjson", "csv"], default="ndjson")
+    parser.add_argument("--gzip", action="store_true", help="Ask for a gzip-compressed stream")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    records = synthetic_tours(args.rows, rng)
+    catalog._current = catalog.build_catalog({"tours": records})
+    del records
+
+    server = uvicorn.Server(uvicorn.Config(api.app, host="127.0.0.1", port=0, log_level="warning", lifespan="off"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+
+    headers = {"Accept-Encoding": "gzip" if args.gzip else "identity"}
+    before = rss_mb()
+    peak = before
+    received = 0
+    started = time.perf_counter()
+    with httpx.stream("GET", f"http://127.0.0.1:{port}/export/tours", params={"format": args.format},
+                      headers=headers, timeout=None) as response:
+        response.raise_for_status()
+        for chunk in response.iter_raw():
+            received += len(chunk)
+            peak = max(peak, rss_mb())
+    elapsed = time.perf_counter() - started
+    server.should_exit = True
+    thread.join(timeout=5)
+
+    print(f"rows:         {args.rows:,} ({args.format}{', gzip' if args.gzip else ''})")
+    print(f"streamed:     {received / 1e6:,.1f} MB in {elapsed:.1f} s ({args.rows / elapsed:,.0f} rows/s)")
+    print(f"rss:          {before:,.0f} MB before, {peak:,.0f} MB peak (+{peak - before:,.0f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Compare catalog startup from indented JSON with memory-mapping a compiled
+binary snapshot.
+
+    python benchmarks/snapshot_startup.py --count 200000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+# Add parent directory to path to import the backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import catalog
+import snapshot
+from catalog_memory import synthetic_destination
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=200_000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    base_time = datetime(2025, 1, 1)
+    records = [synthetic_destination(i, rng, base_time) for i in range(args.count)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = os.path.join(tmp, "destinations.json")
+        with open(json_path, "w") as f:
+            json.dump(records, f, indent=2)
+        del records
+
+        started = time.perf_counter()
+        with open(json_path, "r") as f:
+            loaded = json.load(f)
+        built = catalog.build_catalog({"destinations": loaded})
+        json_seconds = time.perf_counter() - started
+        del loaded
+
+        snapshot_path = os.path.join(tmp, "catalog.snapshot")
+        snapshot.compile_snapshot(built, snapshot_path)
+
+        timings = {}
+        for verify in ("header", "full"):
+            started = time.perf_counter()
+            mapped = snapshot.load_snapshot(snapshot_path, verify=verify)
+            timings[verify] = time.perf_counter() - started
+            row = mapped.destinations.get(f"dest-{args.count // 2:07d}")
+            assert row is not None and row.to_dict() == built.destinations.get(row["id"]).to_dict()
+            mapped.mapping = None
+            del mapped, row
+
+        print(f"records:                {args.count:,}")
+        print(f"json.load + build:      {json_seconds * 1000:,.1f} ms")
+        print(f"mmap (header checks):   {timings['header'] * 1000:,.1f} ms")
+        print(f"mmap (full checksum):   {timings['full'] * 1000:,.1f} ms")
+        print(f"snapshot size:          {os.path.getsize(snapshot_path) / 2**20:,.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
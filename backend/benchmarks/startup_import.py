@@ -0,0 +1,92 @@
+"""
+Measure how long importing the API application takes, which bounds how
+quickly a new container can answer health checks.
+
+    python benchmarks/startup_import.py --runs 5 [--max-ms 800] [--max-app-ms 250] [--json results.json]
+
+Most of the total is FastAPI, Starlette and pydantic themselves, which no
+change here can defer; the "app" figure is the total minus those packages
+and tracks what this code base adds. Exits with status 1 when a median
+exceeds --max-ms (total) or --max-app-ms (app), so it can gate CI.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Imported by main.py before any application module
+FRAMEWORK_PACKAGES = ("fastapi", "starlette", "pydantic")
+
+
+def import_once():
+    # -X importtime writes "import time: self | cumulative | name" to stderr
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=backend_dir, capture_output=True, text=True, check=True,
+    )
+    modules = {}
+    framework = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if not parts[0].strip().isdigit():
+            continue
+        name = parts[2].strip()
+        cumulative = int(parts[1])
+        modules[name] = (int(parts[0]), cumulative)
+        # Direct imports of main are indented by two spaces (one level)
+        depth = (len(parts[2]) - len(parts[2].lstrip()) - 1) // 2
+        if depth == 1 and name.split(".")[0] in FRAMEWORK_PACKAGES:
+            framework += cumulative
+    return modules, framework
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-ms", type=float, default=None)
+    parser.add_argument("--max-app-ms", type=float, default=None)
+    parser.add_argument("--json", dest="json_path", default=None)
+    args = parser.parse_args()
+
+    results = [import_once() for _ in range(args.runs)]
+    runs = [modules for modules, _ in results]
+    totals = [modules["main"][1] / 1000 for modules in runs]
+    apps = [(modules["main"][1] - framework) / 1000 for modules, framework in results]
+    median = statistics.median(totals)
+    app_median = statistics.median(apps)
+
+    # Slowest modules by cumulative time in the median run
+    median_run = runs[totals.index(sorted(totals)[len(totals) // 2])]
+    slowest = sorted(
+        ((name, cumulative / 1000) for name, (_, cumulative) in median_run.items() if name != "main"),
+        key=lambda item: item[1], reverse=True,
+    )[:10]
+
+    print(f"import main: median {median:.1f} ms over {args.runs} runs (min {min(totals):.1f}, max {max(totals):.1f})")
+    print(f"  without {', '.join(FRAMEWORK_PACKAGES)}: median {app_median:.1f} ms")
+    for name, ms in slowest:
+        print(f"  {ms:8.1f} ms  {name}")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"median_ms": median, "runs_ms": totals, "app_median_ms": app_median, "app_runs_ms": apps, "slowest": slowest}, f, indent=2)
+
+    failed = False
+    if args.max_ms is not None and median > args.max_ms:
+        print(f"FAIL: median import time {median:.1f} ms exceeds {args.max_ms:.1f} ms")
+        failed = True
+    if args.max_app_ms is not None and app_median > args.max_app_ms:
+        print(f"FAIL: median app import time {app_median:.1f} ms exceeds {args.max_app_ms:.1f} ms")
+        failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
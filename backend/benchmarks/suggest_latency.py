@@ -0,0 +1,91 @@
+"""
+Build the suggestion index over a synthetic catalog and measure per-keystroke
+lookup latency.
+
+    python benchmarks/suggest_latency.py --strings 1000000
+
+Names are made of random syllables so prefixes have realistic fan-out; the
+queries type out real names one character at a time.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+# Add parent directory to path to import the backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import catalog
+import suggestions
+
+SYLLABLES = ["ba", "ri", "lo", "ma", "ne", "to", "sa", "ki", "po", "lu", "vi", "da", "ge", "an", "or", "el",
+             "mon", "san", "ber", "cas", "tel", "port", "vil", "la", "do", "ra", "zu", "shi", "ko", "ny"]
+SPECIALIZATIONS = ["History", "Food & Wine", "Adventure", "Art & Culture", "Nature", "Architecture", "Nightlife"]
+
+
+def word(rng):
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize()
+
+
+def phrase(rng, words):
+    return " ".join(word(rng) for _ in range(words))
+
+
+def synthetic_catalog(strings, rng):
+    # Every entity indexes two strings; split them 3:6:1 between the types
+    count = strings // 2
+    destinations = [
+        {"id": f"dest-{i:07d}", "name": phrase(rng, rng.randint(1, 2)), "capital": phrase(rng, 1),
+         "population": rng.randrange(10**3, 10**9)}
+        for i in range(count * 3 // 10)
+    ]
+    places = [f"{d['capital']}, {d['name']}" for d in destinations[:5000]]
+    tours = [
+        {"id": f"tour-{i:07d}", "name": f"{phrase(rng, rng.randint(2, 4))} Tour", "location": rng.choice(places),
+         "rating": round(rng.uniform(3, 5), 1)}
+        for i in range(count * 6 // 10)
+    ]
+    guides = [
+        {"id": f"guide-{i:07d}", "name": phrase(rng, 2), "specialization": rng.choice(SPECIALIZATIONS),
+         "rating": round(rng.uniform(3, 5), 1), "tours_conducted": rng.randrange(1000)}
+        for i in range(count // 10)
+    ]
+    return catalog.build_catalog({"destinations": destinations, "tours": tours, "tour_guides": guides})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--strings", type=int, default=1_000_000, help="Indexed strings in total")
+    parser.add_argument("--queries", type=int, default=2000, help="Names typed out")
+    parser.add_argument("--limit", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    snapshot = synthetic_catalog(args.strings, rng)
+    started = time.perf_counter()
+    index = suggestions.index_for(snapshot)
+    build = time.perf_counter() - started
+    strings = sum(len(prefix_index.rows) for prefix_index in index.indexes.values())
+
+    names = [row["name"] for table in snapshot.tables.values() for row in table]
+    timings = {}
+    for name in rng.sample(names, min(args.queries, len(names))):
+        for length in range(1, min(len(name), 8) + 1):
+            started = time.perf_counter()
+            index.suggest(name[:length], limit=args.limit)
+            timings.setdefault(length, []).append(time.perf_counter() - started)
+
+    every = sorted(t for values in timings.values() for t in values)
+    print(f"indexed:      {strings:,} strings, {len(index):,} keys")
+    print(f"build:        {build:.1f} s")
+    print(f"lookups:      {len(every):,}, p50 {every[len(every) // 2] * 1e6:.0f} us, "
+          f"p99 {every[int(len(every) * 0.99)] * 1e6:.0f} us, max {every[-1] * 1e6:.0f} us")
+    for length, values in sorted(timings.items()):
+        print(f"  {length} chars:    mean {statistics.mean(values) * 1e6:.0f} us")
+
+
+if __name__ == "__main__":
+    main()
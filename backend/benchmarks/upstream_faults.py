@@ -0,0 +1,98 @@
+"""
+Measure how the weather endpoint behaves when Open-Meteo is slow, flaky or
+rate limiting, against the local upstream simulator.
+
+    python benchmarks/upstream_faults.py --latency-ms 300 --latency-distribution lognormal
+    python benchmarks/upstream_faults.py --error-rate 0.3 --rate-limit-rps 20 --waves 10
+
+The API runs in-process; the simulator runs on a local port in a background
+thread. Each wave clears the weather cache and sends --concurrency requests
+for random destinations at once, so every wave goes upstream again. Reports
+the API's status codes and latency, how many responses were stale, and what
+the simulator saw. The API's admission control is off unless --admission is
+given.
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from collections import Counter
+
+# Add parent directory to path to import the backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The API's own admission control is off unless --admission is given, so the
+# numbers show the upstream behaviour (read when the app is imported)
+if "--admission" not in sys.argv:
+    os.environ["ADMISSION_ENABLED"] = "0"
+
+import httpx
+
+import catalog
+import main as api
+import upstream_sim
+from routers import destinations
+
+
+async def run(args):
+    destination_ids = [row["id"] for row in (await catalog.get_catalog()).destinations if row.get("coordinates")]
+    rng = random.Random(args.seed)
+    statuses = Counter()
+    latencies = []
+    stale = 0
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://api", timeout=60) as client:
+
+        async def one():
+            nonlocal stale
+            started = time.perf_counter()
+            response = await client.get(f"/destinations/{rng.choice(destination_ids)}/weather")
+            latencies.append(time.perf_counter() - started)
+            statuses[response.status_code] += 1
+            if response.status_code == 200 and response.json().get("stale"):
+                stale += 1
+
+        for _ in range(args.waves):
+            destinations.cache.clear()
+            await asyncio.gather(*(one() for _ in range(args.concurrency)))
+    return statuses, latencies, stale
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--waves", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=50, help="API requests per wave")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--admission", action="store_true", help="Keep the API's admission control on")
+    for name, field in upstream_sim.Faults.model_fields.items():
+        if name == "seed":
+            continue
+        option = "--" + name.replace("_", "-")
+        if name == "latency_distribution":
+            parser.add_argument(option, default=field.default)
+        else:
+            parser.add_argument(option, type=field.annotation, default=field.default)
+    args = parser.parse_args()
+    faults = upstream_sim.Faults(**{name: getattr(args, name) for name in upstream_sim.Faults.model_fields})
+
+    with upstream_sim.serve(faults) as url, upstream_sim.attach(url):
+        started = time.perf_counter()
+        statuses, latencies, stale = asyncio.run(run(args))
+        wall = time.perf_counter() - started
+        sim = upstream_sim.simulator.stats()
+
+    latencies.sort()
+    print(f"faults:              {faults.model_dump(exclude_defaults=True)}")
+    print(f"api requests:        {len(latencies):,} in {wall:.1f} s, statuses {dict(sorted(statuses.items()))}")
+    print(f"api latency:         p50 {latencies[len(latencies) // 2] * 1000:.0f} ms, "
+          f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:.0f} ms, max {latencies[-1] * 1000:.0f} ms, "
+          f"mean {statistics.mean(latencies) * 1000:.0f} ms")
+    print(f"stale responses:     {stale:,}")
+    print(f"upstream requests:   {sim['requests']:,}, statuses {sim['statuses']}, peak concurrency {sim['peak_in_flight']}")
+
+
+if __name__ == "__main__":
+    main()
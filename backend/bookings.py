@@ -0,0 +1,693 @@
+"""
+Tour bookings with per-tour, per-date capacity.
+
+Capacity is tracked with in-memory counters (seats held and confirmed per
+tour and day). All state changes happen on the event loop, so checking and
+updating a counter is atomic without locks; requests only wait for their
+change to reach disk.
+
+Changes are persisted in an append-only log (``data/bookings.log``, one JSON
+record per line) with group commit: operations queue up while the previous
+batch is being written, and each batch is validated, appended with a single
+write and fsynced before any of its requests are answered. Workers share the
+log: a writer takes a file lock, applies records other workers appended since
+it last looked, validates its batch against the up-to-date counters
+(optimistic concurrency: a hold that no longer fits is rejected, never
+oversold), and appends. Between writes, workers catch up with the log every
+``BOOKINGS_SYNC_SECONDS``. A torn last line left by a crash is ignored on
+replay and truncated by the next writer.
+
+Holds expire after ``BOOKINGS_HOLD_SECONDS`` unless confirmed; expiries are
+driven by a timer wheel. Creating a booking with an idempotency key returns
+the original booking when the request is retried.
+"""
+import asyncio
+import json
+import logging
+import math
+import os
+import time
+import uuid
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, status
+
+import catalog
+import metrics
+from loop_monitor import run_blocking
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single worker owns the log
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+log_path = os.environ.get("BOOKINGS_LOG", os.path.join(catalog.data_dir, "bookings.log"))
+
+# How long an unconfirmed hold keeps its seats
+hold_seconds = float(os.environ.get("BOOKINGS_HOLD_SECONDS", 600))
+
+# fsync every batch (disable only for benchmarks and tests)
+fsync_enabled = os.environ.get("BOOKINGS_FSYNC", "1").lower() not in ("0", "false", "no")
+
+# Largest number of operations written in one batch
+batch_max = int(os.environ.get("BOOKINGS_BATCH_MAX", 1024))
+
+# How often workers apply records appended by other workers and expire holds
+sync_interval = float(os.environ.get("BOOKINGS_SYNC_SECONDS", 1.0))
+
+# The log is rewritten with only current bookings once it grows past this;
+# cancelled and expired bookings are kept for BOOKINGS_RETENTION_DAYS so
+# retried requests still find them
+compact_bytes = int(os.environ.get("BOOKINGS_COMPACT_BYTES", 64 * 1024 * 1024))
+retention_days = float(os.environ.get("BOOKINGS_RETENTION_DAYS", 30))
+
+HELD, CONFIRMED, CANCELLED, EXPIRED = "held", "confirmed", "cancelled", "expired"
+
+BOOKING_OPERATIONS = metrics.registry.counter(
+    "tourease_booking_operations_total",
+    "Booking operations by type and result",
+    ["operation", "result"],
+)
+BOOKING_BATCH_SIZE = metrics.registry.histogram(
+    "tourease_booking_batch_size",
+    "Operations per booking log write",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000),
+)
+BOOKING_COMMIT_SECONDS = metrics.registry.histogram(
+    "tourease_booking_commit_seconds",
+    "Time to validate, write and fsync one batch of booking operations",
+)
+
+
+class BookingNotFound(HTTPException):
+    def __init__(self, booking_id: str):
+        super().__init__(status_code=status.HTTP_404_NOT_FOUND, detail=f"Booking {booking_id} not found")
+
+
+class BookingConflict(HTTPException):
+    """
+    409 for a booking that doesn't fit or can't change state.
+    """
+
+    def __init__(self, detail: str):
+        super().__init__(status_code=status.HTTP_409_CONFLICT, detail=detail)
+
+
+class IdempotencyMismatch(HTTPException):
+    def __init__(self, key: str):
+        super().__init__(
+            status_code=status.HTTP_422_UNPROCESSABLE_CONTENT,
+            detail=f"Idempotency key {key} was used for a different booking",
+        )
+
+
+class Booking:
+    __slots__ = (
+        "id", "tour_id", "day", "seats", "status", "expires_at",
+        "created_at", "updated_at", "idempotency_key", "customer",
+    )
+
+    def __init__(self, id, tour_id, day, seats, status, expires_at, created_at, updated_at,
+                 idempotency_key=None, customer=None):
+        self.id = id
+        self.tour_id = tour_id
+        self.day = day
+        self.seats = seats
+        self.status = status
+        self.expires_at = expires_at
+        self.created_at = created_at
+        self.updated_at = updated_at
+        self.idempotency_key = idempotency_key
+        self.customer = customer or {}
+
+    @property
+    def fingerprint(self) -> tuple:
+        return (self.tour_id, self.day, self.seats)
+
+    def to_record(self) -> dict:
+        return {
+            "op": "booking", "id": self.id, "tour_id": self.tour_id, "date": date.fromordinal(self.day).isoformat(),
+            "seats": self.seats, "status": self.status, "expires_at": self.expires_at,
+            "created_at": self.created_at, "updated_at": self.updated_at,
+            "key": self.idempotency_key, "customer": self.customer,
+        }
+
+    def to_dict(self) -> dict:
+        result = {
+            "id": self.id,
+            "tour_id": self.tour_id,
+            "date": date.fromordinal(self.day).isoformat(),
+            "participants": self.seats,
+            "status": self.status,
+            **self.customer,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+        if self.status == HELD:
+            result["expires_at"] = datetime.fromtimestamp(self.expires_at).isoformat()
+        return result
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel: deadlines are bucketed by ``tick`` into ``slots``
+    buckets, and advancing only visits the buckets that came due. Deadlines
+    more than one rotation away stay in their bucket until their turn.
+    """
+
+    def __init__(self, tick: float = 1.0, slots: int = 4096):
+        self.tick = tick
+        self.slots = slots
+        self._buckets: List[Dict[str, float]] = [{} for _ in range(slots)]
+        self._where: Dict[str, int] = {}
+        # Last tick that was advanced past
+        self._current: Optional[int] = None
+
+    def __len__(self):
+        return len(self._where)
+
+    def add(self, key: str, deadline: float):
+        self.discard(key)
+        tick = math.floor(deadline / self.tick)
+        if self._current is not None and tick <= self._current:
+            tick = self._current + 1
+        slot = tick % self.slots
+        self._buckets[slot][key] = deadline
+        self._where[key] = slot
+
+    def discard(self, key: str):
+        slot = self._where.pop(key, None)
+        if slot is not None:
+            self._buckets[slot].pop(key, None)
+
+    def advance(self, now: float) -> List[str]:
+        """
+        Remove and return the keys whose deadline is at or before ``now``.
+        """
+        # Only ticks that have fully passed, so no bucket is left behind with
+        # deadlines still to come this rotation
+        target = math.floor(now / self.tick) - 1
+        first = target - self.slots + 1 if self._current is None else self._current + 1
+        first = max(first, target - self.slots + 1)
+        due = []
+        for tick in range(first, target + 1):
+            bucket = self._buckets[tick % self.slots]
+            if not bucket:
+                continue
+            for key, deadline in list(bucket.items()):
+                if deadline <= now:
+                    del bucket[key]
+                    del self._where[key]
+                    due.append(key)
+        self._current = target if self._current is None else max(target, self._current)
+        return due
+
+
+class _Operation:
+    __slots__ = ("kind", "booking", "booking_id", "capacity", "future")
+
+    def __init__(self, kind, booking=None, booking_id=None, capacity=0, future=None):
+        self.kind = kind
+        self.booking = booking
+        self.booking_id = booking_id if booking is None else booking.id
+        self.capacity = capacity
+        self.future = future
+
+
+class BookingEngine:
+    """
+    Bookings and capacity counters for one worker, persisted in ``path``.
+    """
+
+    def __init__(self, path: str = log_path, hold_seconds: float = hold_seconds,
+                 fsync: bool = fsync_enabled, batch_max: int = batch_max,
+                 sync_interval: float = sync_interval):
+        self.path = path
+        self.hold_seconds = hold_seconds
+        self.fsync = fsync
+        self.batch_max = batch_max
+        self.sync_interval = sync_interval
+        self.bookings: Dict[str, Booking] = {}
+        self.by_key: Dict[str, str] = {}
+        # tour id -> day ordinal -> [seats held, seats confirmed]
+        self.counters: Dict[str, Dict[int, List[int]]] = defaultdict(dict)
+        self.wheel = TimerWheel()
+        self._pending: List[_Operation] = []
+        self._inflight_keys: Dict[str, Tuple[tuple, asyncio.Future]] = {}
+        self._fd: Optional[int] = None
+        self._offset = 0
+        self._io_lock: Optional[asyncio.Lock] = None
+        self._open_lock: Optional[asyncio.Lock] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+
+    # Log I/O (blocking; runs in the executor)
+
+    def _open_file(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        if self._fd is not None:
+            os.close(self._fd)
+        self._fd = os.open(self.path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        self._offset = 0
+
+    def _replaced(self) -> bool:
+        # The log was compacted by another worker
+        try:
+            return os.stat(self.path).st_ino != os.fstat(self._fd).st_ino
+        except FileNotFoundError:
+            return True
+
+    def _read_new(self, truncate_torn=False) -> Tuple[bool, List[bytes]]:
+        """
+        Complete lines appended since the last read, and whether the log was
+        replaced (the lines then start from the beginning).
+        """
+        reset = self._replaced()
+        if reset:
+            self._open_file()
+        size = os.fstat(self._fd).st_size
+        data = os.pread(self._fd, size - self._offset, self._offset) if size > self._offset else b""
+        end = data.rfind(b"\n") + 1
+        if truncate_torn and end < len(data):
+            # Only possible after a crash mid-write: we hold the lock
+            logger.warning("Truncating %d bytes of a torn booking log record", len(data) - end)
+            os.ftruncate(self._fd, self._offset + end)
+        self._offset += end
+        return reset, data[:end].splitlines()
+
+    def _lock_and_read(self) -> Tuple[bool, List[bytes]]:
+        if self._fd is None or self._replaced():
+            self._open_file()
+        if fcntl is not None:
+            while True:
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+                # Compaction may have replaced the file while we waited
+                if not self._replaced():
+                    break
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+                self._open_file()
+        try:
+            return self._read_new(truncate_torn=True)
+        except BaseException:
+            self._unlock()
+            raise
+
+    def _append(self, lines: List[bytes]):
+        data = b"".join(lines)
+        written = 0
+        try:
+            while written < len(data):
+                written += os.write(self._fd, data[written:])
+            if self.fsync:
+                os.fsync(self._fd)
+        except OSError:
+            # Callers are told the batch failed, so none of it may remain
+            if written:
+                os.ftruncate(self._fd, self._offset)
+            raise
+        self._offset += len(data)
+
+    def _unlock(self):
+        if fcntl is not None and self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _compact(self, records: List[bytes]):
+        # Write the current bookings to a new file and swap it in; other
+        # workers notice the new inode and replay it
+        tmp_path = f"{self.path}.tmp-{os.getpid()}"
+        with open(tmp_path, "wb") as f:
+            f.writelines(records)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        old_fd = self._fd
+        self._fd = os.open(self.path, os.O_RDWR | os.O_APPEND)
+        self._offset = os.fstat(self._fd).st_size
+        if fcntl is not None:
+            fcntl.flock(old_fd, fcntl.LOCK_UN)
+        os.close(old_fd)
+
+    # State (event loop only)
+
+    def _reset(self):
+        self.bookings.clear()
+        self.by_key.clear()
+        self.counters.clear()
+        self.wheel = TimerWheel()
+
+    def _count(self, booking: Booking, sign: int):
+        if booking.status not in (HELD, CONFIRMED):
+            return
+        counter = self.counters[booking.tour_id].setdefault(booking.day, [0, 0])
+        counter[0 if booking.status == HELD else 1] += sign * booking.seats
+
+    def _set_status(self, booking: Booking, new_status: str, at: str):
+        self._count(booking, -1)
+        booking.status = new_status
+        booking.updated_at = at
+        self._count(booking, +1)
+        if new_status != HELD:
+            self.wheel.discard(booking.id)
+
+    def _apply(self, record: dict):
+        op = record.get("op")
+        if op == "booking":
+            previous = self.bookings.get(record["id"])
+            if previous is not None:
+                self._count(previous, -1)
+                self.wheel.discard(previous.id)
+            booking = Booking(
+                record["id"], record["tour_id"], date.fromisoformat(record["date"]).toordinal(),
+                record["seats"], record["status"], record.get("expires_at"),
+                record["created_at"], record["updated_at"], record.get("key"), record.get("customer"),
+            )
+            self.bookings[booking.id] = booking
+            if booking.idempotency_key:
+                self.by_key[booking.idempotency_key] = booking.id
+            self._count(booking, +1)
+            if booking.status == HELD:
+                self.wheel.add(booking.id, booking.expires_at)
+            return
+        booking = self.bookings.get(record.get("id"))
+        if booking is None:
+            return
+        if op == "confirm" and booking.status == HELD:
+            self._set_status(booking, CONFIRMED, record["at"])
+        elif op == "cancel" and booking.status in (HELD, CONFIRMED):
+            self._set_status(booking, CANCELLED, record["at"])
+        elif op == "expire" and booking.status == HELD:
+            self._set_status(booking, EXPIRED, record["at"])
+
+    def _apply_lines(self, reset: bool, lines: List[bytes]):
+        if reset:
+            self._reset()
+        for line in lines:
+            try:
+                self._apply(json.loads(line))
+            except (ValueError, KeyError, TypeError) as e:
+                logger.warning("Skipping unreadable booking log record: %s", e)
+
+    def used(self, tour_id: str, day: int) -> int:
+        counter = self.counters.get(tour_id, {}).get(day)
+        return counter[0] + counter[1] if counter else 0
+
+    def _validate(self, batch: List[_Operation]):
+        """
+        Check a batch against the current counters without changing them.
+        Returns the records to write and each operation's outcome.
+        """
+        now = time.time()
+        at = datetime.now().isoformat()
+        extra_seats: Dict[Tuple[str, int], int] = defaultdict(int)
+        # Status each booking will have once the batch is applied
+        statuses: Dict[str, str] = {}
+        records, outcomes = [], []
+        for op in batch:
+            if op.kind in ("hold", "book"):
+                booking = op.booking
+                key = booking.idempotency_key
+                existing_id = self.by_key.get(key) if key else None
+                if existing_id is not None:
+                    existing = self.bookings[existing_id]
+                    outcomes.append(existing if existing.fingerprint == booking.fingerprint
+                                    else IdempotencyMismatch(key))
+                    continue
+                slot = (booking.tour_id, booking.day)
+                if self.used(*slot) + extra_seats[slot] + booking.seats > op.capacity:
+                    outcomes.append(BookingConflict("Not enough places left on this date"))
+                    continue
+                extra_seats[slot] += booking.seats
+                booking.status = HELD if op.kind == "hold" else CONFIRMED
+                booking.expires_at = now + self.hold_seconds if op.kind == "hold" else None
+                booking.created_at = booking.updated_at = at
+                statuses[booking.id] = booking.status
+                records.append(booking.to_record())
+                outcomes.append(booking)
+                continue
+
+            booking = self.bookings.get(op.booking_id)
+            current = statuses.get(op.booking_id, booking.status if booking else None)
+            if booking is None:
+                outcomes.append(BookingNotFound(op.booking_id))
+                continue
+            if op.kind == "confirm":
+                if current == HELD and booking.expires_at > now:
+                    statuses[booking.id] = CONFIRMED
+                    records.append({"op": "confirm", "id": booking.id, "at": at})
+                elif current == HELD or current == EXPIRED:
+                    outcomes.append(BookingConflict("The hold on this booking has expired"))
+                    continue
+                elif current == CANCELLED:
+                    outcomes.append(BookingConflict("This booking was cancelled"))
+                    continue
+            elif op.kind == "cancel":
+                if current in (HELD, CONFIRMED):
+                    statuses[booking.id] = CANCELLED
+                    records.append({"op": "cancel", "id": booking.id, "at": at})
+            elif op.kind == "expire":
+                if current == HELD and booking.expires_at <= now:
+                    statuses[booking.id] = EXPIRED
+                    records.append({"op": "expire", "id": booking.id, "at": at})
+            outcomes.append(booking)
+        return records, outcomes
+
+    # Writer and background tasks
+
+    async def _commit(self, batch: List[_Operation]):
+        started = time.perf_counter()
+        async with self._io_lock:
+            try:
+                reset, lines = await run_blocking(self._lock_and_read)
+            except Exception as e:
+                self._fail(batch, e)
+                return
+            try:
+                self._apply_lines(reset, lines)
+                records, outcomes = self._validate(batch)
+                if records:
+                    encoded = [json.dumps(record, separators=(",", ":")).encode() + b"\n" for record in records]
+                    await run_blocking(self._append, encoded)
+                    for record in records:
+                        self._apply(record)
+            except Exception as e:
+                self._fail(batch, e)
+                return
+            finally:
+                await run_blocking(self._unlock)
+        BOOKING_BATCH_SIZE.observe(len(batch))
+        BOOKING_COMMIT_SECONDS.observe(time.perf_counter() - started)
+        for op, outcome in zip(batch, outcomes):
+            if isinstance(outcome, Booking):
+                # The caller gets the booking as stored
+                outcome = self.bookings.get(outcome.id, outcome)
+            result = "error" if isinstance(outcome, Exception) else "ok"
+            BOOKING_OPERATIONS.labels(op.kind, result).inc()
+            if op.future is not None and not op.future.done():
+                if isinstance(outcome, Exception):
+                    op.future.set_exception(outcome)
+                else:
+                    op.future.set_result(outcome)
+
+    def _fail(self, batch, error):
+        logger.error("Booking log write failed: %s", error)
+        for op in batch:
+            BOOKING_OPERATIONS.labels(op.kind, "error").inc()
+            if op.future is not None and not op.future.done():
+                op.future.set_exception(HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Bookings are temporarily unavailable",
+                    headers={"Retry-After": "1"},
+                ))
+
+    async def _writer(self):
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            # Operations queued while a batch is written go into the next one
+            while self._pending:
+                batch, self._pending = self._pending[:self.batch_max], self._pending[self.batch_max:]
+                await self._commit(batch)
+
+    async def _ticker(self):
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                await self.sync()
+                for booking_id in self.wheel.advance(time.time()):
+                    self._enqueue(_Operation("expire", booking_id=booking_id))
+                if os.fstat(self._fd).st_size > compact_bytes:
+                    await self.compact()
+            except Exception as e:
+                logger.error("Booking log maintenance failed: %s", e)
+
+    async def sync(self):
+        """
+        Apply records other workers appended since the last read.
+        """
+        async with self._io_lock:
+            reset, lines = await run_blocking(self._read_new)
+            self._apply_lines(reset, lines)
+
+    async def compact(self):
+        """
+        Rewrite the log with current bookings only.
+        """
+        async with self._io_lock:
+            reset, lines = await run_blocking(self._lock_and_read)
+            try:
+                self._apply_lines(reset, lines)
+                cutoff = datetime.fromtimestamp(time.time() - retention_days * 86400).isoformat()
+                kept = [
+                    json.dumps(booking.to_record(), separators=(",", ":")).encode() + b"\n"
+                    for booking in self.bookings.values()
+                    if booking.status in (HELD, CONFIRMED) or booking.updated_at >= cutoff
+                ]
+                await run_blocking(self._compact, kept)
+            except BaseException:
+                await run_blocking(self._unlock)
+                raise
+            self._reset()
+            for line in kept:
+                self._apply(json.loads(line))
+            logger.info("Compacted booking log to %d bookings", len(kept))
+
+    async def open(self):
+        """
+        Replay the log and start the writer and maintenance tasks (once).
+        """
+        if self._tasks:
+            return
+        if self._open_lock is None:
+            self._open_lock = asyncio.Lock()
+        async with self._open_lock:
+            if self._tasks:
+                return
+            self._io_lock = asyncio.Lock()
+            self._wake = asyncio.Event()
+            await run_blocking(self._open_file)
+            await self.sync()
+            loop = asyncio.get_running_loop()
+            self._tasks = [loop.create_task(self._writer()), loop.create_task(self._ticker())]
+
+    async def close(self):
+        """
+        Write queued operations and stop the background tasks.
+        """
+        if not self._tasks:
+            return
+        while self._pending:
+            batch, self._pending = self._pending[:self.batch_max], self._pending[self.batch_max:]
+            await self._commit(batch)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    # Operations
+
+    def _enqueue(self, op: _Operation):
+        self._pending.append(op)
+        self._wake.set()
+
+    async def _submit(self, op: _Operation):
+        await self.open()
+        op.future = asyncio.get_running_loop().create_future()
+        self._enqueue(op)
+        return await op.future
+
+    async def reserve(self, tour_id: str, day: date, seats: int, capacity: int,
+                      idempotency_key: Optional[str] = None, customer: Optional[dict] = None,
+                      confirm: bool = False) -> Booking:
+        """
+        Hold (or with ``confirm``, book) ``seats`` places on a tour date.
+        Raises BookingConflict when they don't fit in ``capacity``.
+        """
+        await self.open()
+        booking = Booking(
+            f"bk-{uuid.uuid4().hex[:16]}", tour_id, day.toordinal(), seats, None, None, None, None,
+            idempotency_key, customer,
+        )
+        if idempotency_key:
+            existing_id = self.by_key.get(idempotency_key)
+            if existing_id is not None:
+                existing = self.bookings[existing_id]
+                if existing.fingerprint != booking.fingerprint:
+                    raise IdempotencyMismatch(idempotency_key)
+                return existing
+            inflight = self._inflight_keys.get(idempotency_key)
+            if inflight is not None:
+                # A retry of a request that is still being written
+                fingerprint, future = inflight
+                if fingerprint != booking.fingerprint:
+                    raise IdempotencyMismatch(idempotency_key)
+                return await asyncio.shield(future)
+        if self.used(tour_id, booking.day) + seats > capacity:
+            # Already full here; no need to queue a write to find out
+            BOOKING_OPERATIONS.labels("book" if confirm else "hold", "error").inc()
+            raise BookingConflict("Not enough places left on this date")
+
+        op = _Operation("book" if confirm else "hold", booking=booking, capacity=capacity)
+        op.future = asyncio.get_running_loop().create_future()
+        if idempotency_key:
+            self._inflight_keys[idempotency_key] = (booking.fingerprint, op.future)
+        try:
+            self._enqueue(op)
+            return await asyncio.shield(op.future)
+        finally:
+            if idempotency_key and self._inflight_keys.get(idempotency_key, (None, None))[1] is op.future:
+                del self._inflight_keys[idempotency_key]
+
+    async def confirm(self, booking_id: str) -> Booking:
+        if await self.get(booking_id) is None:
+            raise BookingNotFound(booking_id)
+        return await self._submit(_Operation("confirm", booking_id=booking_id))
+
+    async def cancel(self, booking_id: str) -> Booking:
+        if await self.get(booking_id) is None:
+            raise BookingNotFound(booking_id)
+        return await self._submit(_Operation("cancel", booking_id=booking_id))
+
+    async def get(self, booking_id: str) -> Optional[Booking]:
+        await self.open()
+        booking = self.bookings.get(booking_id)
+        if booking is None:
+            # It may have been made by another worker since the last sync
+            await self.sync()
+            booking = self.bookings.get(booking_id)
+        return booking
+
+    def availability(self, tour_id: str, first: date, last: date, capacity: int) -> List[dict]:
+        """
+        Places held, booked and left per day from ``first`` to ``last``.
+        """
+        days = self.counters.get(tour_id, {})
+        result = []
+        for day in range(first.toordinal(), last.toordinal() + 1):
+            held, confirmed = days.get(day, (0, 0))
+            result.append({
+                "date": date.fromordinal(day).isoformat(),
+                "capacity": capacity,
+                "held": held,
+                "booked": confirmed,
+                "available": max(capacity - held - confirmed, 0),
+            })
+        return result
+
+
+engine = BookingEngine()
+
+
+async def get_engine() -> BookingEngine:
+    await engine.open()
+    return engine
+
+
+async def stop():
+    await engine.close()
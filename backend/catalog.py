@@ -0,0 +1,804 @@
+import asyncio
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import sqlite3
+import time
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import changes
+import metrics
+import warmup
+from loop_monitor import run_blocking
+
+logger = logging.getLogger(__name__)
+
+# Base data directory path
+data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+# How often request handlers check the data files for changes
+reload_check_interval = float(os.environ.get("CATALOG_RELOAD_CHECK_SECONDS", 2))
+
+# Compiled field projectors kept per table (see Table.projector)
+max_projectors = int(os.environ.get("CATALOG_MAX_PROJECTORS", 256))
+
+_EPOCH = datetime(1970, 1, 1)
+_MISSING = object()
+
+# Entity schemas: (field path, column kind). Dotted paths are nested objects;
+# "cat:<domain>" columns share an interned string table per domain.
+TOUR_SCHEMA = [
+    ("id", "str"),
+    ("name", "str"),
+    ("description", "str"),
+    ("duration_hours", "number"),
+    ("price", "number"),
+    ("location", "cat:location"),
+    ("max_participants", "int"),
+    ("guide_id", "cat:guide_id"),
+    ("rating", "number"),
+    ("languages", "cat_list:language"),
+    ("includes", "cat_list:tour_include"),
+    ("meeting_point", "str"),
+    ("created_at", "datetime"),
+    ("updated_at", "datetime"),
+]
+
+TOUR_GUIDE_SCHEMA = [
+    ("id", "str"),
+    ("name", "str"),
+    ("age", "int"),
+    ("languages", "cat_list:language"),
+    ("specialization", "cat:specialization"),
+    ("experience_years", "int"),
+    ("rating", "number"),
+    ("bio", "str"),
+    ("contact.email", "str"),
+    ("contact.phone", "str"),
+    ("availability.days", "cat_list:weekday"),
+    ("availability.hours", "cat:hours"),
+    ("certifications", "cat_list:certification"),
+    ("profile_image", "cat:image"),
+    ("tours_conducted", "int"),
+    ("created_at", "datetime"),
+    ("updated_at", "datetime"),
+]
+
+DESTINATION_SCHEMA = [
+    ("id", "str"),
+    ("name", "str"),
+    ("capital", "str"),
+    ("region", "cat:region"),
+    ("subregion", "cat:region"),
+    ("population", "int"),
+    ("languages", "cat_list:language"),
+    ("currencies", "cat_list:currency"),
+    ("flag", "str"),
+    ("coordinates", "number_list"),
+    ("timezones", "cat_list:timezone"),
+    ("country_code", "str"),
+    ("created_at", "datetime"),
+    ("updated_at", "datetime"),
+]
+
+# Entity name -> (data file, schema)
+ENTITIES = {
+    "tours": ("tours.json", TOUR_SCHEMA),
+    "tour_guides": ("tour_guides.json", TOUR_GUIDE_SCHEMA),
+    "destinations": ("destinations.json", DESTINATION_SCHEMA),
+}
+
+
+class Interner:
+    """
+    Shared string table for a category domain (languages, regions, ...).
+    """
+
+    __slots__ = ("strings", "codes")
+
+    def __init__(self, strings=()):
+        self.strings: List[str] = list(strings)
+        self.codes: Dict[str, int] = {s: i for i, s in enumerate(self.strings)}
+
+    def code(self, value: str) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.strings)
+            self.strings.append(value)
+        return code
+
+    def lookup(self, value: str) -> Optional[int]:
+        return self.codes.get(value)
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _render_number(value):
+    # JSON numbers keep their int/float shape when round-tripped
+    return int(value) if value.is_integer() else value
+
+
+class Column:
+    """
+    Base column. Values that don't fit the column's encoding are kept as-is in
+    ``overrides``; absent fields are flagged in the ``missing`` bytearray.
+    """
+
+    __slots__ = ("missing", "overrides")
+
+    def __init__(self):
+        self.missing = None
+        self.overrides = {}
+
+    def get(self, i):
+        if self.missing is not None and self.missing[i]:
+            return _MISSING
+        if self.overrides:
+            value = self.overrides.get(i, _MISSING)
+            if value is not _MISSING:
+                return value
+        return self.decode(i)
+
+    def decode(self, i):
+        raise NotImplementedError
+
+    # Builder protocol
+    def _mark_missing(self, i, n_hint):
+        if self.missing is None:
+            self.missing = bytearray(n_hint)
+        if len(self.missing) <= i:
+            self.missing.extend(bytes(i + 1 - len(self.missing)))
+        self.missing[i] = 1
+
+    def _finish(self, n):
+        if self.missing is not None and len(self.missing) < n:
+            self.missing.extend(bytes(n - len(self.missing)))
+
+
+class StringColumn(Column):
+    """
+    Free-text strings packed into one UTF-8 blob with an offsets array.
+    """
+
+    __slots__ = ("blob", "offsets", "_buffer")
+
+    def __init__(self, blob=b"", offsets=None):
+        super().__init__()
+        self.blob = blob
+        self.offsets = offsets if offsets is not None else array("Q", [0])
+        self._buffer = None
+
+    def decode(self, i):
+        return str(self.blob[self.offsets[i]:self.offsets[i + 1]], "utf-8")
+
+    def append(self, value):
+        if self._buffer is None:
+            self._buffer = bytearray(self.blob)
+        if isinstance(value, str):
+            self._buffer += value.encode("utf-8")
+            self.offsets.append(len(self._buffer))
+            return True
+        self.offsets.append(len(self._buffer))
+        return False
+
+    def _finish(self, n):
+        super()._finish(n)
+        if self._buffer is not None:
+            self.blob = bytes(self._buffer)
+            self._buffer = None
+
+
+class CategoryColumn(Column):
+    """
+    Repeated strings stored as codes into a shared ``Interner``.
+    """
+
+    __slots__ = ("codes", "interner")
+
+    def __init__(self, interner, codes=None):
+        super().__init__()
+        self.interner = interner
+        self.codes = codes if codes is not None else array("I")
+
+    def decode(self, i):
+        return self.interner.strings[self.codes[i]]
+
+    def append(self, value):
+        if isinstance(value, str):
+            self.codes.append(self.interner.code(value))
+            return True
+        self.codes.append(0)
+        return False
+
+
+class CategoryListColumn(Column):
+    """
+    Lists of repeated strings: per-row offsets into one array of codes.
+    """
+
+    __slots__ = ("offsets", "codes", "interner")
+
+    def __init__(self, interner, offsets=None, codes=None):
+        super().__init__()
+        self.interner = interner
+        self.offsets = offsets if offsets is not None else array("I", [0])
+        self.codes = codes if codes is not None else array("I")
+
+    def decode(self, i):
+        strings = self.interner.strings
+        return [strings[c] for c in self.codes[self.offsets[i]:self.offsets[i + 1]]]
+
+    def row_codes(self, i):
+        return self.codes[self.offsets[i]:self.offsets[i + 1]]
+
+    def append(self, value):
+        if isinstance(value, list) and all(isinstance(v, str) for v in value):
+            self.codes.extend(self.interner.code(v) for v in value)
+            self.offsets.append(len(self.codes))
+            return True
+        self.offsets.append(len(self.codes))
+        return False
+
+
+class IntColumn(Column):
+    __slots__ = ("values",)
+
+    def __init__(self, values=None):
+        super().__init__()
+        self.values = values if values is not None else array("q")
+
+    def decode(self, i):
+        return self.values[i]
+
+    def append(self, value):
+        if isinstance(value, int) and not isinstance(value, bool) and -2**63 <= value < 2**63:
+            self.values.append(value)
+            return True
+        self.values.append(0)
+        return False
+
+
+class NumberColumn(Column):
+    __slots__ = ("values",)
+
+    def __init__(self, values=None):
+        super().__init__()
+        self.values = values if values is not None else array("d")
+
+    def decode(self, i):
+        return _render_number(self.values[i])
+
+    def append(self, value):
+        # Integers beyond float precision would not round-trip
+        if _is_number(value) and (isinstance(value, float) or abs(value) < 2**53):
+            self.values.append(value)
+            return True
+        self.values.append(0.0)
+        return False
+
+
+class NumberListColumn(Column):
+    __slots__ = ("offsets", "values")
+
+    def __init__(self, offsets=None, values=None):
+        super().__init__()
+        self.offsets = offsets if offsets is not None else array("I", [0])
+        self.values = values if values is not None else array("d")
+
+    def decode(self, i):
+        return [_render_number(v) for v in self.values[self.offsets[i]:self.offsets[i + 1]]]
+
+    def append(self, value):
+        if isinstance(value, list) and all(_is_number(v) and abs(v) < 2**53 for v in value):
+            self.values.extend(float(v) for v in value)
+            self.offsets.append(len(self.values))
+            return True
+        self.offsets.append(len(self.values))
+        return False
+
+
+class DateTimeColumn(Column):
+    """
+    Naive ISO timestamps stored as microseconds since the epoch and formatted
+    back with ``isoformat`` when serialized.
+    """
+
+    __slots__ = ("values",)
+
+    def __init__(self, values=None):
+        super().__init__()
+        self.values = values if values is not None else array("q")
+
+    def decode(self, i):
+        return (_EPOCH + timedelta(microseconds=self.values[i])).isoformat()
+
+    def append(self, value):
+        if isinstance(value, str):
+            try:
+                parsed = datetime.fromisoformat(value)
+            except ValueError:
+                parsed = None
+            # Only naive timestamps that format back identically are encoded
+            if parsed is not None and parsed.tzinfo is None and parsed.isoformat() == value:
+                self.values.append((parsed - _EPOCH) // timedelta(microseconds=1))
+                return True
+        self.values.append(0)
+        return False
+
+
+def _new_column(kind, interners):
+    base, _, domain = kind.partition(":")
+    if base == "str":
+        return StringColumn()
+    if base == "cat":
+        return CategoryColumn(interners.setdefault(domain, Interner()))
+    if base == "cat_list":
+        return CategoryListColumn(interners.setdefault(domain, Interner()))
+    if base == "int":
+        return IntColumn()
+    if base == "number":
+        return NumberColumn()
+    if base == "number_list":
+        return NumberListColumn()
+    if base == "datetime":
+        return DateTimeColumn()
+    raise ValueError(f"Unknown column kind {kind}")
+
+
+def _serialization_plan(schema):
+    """
+    Group schema fields into top-level keys, nesting dotted paths.
+    """
+    plan: List[Tuple[str, object]] = []
+    groups: Dict[str, list] = {}
+    for path, _ in schema:
+        top, _, sub = path.partition(".")
+        if sub:
+            if top not in groups:
+                groups[top] = []
+                plan.append((top, groups[top]))
+            groups[top].append((sub, path))
+        else:
+            plan.append((top, path))
+    return plan
+
+
+class Table:
+    """
+    Struct-of-arrays table for one entity type.
+
+    Rows are accessed through ``RowView`` objects; dicts are only built when a
+    row is serialized. Lookups by id use a sorted permutation index.
+    """
+
+    def __init__(self, name, schema, columns, id_index, extras=None):
+        self.name = name
+        self.schema = schema
+        self.columns: Dict[str, Column] = columns
+        self.id_index = id_index
+        self.extras: Dict[int, dict] = extras or {}
+        self._plan = _serialization_plan(schema)
+        self._top_level = dict(self._plan)
+        self._ids = columns["id"]
+        self._projectors: Dict[Tuple[str, ...], object] = {}
+
+    @classmethod
+    def from_records(cls, name, schema, records, interners):
+        columns = {path: _new_column(kind, interners) for path, kind in schema}
+        nested = {}
+        for path, _ in schema:
+            top, _, sub = path.partition(".")
+            if sub:
+                nested.setdefault(top, set()).add(sub)
+        extras = {}
+        n = len(records)
+        for i, record in enumerate(records):
+            extra = {}
+            for key, value in record.items():
+                if key not in nested and key not in columns:
+                    extra[key] = value
+                # Nested objects with unexpected shape are kept verbatim
+                elif key in nested and (not isinstance(value, dict) or not set(value) <= nested[key]):
+                    extra[key] = value
+            for path, _ in schema:
+                top, _, sub = path.partition(".")
+                column = columns[path]
+                if sub:
+                    parent = record.get(top)
+                    value = parent.get(sub, _MISSING) if isinstance(parent, dict) and top not in extra else _MISSING
+                else:
+                    value = record.get(path, _MISSING)
+                if value is _MISSING:
+                    column.append(None)
+                    column._mark_missing(i, n)
+                elif not column.append(value):
+                    column.overrides[i] = value
+            if extra:
+                extras[i] = extra
+        for column in columns.values():
+            column._finish(n)
+        ids = columns["id"]
+        id_index = array("I", sorted(range(n), key=lambda i: str(ids.get(i))))
+        return cls(name, schema, columns, id_index, extras)
+
+    def __len__(self):
+        return len(self.id_index)
+
+    def __iter__(self) -> Iterator["RowView"]:
+        return (RowView(self, i) for i in range(len(self)))
+
+    def row(self, index) -> "RowView":
+        return RowView(self, index)
+
+    def find(self, row_id) -> Optional[int]:
+        ids = self._ids
+        position = bisect_left(self.id_index, row_id, key=lambda i: str(ids.get(i)))
+        if position < len(self.id_index):
+            index = self.id_index[position]
+            if ids.get(index) == row_id:
+                return index
+        return None
+
+    def position_after(self, row_id) -> int:
+        """
+        Position in ``id_index`` of the first row whose id sorts after ``row_id``.
+        """
+        ids = self._ids
+        return bisect_right(self.id_index, row_id, key=lambda i: str(ids.get(i)))
+
+    def get(self, row_id) -> Optional["RowView"]:
+        index = self.find(row_id)
+        return None if index is None else RowView(self, index)
+
+    def value(self, index, key):
+        entry = self._top_level.get(key)
+        if entry is None:
+            extra = self.extras.get(index)
+            if extra is not None and key in extra:
+                return extra[key]
+            return _MISSING
+        if isinstance(entry, str):
+            return self.columns[entry].get(index)
+        extra = self.extras.get(index)
+        if extra is not None and key in extra:
+            return extra[key]
+        obj = {}
+        for sub, path in entry:
+            value = self.columns[path].get(index)
+            if value is not _MISSING:
+                obj[sub] = value
+        return obj if obj else _MISSING
+
+    def to_dict(self, index) -> dict:
+        extra = self.extras.get(index)
+        result = {}
+        for key, entry in self._plan:
+            if extra is not None and key in extra:
+                result[key] = extra[key]
+                continue
+            if isinstance(entry, str):
+                value = self.columns[entry].get(index)
+                if value is not _MISSING:
+                    result[key] = value
+                continue
+            obj = {}
+            for sub, path in entry:
+                value = self.columns[path].get(index)
+                if value is not _MISSING:
+                    obj[sub] = value
+            if obj:
+                result[key] = obj
+        if extra is not None:
+            for key, value in extra.items():
+                if key not in result:
+                    result[key] = value
+        return result
+
+    def to_dicts(self) -> List[dict]:
+        return [self.to_dict(i) for i in range(len(self))]
+
+    def projector(self, paths: Tuple[str, ...]):
+        """
+        Function building the dict of only ``paths`` for a row index, like
+        ``to_dict`` restricted to those fields. Projectors are compiled once
+        per field set; unknown paths raise ``KeyError``.
+        """
+        projector = self._projectors.get(paths)
+        if projector is None:
+            if len(self._projectors) >= max_projectors:
+                self._projectors.clear()
+            projector = self._projectors[paths] = self._compile_projector(paths)
+        return projector
+
+    def _compile_projector(self, paths):
+        # Top-level key -> None for the whole value, or the nested keys wanted
+        wanted: Dict[str, Optional[set]] = {}
+        for path in paths:
+            top, _, sub = path.partition(".")
+            entry = self._top_level.get(top)
+            if entry is None or (sub and (isinstance(entry, str) or sub not in dict(entry))):
+                raise KeyError(path)
+            if not sub:
+                wanted[top] = None
+            elif wanted.get(top, ()) is not None:
+                wanted.setdefault(top, set()).add(sub)
+
+        # Steps in schema order: (key, column getter) or (key, nested getters)
+        steps = []
+        for key, entry in self._plan:
+            if key not in wanted:
+                continue
+            if isinstance(entry, str):
+                steps.append((key, self.columns[entry].get, None))
+            else:
+                subs = wanted[key]
+                steps.append((key, None, [
+                    (sub, self.columns[path].get) for sub, path in entry if subs is None or sub in subs
+                ]))
+        extras = self.extras
+
+        def project(index):
+            extra = extras.get(index)
+            result = {}
+            for key, get, nested in steps:
+                if extra is not None and key in extra:
+                    value = extra[key]
+                    if nested is not None and isinstance(value, dict):
+                        value = {sub: value[sub] for sub, _ in nested if sub in value}
+                    result[key] = value
+                elif nested is None:
+                    value = get(index)
+                    if value is not _MISSING:
+                        result[key] = value
+                else:
+                    obj = {}
+                    for sub, sub_get in nested:
+                        value = sub_get(index)
+                        if value is not _MISSING:
+                            obj[sub] = value
+                    if obj:
+                        result[key] = obj
+            return result
+
+        return project
+
+    def field_paths(self) -> List[str]:
+        """
+        Field paths accepted by ``projector``.
+        """
+        return [key for key, _ in self._plan] + [path for path, _ in self.schema if "." in path]
+
+
+class RowView:
+    """
+    Read-only mapping view of one table row.
+    """
+
+    __slots__ = ("table", "index")
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+
+    def __getitem__(self, key):
+        value = self.table.value(self.index, key)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        value = self.table.value(self.index, key)
+        return default if value is _MISSING else value
+
+    def __contains__(self, key):
+        return self.table.value(self.index, key) is not _MISSING
+
+    def keys(self):
+        return self.to_dict().keys()
+
+    def to_dict(self) -> dict:
+        return self.table.to_dict(self.index)
+
+    def project(self, paths: Tuple[str, ...]) -> dict:
+        return self.table.projector(paths)(self.index)
+
+    def __repr__(self):
+        return f"RowView({self.table.name}, {self.get('id')!r})"
+
+
+class Catalog:
+    """
+    Immutable snapshot of all catalog tables. A reload builds a new Catalog
+    with a higher ``version`` and swaps it in; requests holding the old one
+    keep a consistent view.
+    """
+
+    def __init__(self, tables: Dict[str, Table], version: int, sources: Dict[str, tuple], interners=None):
+        self.tables = tables
+        self.version = version
+        self.sources = sources
+        self.interners = interners or {}
+        # Memory map backing the tables when loaded from a binary snapshot
+        self.mapping = None
+
+    @property
+    def tours(self) -> Table:
+        return self.tables["tours"]
+
+    @property
+    def tour_guides(self) -> Table:
+        return self.tables["tour_guides"]
+
+    @property
+    def destinations(self) -> Table:
+        return self.tables["destinations"]
+
+    @property
+    def fingerprint(self) -> str:
+        """
+        Identifies the data files this snapshot was built from; unlike
+        ``version`` it is the same in every worker on the host.
+        """
+        parts = [f"{name}:{mtime}:{size}" for name, (mtime, size) in sorted(self.sources.items())]
+        return format(zlib.crc32("|".join(parts).encode()), "08x")
+
+
+def _source_stamp(file_name):
+    try:
+        stat = os.stat(os.path.join(data_dir, file_name))
+    except FileNotFoundError:
+        return (0, 0)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _read_records(file_name) -> list:
+    file_path = os.path.join(data_dir, file_name)
+    if not os.path.exists(file_path):
+        return []
+    started = time.perf_counter()
+    try:
+        with open(file_path, 'r') as f:
+            records = json.load(f)
+    except Exception as e:
+        logger.error("Error loading %s: %s", file_name, e)
+        metrics.observe_data_load(file_name, started, None)
+        return []
+    metrics.observe_data_load(file_name, started, len(records))
+    return records
+
+
+def build_catalog(records_by_entity: Dict[str, list], version=1, sources=None) -> Catalog:
+    interners: Dict[str, Interner] = {}
+    tables = {
+        name: Table.from_records(name, schema, records_by_entity.get(name, []), interners)
+        for name, (_, schema) in ENTITIES.items()
+    }
+    return Catalog(tables, version, sources or {}, interners)
+
+
+def load_catalog(version=1, use_snapshot=True, previous: Optional[Catalog] = None) -> Catalog:
+    """
+    Build a catalog snapshot (blocking). A compiled binary snapshot that is
+    up to date with the data files is memory-mapped; otherwise the JSON files
+    are parsed. With ``previous``, tables whose data file hasn't changed are
+    reused and only the changed files are parsed.
+    """
+    sources = {file_name: _source_stamp(file_name) for file_name, _ in ENTITIES.values()}
+    if use_snapshot:
+        import snapshot
+
+        mapped = snapshot.load_if_fresh(sources, version)
+        if mapped is not None:
+            return mapped
+    if previous is None:
+        records = {name: _read_records(file_name) for name, (file_name, _) in ENTITIES.items()}
+        return build_catalog(records, version, sources)
+
+    # Interners only ever grow, so rebuilt tables can share them with the
+    # reused ones (and with readers of the previous snapshot)
+    tables = {}
+    reused = False
+    for name, (file_name, schema) in ENTITIES.items():
+        if previous.sources.get(file_name) == sources[file_name] and name in previous.tables:
+            tables[name] = previous.tables[name]
+            reused = True
+        else:
+            tables[name] = Table.from_records(name, schema, _read_records(file_name), previous.interners)
+    result = Catalog(tables, version, sources, previous.interners)
+    if reused:
+        result.mapping = previous.mapping
+    return result
+
+
+_current: Optional[Catalog] = None
+_last_check = 0.0
+# Snapshot pinned for the current context, e.g. for all sub-requests of a batch
+_pinned: contextvars.ContextVar[Optional[Catalog]] = contextvars.ContextVar("catalog_pinned", default=None)
+_reload_lock: Optional[asyncio.Lock] = None
+
+metrics.registry.gauge("tourease_catalog_version", "Version of the loaded catalog snapshot").set_function(
+    lambda: _current.version if _current is not None else 0
+)
+
+
+def _sources_changed(snapshot: Catalog) -> bool:
+    return any(_source_stamp(file_name) != stamp for file_name, stamp in snapshot.sources.items())
+
+
+async def reload(force=True) -> Catalog:
+    """
+    Rebuild the catalog from the data files off the event loop and swap it in.
+    Without ``force`` only the tables whose data file changed are rebuilt.
+    Changed rows are recorded in ``changes.log``.
+    """
+    global _current, _reload_lock
+    if _reload_lock is None:
+        _reload_lock = asyncio.Lock()
+    async with _reload_lock:
+        snapshot = _current
+        if not force and snapshot is not None and not _sources_changed(snapshot):
+            return snapshot
+        version = snapshot.version + 1 if snapshot is not None else 1
+        loaded = await run_blocking(load_catalog, version, previous=None if force else snapshot)
+        # Rows that differ from the previous snapshot go to the change log,
+        # recorded together with the swap so the two always agree
+        changed = await run_blocking(changes.diff, snapshot, loaded) if snapshot is not None else []
+        try:
+            await run_blocking(changes.log.record, loaded, changed, snapshot)
+        except sqlite3.Error as e:
+            logger.error("Catalog changes not recorded: %s", e)
+        _current = loaded
+        return _current
+
+
+async def get_catalog() -> Catalog:
+    """
+    Return the current catalog snapshot, reloading it when a data file changed.
+    """
+    global _last_check
+    pinned_snapshot = _pinned.get()
+    if pinned_snapshot is not None:
+        return pinned_snapshot
+    snapshot = _current
+    if snapshot is None:
+        return await reload(force=False)
+    now = time.monotonic()
+    if now - _last_check >= reload_check_interval:
+        _last_check = now
+        if _sources_changed(snapshot):
+            return await reload(force=False)
+    return snapshot
+
+
+@warmup.register("catalog")
+async def warm_catalog():
+    await get_catalog()
+
+
+def current() -> Optional[Catalog]:
+    """
+    The loaded snapshot without a freshness check (None before the first load).
+    """
+    pinned_snapshot = _pinned.get()
+    return pinned_snapshot if pinned_snapshot is not None else _current
+
+
+@contextlib.contextmanager
+def pinned(snapshot: Catalog):
+    """
+    Make ``get_catalog`` and ``current`` return ``snapshot`` inside the block,
+    including in tasks started from it.
+    """
+    token = _pinned.set(snapshot)
+    try:
+        yield snapshot
+    finally:
+        _pinned.reset(token)
@@ -0,0 +1,239 @@
+"""
+Change log of catalog rows for incremental sync.
+
+Every catalog reload is diffed against the snapshot it replaces, table by
+table (tables reused unchanged are skipped), and each added, changed or
+removed row is recorded with the next change ``version``. A row is only
+listed at its latest version, so a client catching up gets each row once,
+in its current state. Entries are kept up to a bound; a client that asks for
+changes older than the retained window must resync from the full lists.
+
+The log lives in a SQLite file (``CHANGES_PATH``) so that every worker on
+the host hands out the same versions, and versions survive restarts.
+``epoch`` changes only when that file is recreated, after which versions
+from before are meaningless.
+"""
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Change entries retained; older changes require a full resync
+max_entries = int(os.environ.get("CHANGES_MAX_ENTRIES", 100_000))
+# Shared by every worker on the host
+changes_path = os.environ.get(
+    "CHANGES_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "changes.sqlite3"),
+)
+
+
+def _ids_in_order(table):
+    ids = table._ids
+    for index in table.id_index:
+        row_id = ids.get(index)
+        if isinstance(row_id, str):
+            yield row_id, index
+
+
+def diff_tables(previous, table) -> List[str]:
+    """
+    Ids of rows added, changed or removed between two versions of a table,
+    found with one merge over their sorted id indexes (blocking).
+    """
+    changed = []
+    old_rows = _ids_in_order(previous)
+    new_rows = _ids_in_order(table)
+    old = next(old_rows, None)
+    new = next(new_rows, None)
+    while old is not None or new is not None:
+        if new is None or (old is not None and old[0] < new[0]):
+            changed.append(old[0])
+            old = next(old_rows, None)
+        elif old is None or new[0] < old[0]:
+            changed.append(new[0])
+            new = next(new_rows, None)
+        else:
+            if previous.to_dict(old[1]) != table.to_dict(new[1]):
+                changed.append(new[0])
+            old = next(old_rows, None)
+            new = next(new_rows, None)
+    return changed
+
+
+def diff(previous, snapshot) -> List[Tuple[str, str]]:
+    """
+    (table, id) of every row that differs between two catalog snapshots
+    (blocking; call off the event loop).
+    """
+    changed = []
+    for name, table in snapshot.tables.items():
+        before = previous.tables.get(name)
+        if before is table:
+            continue
+        if before is None:
+            changed.extend((name, row_id) for row_id, _ in _ids_in_order(table))
+        else:
+            changed.extend((name, row_id) for row_id in diff_tables(before, table))
+    for name, table in previous.tables.items():
+        if name not in snapshot.tables:
+            changed.extend((name, row_id) for row_id, _ in _ids_in_order(table))
+    return changed
+
+
+class ChangeLog:
+    """
+    Bounded log of changed rows, ordered by version, shared by every worker
+    on the host through one SQLite file.
+
+    Each worker diffs its own reloads, but a transition between two catalog
+    fingerprints is recorded once: by the first worker whose previous
+    snapshot matches the log's head. Workers arriving at a state already
+    recorded only note the version it ended at. A worker that can't diff
+    against the head (e.g. the data files changed while every worker was
+    down) starts a new window, so clients behind it resync. Statements block;
+    call them off the event loop.
+    """
+
+    def __init__(self, max_entries: int, path: str = changes_path):
+        self.max_entries = max_entries
+        self.path = path
+        self._conn = None
+        self._pid = None
+        self._lock = threading.Lock()
+        # What this worker last saw of the shared log
+        self.epoch: Optional[str] = None
+        self.version = 0
+        self.entries = 0
+        # This worker's snapshot and the version the log was at when it
+        # reached it; later changes aren't in that snapshot yet. Set as one
+        # tuple so readers on the event loop never see a mixed pair
+        self.view: Tuple[Optional[object], int] = (None, 0)
+
+    def _connection(self):
+        # Connections must not cross a fork, so open one per process
+        if self._conn is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS change_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            # One entry per row, at its latest version
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS change_entries ("
+                "version INTEGER PRIMARY KEY, entity TEXT NOT NULL, id TEXT NOT NULL, UNIQUE (entity, id))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS change_states (fingerprint TEXT PRIMARY KEY, version INTEGER NOT NULL)"
+            )
+            conn.execute(
+                "INSERT OR IGNORE INTO change_meta (key, value) VALUES ('epoch', ?), ('version', '0'), ('floor', '0')",
+                (secrets.token_hex(4),),
+            )
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def _meta(self, conn) -> Dict[str, str]:
+        return dict(conn.execute("SELECT key, value FROM change_meta").fetchall())
+
+    def record(self, snapshot, changed: List[Tuple[str, str]], previous=None):
+        """
+        Record the rows changed by swapping ``previous`` for ``snapshot``.
+        """
+        fingerprint = snapshot.fingerprint
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                meta = self._meta(conn)
+                version, floor, head = int(meta["version"]), int(meta["floor"]), meta.get("head")
+                if head == fingerprint:
+                    # Already recorded by another worker (or before a restart)
+                    row = conn.execute(
+                        "SELECT version FROM change_states WHERE fingerprint = ?", (fingerprint,)
+                    ).fetchone()
+                    visible = row[0] if row is not None else version
+                else:
+                    if head is not None and (previous is None or previous.fingerprint != head):
+                        # The log's head isn't the state this diff starts from
+                        version += 1
+                        floor = version
+                        conn.execute("DELETE FROM change_entries")
+                        logger.warning("Catalog change log restarted at version %d; clients will resync", version)
+                    elif changed:
+                        first = version + 1
+                        conn.executemany(
+                            "INSERT OR REPLACE INTO change_entries (version, entity, id) VALUES (?, ?, ?)",
+                            [(first + i, name, row_id) for i, (name, row_id) in enumerate(changed)],
+                        )
+                        version += len(changed)
+                    floor = self._trim(conn, floor)
+                    conn.execute(
+                        "INSERT OR REPLACE INTO change_states (fingerprint, version) VALUES (?, ?)",
+                        (fingerprint, version),
+                    )
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO change_meta (key, value) VALUES (?, ?)",
+                        [("version", str(version)), ("floor", str(floor)), ("head", fingerprint)],
+                    )
+                    visible = version
+                    if changed and head is not None:
+                        logger.info("Catalog changes recorded: %d rows, version %d", len(changed), version)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            self.epoch = meta["epoch"]
+            self.version = version
+            self.entries = conn.execute("SELECT COUNT(*) FROM change_entries").fetchone()[0]
+            self.view = (snapshot, visible)
+
+    def _trim(self, conn, floor: int) -> int:
+        # Drop the oldest entries down to 3/4 of the bound so trimming isn't
+        # repeated on every reload; changes up to the new floor are lost
+        count = conn.execute("SELECT COUNT(*) FROM change_entries").fetchone()[0]
+        if count <= self.max_entries:
+            return floor
+        drop = count - self.max_entries * 3 // 4
+        row = conn.execute(
+            "SELECT version FROM change_entries ORDER BY version LIMIT 1 OFFSET ?", (drop - 1,)
+        ).fetchone()
+        conn.execute("DELETE FROM change_entries WHERE version <= ?", (row[0],))
+        return max(floor, row[0])
+
+    def since(self, epoch: str, since: int, visible: int, limit: int) -> Tuple[Optional[List[Tuple[int, str, str]]], bool]:
+        """
+        Up to ``limit`` entries after version ``since`` and up to ``visible``,
+        and whether there are more. The entries are None when ``since`` can't
+        be served from the log: another epoch, or changes no longer retained.
+        """
+        with self._lock:
+            conn = self._connection()
+            meta = self._meta(conn)
+            if epoch != meta["epoch"] or not int(meta["floor"]) <= since <= int(meta["version"]):
+                return None, False
+            rows = conn.execute(
+                "SELECT version, entity, id FROM change_entries WHERE version > ? AND version <= ? "
+                "ORDER BY version LIMIT ?",
+                (since, visible, limit + 1),
+            ).fetchall()
+        return rows[:limit], len(rows) > limit
+
+    def __len__(self):
+        return self.entries
+
+
+log = ChangeLog(max_entries)
+
+metrics.registry.gauge("tourease_change_log_entries", "Entries retained in the catalog change log").set_function(
+    lambda: len(log)
+)
+metrics.registry.gauge("tourease_change_log_version", "Latest catalog change version").set_function(
+    lambda: log.version
+)
@@ -0,0 +1,345 @@
+"""
+Background refresh of destination data from restcountries.
+
+The sync requests only the fields we map, parses the response as it streams
+in, and diffs it against the loaded catalog: unchanged records are kept as
+they are, changed ones get a new ``updated_at``, and the data file is only
+rewritten when something changed. Destinations keep their id across syncs;
+new countries get ``dest-<cca3>``. Request handlers never wait for it.
+
+    python destination_sync.py [--dry-run]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import catalog
+import metrics
+import upstream
+from loop_monitor import offload, run_blocking
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-worker lock, every worker syncs
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# How often to refresh (0 disables the background sync) and how long to wait
+# before retrying a failed one
+sync_interval = float(os.environ.get("DESTINATION_SYNC_INTERVAL_HOURS", 24)) * 3600
+retry_delay = float(os.environ.get("DESTINATION_SYNC_RETRY_SECONDS", 300))
+# Set DESTINATION_SYNC_ENABLED=0 to never contact restcountries in the
+# background (manual syncs still work)
+sync_enabled = os.environ.get("DESTINATION_SYNC_ENABLED", "1").lower() not in ("0", "false", "no")
+# Even when a sync is due, the first one waits this long (plus up to as much
+# again of jitter, so workers started together don't all try at once);
+# starting the app doesn't contact restcountries or write data files
+startup_delay = float(os.environ.get("DESTINATION_SYNC_STARTUP_DELAY_SECONDS", 300))
+
+destinations_file = "destinations.json"
+state_path = os.path.join(catalog.data_dir, ".destination_sync.json")
+lock_path = os.path.join(catalog.data_dir, ".destination_sync.lock")
+
+# restcountries accepts at most 10 fields per request, so the mapped fields
+# are fetched in two passes joined on cca3
+FIELD_GROUPS = (
+    ("cca3", "name", "capital", "region", "subregion", "population", "latlng", "timezones"),
+    ("cca3", "languages", "currencies", "flags"),
+)
+
+# Fields owned by the sync; anything else on a record is left alone
+SYNCED_FIELDS = (
+    "name", "capital", "region", "subregion", "population", "languages",
+    "currencies", "flag", "coordinates", "timezones", "country_code",
+)
+
+SYNC_RUNS = metrics.registry.counter(
+    "tourease_destination_sync_runs_total",
+    "Destination sync runs by result",
+    ["result"],
+)
+SYNC_CHANGES = metrics.registry.counter(
+    "tourease_destination_sync_records_total",
+    "Destination records changed by the sync",
+    ["change"],
+)
+SYNC_LAST_SUCCESS = metrics.registry.gauge(
+    "tourease_destination_sync_last_success_timestamp_seconds",
+    "Unix time of the last successful destination sync",
+)
+
+_task = None
+_wake: Optional[asyncio.Event] = None
+_lock: Optional[asyncio.Lock] = None
+
+
+def transform(country: dict) -> dict:
+    """
+    Map a restcountries record to the synced destination fields.
+    """
+    return {
+        "name": country.get("name", {}).get("common", "Unknown"),
+        "capital": country.get("capital", ["Unknown"])[0] if country.get("capital") else "Unknown",
+        "region": country.get("region", "Unknown"),
+        "subregion": country.get("subregion", "Unknown"),
+        "population": country.get("population", 0),
+        "languages": list(country.get("languages", {}).values()) if country.get("languages") else [],
+        "currencies": [curr["name"] for curr in country.get("currencies", {}).values()] if country.get("currencies") else [],
+        "flag": country.get("flags", {}).get("png", ""),
+        "coordinates": country.get("latlng", [0, 0]),
+        "timezones": country.get("timezones", []),
+        "country_code": country["cca3"],
+    }
+
+
+async def fetch_countries() -> Dict[str, dict]:
+    """
+    Download the mapped fields of every country, keyed by cca3.
+    """
+    countries: Dict[str, dict] = {}
+    for fields in FIELD_GROUPS:
+        async for country in upstream.restcountries.stream_json_array(
+            "/v3.1/all", params={"fields": ",".join(fields)}
+        ):
+            code = country.get("cca3") if isinstance(country, dict) else None
+            if code:
+                countries.setdefault(code, {}).update(country)
+    return countries
+
+
+def diff(current: List[dict], countries: Dict[str, dict], now: str) -> Tuple[List[dict], Dict[str, int]]:
+    """
+    Merge fetched countries into the current destination records.
+
+    Records are matched by country code, or by name for records that predate
+    the sync. Returns the new record list (current order, new countries
+    appended) and counts of added/updated/removed/unchanged records.
+    """
+    fetched = {}
+    for code, country in countries.items():
+        try:
+            fetched[code] = transform(country)
+        except (KeyError, TypeError, AttributeError, IndexError) as e:
+            logger.warning("Skipping country %s: %s", code, e)
+    by_name = {
+        values["name"].lower(): code for code, values in fetched.items() if isinstance(values["name"], str)
+    }
+
+    summary = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0}
+    records = []
+    seen = set()
+    for record in current:
+        code = record.get("country_code")
+        if code is None and isinstance(record.get("name"), str):
+            code = by_name.get(record["name"].lower())
+        if code is None or code in seen:
+            # Not a country from restcountries (or a duplicate); keep it
+            records.append(record)
+            summary["unchanged"] += 1
+            continue
+        values = fetched.get(code)
+        if values is None:
+            # Synced before but no longer upstream
+            summary["removed"] += 1
+            continue
+        seen.add(code)
+        if all(record.get(field) == values[field] for field in SYNCED_FIELDS):
+            records.append(record)
+            summary["unchanged"] += 1
+        else:
+            records.append(dict(record, **values, updated_at=now))
+            summary["updated"] += 1
+
+    ids = {record.get("id") for record in records}
+    for code in sorted(set(fetched) - seen):
+        record_id = f"dest-{code.lower()}"
+        if record_id in ids:
+            logger.warning("Skipping country %s: id %s is taken", code, record_id)
+            continue
+        ids.add(record_id)
+        records.append(dict(id=record_id, **fetched[code], created_at=now, updated_at=now))
+        summary["added"] += 1
+    return records, summary
+
+
+@offload
+def write_destinations(records: List[dict]):
+    # Write atomically so readers never see a partial file
+    path = os.path.join(catalog.data_dir, destinations_file)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, "w") as f:
+        json.dump(records, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _read_state() -> dict:
+    try:
+        with open(state_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_state(state: dict):
+    tmp_path = f"{state_path}.tmp-{os.getpid()}"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, state_path)
+
+
+def last_success() -> float:
+    """
+    Unix time of the last successful sync by any worker (the data file's
+    modification time before the first one).
+    """
+    state = _read_state()
+    if "last_success" in state:
+        return state["last_success"]
+    try:
+        return os.path.getmtime(os.path.join(catalog.data_dir, destinations_file))
+    except OSError:
+        return 0.0
+
+
+class _WorkerLock:
+    """
+    Non-blocking file lock so only one worker on the host syncs at a time.
+    """
+
+    def __enter__(self):
+        self._file = None
+        if fcntl is None:
+            return True
+        os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+        self._file = open(lock_path, "w")
+        try:
+            fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._file.close()
+            self._file = None
+            return False
+        return True
+
+    def __exit__(self, *exc):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+
+
+async def sync(dry_run: bool = False) -> Optional[dict]:
+    """
+    Run one sync and return its summary, or None if another worker is
+    already syncing.
+    """
+    global _lock
+    if _lock is None:
+        _lock = asyncio.Lock()
+    async with _lock:
+        with _WorkerLock() as acquired:
+            if not acquired:
+                return None
+            started = time.perf_counter()
+            try:
+                countries = await fetch_countries()
+                if not countries:
+                    raise upstream.UpstreamError("restcountries", "empty country list")
+                current = (await catalog.reload(force=False)).destinations.to_dicts()
+                records, summary = await run_blocking(diff, current, countries, datetime.now().isoformat())
+                changed = summary["added"] or summary["updated"] or summary["removed"]
+                if changed and not dry_run:
+                    await write_destinations(records)
+                    # Only the destinations table is rebuilt
+                    await catalog.reload(force=False)
+            except Exception:
+                SYNC_RUNS.labels("error").inc()
+                raise
+            SYNC_RUNS.labels("changed" if changed else "unchanged").inc()
+            if dry_run:
+                return summary
+            for change in ("added", "updated", "removed"):
+                SYNC_CHANGES.labels(change).inc(summary[change])
+            now = time.time()
+            SYNC_LAST_SUCCESS.set(now)
+            summary["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            await run_blocking(_write_state, {"last_success": now, "summary": summary})
+            logger.info("Destination sync finished: %s", summary)
+            return summary
+
+
+async def _run():
+    failures = 0
+    delay = max(last_success() + sync_interval - time.time(), startup_delay * random.uniform(1, 2))
+    while True:
+        try:
+            await asyncio.wait_for(_wake.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+        _wake.clear()
+        try:
+            summary = await sync()
+            failures = 0
+        except Exception as e:
+            failures += 1
+            logger.error("Destination sync failed: %s", e)
+        if failures:
+            delay = min(retry_delay * 2 ** (failures - 1), sync_interval)
+        elif summary is None:
+            # Another worker is syncing: check again once it has likely
+            # finished rather than as soon as the lock is busy
+            delay = min(retry_delay * random.uniform(1, 2), sync_interval)
+        else:
+            delay = max(last_success() + sync_interval - time.time(), min(retry_delay, sync_interval))
+
+
+def start():
+    """
+    Start the periodic sync in the background; called from the app lifespan.
+    The first sync runs after the startup delay, or earlier on
+    ``request_sync``.
+    """
+    global _task, _wake
+    if not sync_enabled or not sync_interval:
+        return None
+    if _task is None or _task.done():
+        _wake = asyncio.Event()
+        _task = asyncio.get_running_loop().create_task(_run())
+    return _task
+
+
+async def stop():
+    global _task
+    if _task is not None and not _task.done():
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+    _task = None
+
+
+def request_sync():
+    """
+    Ask the background task to sync now (e.g. because there is no data).
+    """
+    if _wake is not None:
+        _wake.set()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sync destinations from restcountries")
+    parser.add_argument("--dry-run", action="store_true", help="Print the changes without applying them")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    summary = asyncio.run(sync(dry_run=args.dry_run))
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""
+Server-sent event feeds that are computed once per tick and fanned out.
+
+A ``FeedHub`` keeps one ``Feed`` per key (e.g. per flight origin) while it
+has subscribers. Each tick the feed computes its entries once, diffs them
+against the previous tick and keeps the resulting delta (changed entries and
+removed ids), pre-encoded, in a short shared history.
+
+Subscribers hold no queue of their own, only the version they have sent up
+to, so idle connections cost little more than their coroutine. A subscriber
+one tick behind sends the shared delta; one that fell further behind (a slow
+connection whose sends were blocked) gets the deltas merged into one, or a
+full snapshot once it is behind the whole history. Slow clients therefore
+skip intermediate updates instead of buffering them, and a send that stays
+blocked for ``send_timeout`` closes the connection.
+
+Clients resuming with ``Last-Event-ID`` get the deltas they missed when they
+are still in the history.
+"""
+import asyncio
+import json
+import logging
+import secrets
+import time
+from collections import deque
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Optional
+
+from fastapi import HTTPException, status
+from fastapi.responses import StreamingResponse
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+STREAM_SUBSCRIBERS = metrics.registry.gauge(
+    "tourease_stream_subscribers",
+    "Open event stream connections",
+    ["feed"],
+)
+STREAM_SNAPSHOTS = metrics.registry.counter(
+    "tourease_stream_snapshots_total",
+    "Full snapshots sent, on connect or to subscribers that fell behind",
+    ["feed", "reason"],
+)
+STREAM_SLOW_CLOSED = metrics.registry.counter(
+    "tourease_stream_slow_closed_total",
+    "Event stream connections closed because a send stayed blocked",
+    ["feed"],
+)
+
+
+def _encode(event: str, event_id: str, data: dict) -> bytes:
+    return f"event: {event}\nid: {event_id}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode()
+
+
+class Feed:
+    """
+    Entries for one key, recomputed once per tick while subscribed.
+    """
+
+    def __init__(self, hub: "FeedHub", key: str):
+        self.hub = hub
+        self.key = key
+        # Event ids are "<epoch>-<version>"; a resumed stream from another
+        # worker or an earlier feed for the key has a different epoch
+        self.epoch = secrets.token_hex(4)
+        self.version = 0
+        self.entries: Dict[str, dict] = {}
+        self.updated_at: Optional[str] = None
+        # (version, changed entries by id, removed ids, encoded delta event)
+        self.history: deque = deque(maxlen=hub.history)
+        self.subscribers = 0
+        self._snapshot: Optional[bytes] = None
+        self._published = asyncio.get_running_loop().create_future()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+        if not self._published.done():
+            self._published.cancel()
+
+    async def _run(self):
+        tick_seconds = self.hub.tick_seconds
+        while True:
+            tick = int(time.time() // tick_seconds)
+            try:
+                self.publish(await self.hub.compute(self.key, tick))
+            except Exception as e:
+                logger.error("Computing %s feed %s failed: %s", self.hub.name, self.key, e)
+            # Ticks are aligned so every feed updates at the same moments
+            await asyncio.sleep((tick + 1) * tick_seconds - time.time())
+
+    def publish(self, entries: Dict[str, dict]):
+        """
+        Store a new tick's entries and wake subscribers if anything changed.
+        """
+        previous = self.entries
+        changed = {key: entry for key, entry in entries.items() if previous.get(key) != entry}
+        removed = [key for key in previous if key not in entries]
+        if self.version and not changed and not removed:
+            return
+        self.version += 1
+        self.entries = entries
+        self.updated_at = datetime.now().isoformat()
+        self._snapshot = None
+        delta = {"key": self.key, "updated_at": self.updated_at, "changed": list(changed.values()), "removed": removed}
+        self.history.append((self.version, changed, removed, _encode("delta", self.event_id(), delta)))
+        published, self._published = self._published, asyncio.get_running_loop().create_future()
+        published.set_result(self.version)
+
+    def event_id(self) -> str:
+        return f"{self.epoch}-{self.version}"
+
+    def resume_version(self, last_event_id: Optional[str]) -> int:
+        """
+        Version a client reconnecting with ``Last-Event-ID`` has seen, or -1.
+        """
+        epoch, _, version = (last_event_id or "").partition("-")
+        if epoch != self.epoch or not version.isdigit():
+            return -1
+        return int(version)
+
+    def snapshot(self) -> bytes:
+        if self._snapshot is None:
+            self._snapshot = _encode("snapshot", self.event_id(), {
+                "key": self.key, "updated_at": self.updated_at, "entries": list(self.entries.values()),
+            })
+        return self._snapshot
+
+    def events_since(self, version: int) -> Optional[bytes]:
+        """
+        What a subscriber that has sent up to ``version`` should send next
+        (None when it is up to date).
+        """
+        if version == self.version or self.version == 0:
+            return None
+        if not self.history or version < self.history[0][0] - 1 or version > self.version:
+            STREAM_SNAPSHOTS.labels(self.hub.name, "connect" if version < 0 else "behind").inc()
+            return self.snapshot()
+        missed = [item for item in self.history if item[0] > version]
+        if len(missed) == 1:
+            return missed[0][3]
+        # Merge the deltas the subscriber missed into one
+        changed: Dict[str, dict] = {}
+        removed = set()
+        for _, delta_changed, delta_removed, _ in missed:
+            for key in delta_removed:
+                changed.pop(key, None)
+                removed.add(key)
+            for key, entry in delta_changed.items():
+                removed.discard(key)
+                changed[key] = entry
+        return _encode("delta", self.event_id(), {
+            "key": self.key, "updated_at": self.updated_at,
+            "changed": list(changed.values()), "removed": sorted(removed),
+        })
+
+    async def wait(self, version: int, timeout: float) -> bool:
+        """
+        Wait until there is something newer than ``version``; False on timeout.
+        """
+        if self.version != version:
+            return True
+        done, _ = await asyncio.wait({self._published}, timeout=timeout)
+        return bool(done)
+
+
+class FeedHub:
+    """
+    Feeds by key with a cap on subscribers and on distinct keys.
+    """
+
+    def __init__(self, name: str, compute: Callable[[str, int], Awaitable[Dict[str, dict]]],
+                 tick_seconds: float = 5.0, max_subscribers: int = 10000, max_feeds: int = 256,
+                 history: int = 8, heartbeat: float = 15.0, send_timeout: float = 30.0):
+        self.name = name
+        self.compute = compute
+        self.tick_seconds = tick_seconds
+        self.max_subscribers = max_subscribers
+        self.max_feeds = max_feeds
+        self.history = history
+        self.heartbeat = heartbeat
+        self.send_timeout = send_timeout
+        self.feeds: Dict[str, Feed] = {}
+        self.subscribers = 0
+        STREAM_SUBSCRIBERS.labels(name).set_function(lambda: self.subscribers)
+
+    def _full(self, detail):
+        return HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=detail, headers={"Retry-After": "30"},
+        )
+
+    def subscribe(self, key: str) -> Feed:
+        if self.subscribers >= self.max_subscribers:
+            raise self._full("Too many open streams, retry later")
+        feed = self.feeds.get(key)
+        if feed is None:
+            if len(self.feeds) >= self.max_feeds:
+                raise self._full("Too many different streams open, retry later")
+            feed = self.feeds[key] = Feed(self, key)
+            feed.start()
+        feed.subscribers += 1
+        self.subscribers += 1
+        return feed
+
+    def unsubscribe(self, feed: Feed):
+        feed.subscribers -= 1
+        self.subscribers -= 1
+        if feed.subscribers == 0 and self.feeds.get(feed.key) is feed:
+            del self.feeds[feed.key]
+            feed.stop()
+
+    async def _events(self, feed: Feed, version: int):
+        while True:
+            chunk = feed.events_since(version)
+            if chunk is not None:
+                version = feed.version
+                yield chunk
+            elif not await feed.wait(version, self.heartbeat):
+                # Comment line: keeps proxies from closing an idle stream
+                yield b": keep-alive\n\n"
+
+    def stream(self, key: str, last_event_id: Optional[str] = None) -> "EventStreamResponse":
+        """
+        Subscribe to ``key`` and return the streaming response; raises 503
+        when the hub is full.
+        """
+        feed = self.subscribe(key)
+        return EventStreamResponse(self._events(feed, feed.resume_version(last_event_id)), self, feed)
+
+
+class EventStreamResponse(StreamingResponse):
+    """
+    ``text/event-stream`` response that closes the connection when a send
+    stays blocked for the hub's ``send_timeout``.
+    """
+
+    def __init__(self, content, hub: FeedHub, feed: Feed):
+        super().__init__(
+            content,
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+        self.hub = hub
+        self.feed = feed
+
+    async def stream_response(self, send):
+        async def send_with_timeout(message):
+            await asyncio.wait_for(send(message), self.hub.send_timeout)
+
+        try:
+            await super().stream_response(send_with_timeout)
+        except asyncio.TimeoutError:
+            # Returning without finishing the response makes the server
+            # close the connection
+            STREAM_SLOW_CLOSED.labels(self.hub.name).inc()
+            logger.warning("Closed %s stream %s: client stopped reading", self.hub.name, self.feed.key)
+        finally:
+            self.hub.unsubscribe(self.feed)
@@ -0,0 +1,142 @@
+"""
+Sparse fieldsets: the ``fields=`` query parameter of list and detail
+endpoints, e.g. ``fields=id,name,price,contact.email``.
+
+Catalog rows are projected to the requested fields before anything else is
+done with them (``catalog.Table.projector``), and endpoints with a response
+model validate and serialize the projection with a copy of the model that
+only has those fields. Projectors and restricted models are built once per
+field set and reused, so the cost of a response follows what was asked for.
+"""
+import functools
+from typing import Dict, List, Optional, Tuple, Type
+
+from fastapi import HTTPException, Query, Response, status
+from pydantic import BaseModel, TypeAdapter, create_model
+
+# Most paths accepted in one fields= parameter
+max_fields = 64
+
+# Restricted models and dict projectors kept per field set
+cache_size = 256
+
+
+def fields_param(
+    fields: Optional[str] = Query(
+        None,
+        max_length=1024,
+        description="Comma-separated fields to return (dotted paths for nested fields, e.g. contact.email)",
+    ),
+) -> Optional[Tuple[str, ...]]:
+    """
+    Dependency parsing ``fields=`` into a normalized tuple of paths (None
+    when absent), so equivalent field sets share a projector; 422 when it
+    names no field.
+    """
+    if fields is None:
+        return None
+    paths = tuple(sorted({path.strip() for path in fields.split(",") if path.strip()}))
+    if not paths:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_CONTENT,
+            detail="No fields requested; leave out fields= to get every field"
+        )
+    if len(paths) > max_fields:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_CONTENT,
+            detail=f"At most {max_fields} fields can be requested"
+        )
+    return paths
+
+
+def _group(paths):
+    # Top-level key -> None for the whole value, or the nested keys wanted
+    wanted: Dict[str, Optional[set]] = {}
+    for path in paths:
+        top, _, sub = path.partition(".")
+        if not sub:
+            wanted[top] = None
+        elif wanted.get(top, ()) is not None:
+            wanted.setdefault(top, set()).add(sub)
+    return wanted
+
+
+def projector(table, paths):
+    """
+    The table's compiled projector for ``paths``; 422 for unknown fields.
+    """
+    try:
+        return table.projector(paths)
+    except KeyError as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_CONTENT,
+            detail=f"Unknown field '{e.args[0]}'; available fields: {', '.join(table.field_paths())}"
+        )
+
+
+def project_rows(table, rows, paths) -> List[dict]:
+    """
+    Dicts with only ``paths`` for catalog rows of ``table``.
+    """
+    project = projector(table, paths)
+    return [project(row.index) for row in rows]
+
+
+@functools.lru_cache(maxsize=cache_size)
+def restricted_model(model: Type[BaseModel], paths: Tuple[str, ...]) -> Type[BaseModel]:
+    """
+    Copy of ``model`` with only the fields in ``paths``; nested models are
+    restricted to the dotted paths below them.
+    """
+    wanted = _group(paths)
+    fields = {}
+    for name, field in model.model_fields.items():
+        if name not in wanted:
+            continue
+        annotation = field.annotation
+        subs = wanted[name]
+        if subs is not None and isinstance(annotation, type) and issubclass(annotation, BaseModel):
+            annotation = restricted_model(annotation, tuple(sorted(subs)))
+        fields[name] = (annotation, field)
+    return create_model(f"{model.__name__}Fields", **fields)
+
+
+@functools.lru_cache(maxsize=cache_size)
+def _adapter(model, paths, many):
+    restricted = restricted_model(model, paths)
+    return TypeAdapter(List[restricted] if many else restricted)
+
+
+def model_response(model: Type[BaseModel], data, paths) -> Response:
+    """
+    Validate and serialize projected ``data`` (a dict or a list of dicts)
+    with ``model`` restricted to ``paths``.
+    """
+    adapter = _adapter(model, paths, isinstance(data, list))
+    return Response(adapter.dump_json(adapter.validate_python(data)), media_type="application/json")
+
+
+@functools.lru_cache(maxsize=cache_size)
+def dict_projector(paths: Tuple[str, ...]):
+    """
+    Compiled projector for plain dicts (computed or cached responses);
+    fields a dict doesn't have are left out.
+    """
+    steps = [(key, subs if subs is None else sorted(subs)) for key, subs in _group(paths).items()]
+
+    def project(item):
+        result = {}
+        for key, subs in steps:
+            if key in item:
+                value = item[key]
+                if subs is not None and isinstance(value, dict):
+                    value = {sub: value[sub] for sub in subs if sub in value}
+                result[key] = value
+        return result
+
+    return project
+
+
+def project_dicts(items, paths) -> List[dict]:
+    project = dict_projector(paths)
+    return [project(item) for item in items]
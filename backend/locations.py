@@ -0,0 +1,204 @@
+"""
+Resolution of free-text tour locations ("Rome, Italy") to destination ids,
+and a reverse index from destinations to their tours.
+
+Destinations are countries. Each one contributes aliases: its name, its
+capital, its country code and a few common variants ("USA", "Holland").
+Aliases are normalized like search suggestions (case-folded, accents
+stripped). A location is matched against every run of its words. A country
+alias beats a capital, and among equals the match furthest right wins, since
+locations end with the country. An alias shared by several destinations
+doesn't resolve. Country codes only match a whole comma-separated part.
+
+The index is built per catalog snapshot off the event loop, and only when
+the tours or destinations table changed. Locations that don't resolve are
+logged and reported by ``unresolved``.
+"""
+import logging
+import threading
+import time
+from array import array
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from suggestions import normalize
+
+logger = logging.getLogger(__name__)
+
+# Alias priorities: lower wins
+COUNTRY = 0
+CAPITAL = 1
+
+# Common names of countries not covered by their restcountries common name,
+# by that name
+VARIANTS = {
+    "United States": ("usa", "us", "u s a", "united states of america", "america"),
+    "United Kingdom": ("uk", "great britain", "britain", "england", "scotland", "wales", "northern ireland"),
+    "Netherlands": ("holland", "the netherlands"),
+    "Czechia": ("czech republic",),
+    "Turkey": ("turkiye",),
+    "Türkiye": ("turkey",),
+    "South Korea": ("korea", "republic of korea"),
+    "Russia": ("russian federation",),
+    "United Arab Emirates": ("uae", "emirates"),
+    "Ivory Coast": ("cote d ivoire",),
+    "Vatican City": ("vatican", "holy see"),
+    "Myanmar": ("burma",),
+    "Eswatini": ("swaziland",),
+    "North Macedonia": ("macedonia",),
+    "Cape Verde": ("cabo verde",),
+    "Timor-Leste": ("east timor",),
+    "DR Congo": ("democratic republic of the congo",),
+    "China": ("people s republic of china", "prc"),
+    "Vietnam": ("viet nam",),
+    "Laos": ("lao pdr",),
+    "South Africa": ("rsa",),
+    "Brazil": ("brasil",),
+    "Italy": ("italia",),
+    "Spain": ("espana",),
+    "Germany": ("deutschland",),
+    "Japan": ("nippon",),
+}
+
+
+class Alias(NamedTuple):
+    priority: int
+    destination_ids: Tuple[str, ...]
+
+
+def _add(aliases, text, priority, destination_id):
+    key = normalize(text)
+    if not key:
+        return
+    current = aliases.get(key)
+    if current is None or priority < current.priority:
+        aliases[key] = Alias(priority, (destination_id,))
+    elif priority == current.priority and destination_id not in current.destination_ids:
+        aliases[key] = Alias(priority, current.destination_ids + (destination_id,))
+
+
+class LocationIndex:
+    """
+    Tour locations resolved to destination ids for one pair of tables, with
+    each destination's tours in rating order.
+    """
+
+    def __init__(self, destinations, tours):
+        self.destinations = destinations
+        self.tours = tours
+        self.aliases: Dict[str, Alias] = {}
+        self.codes: Dict[str, Alias] = {}
+        for row in destinations:
+            destination_id = row.get("id")
+            if not isinstance(destination_id, str):
+                continue
+            name = row.get("name")
+            if isinstance(name, str):
+                _add(self.aliases, name, COUNTRY, destination_id)
+                for variant in VARIANTS.get(name, ()):
+                    _add(self.aliases, variant, COUNTRY, destination_id)
+            capital = row.get("capital")
+            if isinstance(capital, str):
+                _add(self.aliases, capital, CAPITAL, destination_id)
+                # "Washington, D.C." is usually written "Washington"
+                _add(self.aliases, capital.split(",")[0], CAPITAL, destination_id)
+            code = row.get("country_code")
+            if isinstance(code, str):
+                _add(self.codes, code, COUNTRY, destination_id)
+        self.max_words = max((key.count(" ") + 1 for key in self.aliases), default=1)
+
+        # Resolve each distinct location once
+        self.resolved: Dict[str, Optional[str]] = {}
+        by_destination: Dict[str, List[int]] = {}
+        self.unresolved: Dict[str, List[str]] = {}
+        for row in tours:
+            location = row.get("location")
+            if not isinstance(location, str):
+                continue
+            if location not in self.resolved:
+                self.resolved[location] = self.resolve(location)
+            destination_id = self.resolved[location]
+            if destination_id is None:
+                self.unresolved.setdefault(location, []).append(row.get("id"))
+            else:
+                by_destination.setdefault(destination_id, []).append(row.index)
+        self.by_destination: Dict[str, array] = {
+            destination_id: array("I", sorted(rows, key=lambda i: tours.row(i).get("rating") or 0, reverse=True))
+            for destination_id, rows in by_destination.items()
+        }
+
+    def resolve(self, location: str) -> Optional[str]:
+        """
+        Destination id a location refers to (None when unknown or ambiguous).
+        """
+        best = None
+        best_rank = None
+        position = 0
+        for part in location.split(","):
+            words = normalize(part).split()
+            if not words:
+                continue
+            candidates = []
+            code = self.codes.get(" ".join(words))
+            if code is not None:
+                candidates.append((code, position + len(words), len(words)))
+            for start in range(len(words)):
+                for end in range(start + 1, min(start + self.max_words, len(words)) + 1):
+                    alias = self.aliases.get(" ".join(words[start:end]))
+                    if alias is not None:
+                        candidates.append((alias, position + end, end - start))
+            for alias, end, length in candidates:
+                rank = (alias.priority, -end, -length)
+                if best_rank is None or rank < best_rank:
+                    best, best_rank = alias, rank
+            position += len(words)
+        if best is None or len(best.destination_ids) != 1:
+            return None
+        return best.destination_ids[0]
+
+    def tour_rows(self, destination_id: str) -> array:
+        """
+        Table rows of the destination's tours, highest rated first.
+        """
+        return self.by_destination.get(destination_id, array("I"))
+
+    def unresolved_report(self) -> List[dict]:
+        return [
+            {"location": location, "tours": len(tour_ids), "tour_ids": tour_ids}
+            for location, tour_ids in sorted(self.unresolved.items(), key=lambda item: -len(item[1]))
+        ]
+
+
+_index: Optional[LocationIndex] = None
+_build_lock = threading.Lock()
+
+
+def is_current(index: Optional[LocationIndex], snapshot) -> bool:
+    return index is not None and index.destinations is snapshot.destinations and index.tours is snapshot.tours
+
+
+def index_for(snapshot) -> LocationIndex:
+    """
+    The index for a catalog snapshot, rebuilt when its tours or destinations
+    changed (blocking; call off the event loop).
+    """
+    global _index
+    with _build_lock:
+        index = _index
+        if is_current(index, snapshot):
+            return index
+        started = time.perf_counter()
+        index = LocationIndex(snapshot.destinations, snapshot.tours)
+        _index = index
+        logger.info("Location index built for %d locations in %.0f ms",
+                    len(index.resolved), (time.perf_counter() - started) * 1000)
+        if index.unresolved:
+            logger.warning("%d tour locations don't match a destination, e.g. %s",
+                           len(index.unresolved), ", ".join(repr(location) for location in list(index.unresolved)[:5]))
+        return index
+
+
+def current() -> Optional[LocationIndex]:
+    """
+    The last built index (None before the first build).
+    """
+    return _index
@@ -0,0 +1,188 @@
+import asyncio
+import functools
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Sampling interval of the lag probe and the lag that counts as a stall
+probe_interval = float(os.environ.get("LOOP_PROBE_INTERVAL_MS", 50)) / 1000
+stall_threshold = float(os.environ.get("LOOP_STALL_THRESHOLD_MS", 100)) / 1000
+
+# Bounded pool for blocking helpers moved off the event loop
+blocking_pool_size = int(os.environ.get("BLOCKING_POOL_SIZE", 8))
+
+EVENT_LOOP_LAG = metrics.registry.histogram(
+    "tourease_event_loop_lag_seconds",
+    "Delay between when the event loop probe was due and when it ran",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+EVENT_LOOP_LAG_CURRENT = metrics.registry.gauge(
+    "tourease_event_loop_lag_current_seconds",
+    "Most recent event loop lag measurement",
+)
+EVENT_LOOP_STALLS = metrics.registry.counter(
+    "tourease_event_loop_stalls_total",
+    "Event loop stalls over the threshold, by the request holding the loop",
+    ["route"],
+)
+BLOCKING_PENDING = metrics.registry.gauge(
+    "tourease_blocking_pool_pending",
+    "Blocking calls submitted to the executor and not yet finished",
+)
+
+# ASGI scope of the request owning each task, used to attribute stalls
+_task_scopes = weakref.WeakKeyDictionary()
+
+
+def tag_current_task(scope):
+    task = asyncio.current_task()
+    if task is not None:
+        _task_scopes[task] = scope
+
+
+class LoopMonitor:
+    """
+    Measures event loop lag with a periodic probe and runs a watchdog thread
+    that, while the loop is stuck, captures the loop thread's stack and the
+    request owning the running task.
+    """
+
+    def __init__(self, interval=probe_interval, threshold=stall_threshold):
+        self.interval = interval
+        self.threshold = threshold
+        self.lag = 0.0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id = None
+        self._last_beat = time.monotonic()
+        self._probe_task = None
+        self._watchdog = None
+        self._stopped = threading.Event()
+
+    async def _probe(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._last_beat = now
+            self.lag = max(now - expected, 0.0)
+            EVENT_LOOP_LAG.observe(self.lag)
+            EVENT_LOOP_LAG_CURRENT.set(self.lag)
+
+    def current_lag(self) -> float:
+        """
+        Latest lag measurement, or how long the loop has gone without a probe
+        beat if that is longer (the probe can't report while the loop is stuck).
+        Without a running probe (not started, or stopped) there is nothing to
+        be overdue.
+        """
+        if self._probe_task is None or self._probe_task.done():
+            return self.lag
+        overdue = time.monotonic() - self._last_beat - self.interval
+        return max(self.lag, overdue)
+
+    def _watch(self):
+        reported_beat = None
+        while not self._stopped.wait(self.threshold / 2):
+            beat = self._last_beat
+            blocked_for = time.monotonic() - beat - self.interval
+            if blocked_for < self.threshold or beat == reported_beat:
+                continue
+            # Report each stall once, while the offending code is still running
+            reported_beat = beat
+            self._report_stall(blocked_for)
+
+    def _report_stall(self, blocked_for):
+        route, request = "background", "no request"
+        try:
+            task = asyncio.current_task(self._loop)
+        except RuntimeError:
+            task = None
+        scope = _task_scopes.get(task) if task is not None else None
+        if scope is not None:
+            # Routing has normally run by the time a handler blocks the loop
+            route = metrics.route_label(scope.get("route"))
+            request = f"{scope['method']} {scope['path']}"
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = "".join(traceback.format_stack(frame, limit=25)) if frame else ""
+        EVENT_LOOP_STALLS.labels(route).inc()
+        logger.warning(
+            "Event loop blocked for %.0f ms by %s (route %s)\n%s",
+            blocked_for * 1000, request, route, stack
+        )
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stopped.clear()
+        self._probe_task = self._loop.create_task(self._probe())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        self._stopped.set()
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            try:
+                await self._probe_task
+            except asyncio.CancelledError:
+                pass
+            self._probe_task = None
+
+
+monitor = LoopMonitor()
+
+
+class LoopMonitorMiddleware:
+    """
+    ASGI middleware tagging the running task with the request it serves, so
+    the watchdog can name the handler that held the loop.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            tag_current_task(scope)
+        await self.app(scope, receive, send)
+
+
+_executor = ThreadPoolExecutor(max_workers=blocking_pool_size, thread_name_prefix="blocking")
+
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Run a blocking callable in the bounded executor and await its result.
+    """
+    loop = asyncio.get_running_loop()
+    BLOCKING_PENDING.inc()
+    try:
+        return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+    finally:
+        BLOCKING_PENDING.dec()
+
+
+def offload(func):
+    """
+    Mark a blocking helper to run in the bounded executor.
+
+    The decorated function becomes a coroutine function; the original is kept
+    as ``.sync`` for callers that are already off the loop.
+    """
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_blocking(func, *args, **kwargs)
+
+    wrapper.sync = func
+    return wrapper
@@ -1,13 +1,51 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
+from contextlib import asynccontextmanager
 from pydantic import BaseModel
 from datetime import datetime
 import os
 import json
-import uvicorn
+import logging
+import time
+
+# Needed to build the middleware stack and routes when the app is created,
+# so imported eagerly; they only define classes and read config. Anything
+# slow to import or build (httpx, NumPy, the solvers, catalog data, search
+# indexes) is loaded on first use or by warmup.
+import admission
+import bookings
+import metrics
+import microcache
+import profiling
+import destination_sync
+import loop_monitor
+import upstream
+import warmup
+
+logger = logging.getLogger(__name__)
 
 # Import routers
-from routers import tour_guides, tours, destinations
+from routers import tour_guides, tours, destinations, admin, batch, search, changes, home, export
+from routers import bookings as bookings_router
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Start measuring event loop lag once the loop is running
+    loop_monitor.monitor.start()
+    # Load heavy modules and data in the background so the server starts
+    # accepting connections (and health checks) right away
+    warmup.start()
+    # Refresh destination data from restcountries periodically
+    destination_sync.start()
+    yield
+    await destination_sync.stop()
+    await warmup.stop()
+    await upstream.close()
+    # Write bookings still queued
+    await bookings.stop()
+    destinations.shutdown_route_optimizer()
+    await loop_monitor.monitor.stop()
 
 app = FastAPI(
     title="TourEase API",
@@ -15,8 +53,13 @@ app = FastAPI(
     version="0.1.0",
     docs_url="/docs",
     redoc_url="/redoc",
+    lifespan=lifespan,
 )
 
+# Serve bursts of identical catalog GETs from a short-lived cache (innermost,
+# so CORS headers are still added per request)
+app.add_middleware(microcache.MicroCacheMiddleware)
+
 # CORS configuration
 app.add_middleware(
     CORSMiddleware,
@@ -26,6 +69,25 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Attribute event loop stalls to the request holding the loop
+app.add_middleware(loop_monitor.LoopMonitorMiddleware)
+
+# On-demand and slow-request profiling (no-op unless enabled)
+app.add_middleware(profiling.ProfilingMiddleware)
+
+# Shed load for the whole worker when it is overloaded (health checks are
+# always admitted; per-router limits are set in each router)
+app.add_middleware(admission.AdmissionMiddleware)
+
+# Give each request a time budget for its upstream calls
+app.add_middleware(upstream.DeadlineMiddleware)
+
+# Per-route latency and in-flight metrics
+app.add_middleware(metrics.MetricsMiddleware, router=app.router)
+
+# Upstream failures without a stale fallback: 502/503/504 instead of 500
+app.add_exception_handler(upstream.UpstreamError, upstream.error_handler)
+
 # Health check model
 class HealthCheck(BaseModel):
     status: str
@@ -39,12 +101,16 @@ def load_data(file_name):
     if not os.path.exists(file_path):
         return []
     
+    started = time.perf_counter()
     try:
         with open(file_path, 'r') as f:
-            return json.load(f)
+            data = json.load(f)
     except Exception as e:
-        print(f"Error loading {file_name}: {str(e)}")
+        logger.error("Error loading %s: %s", file_name, e)
+        metrics.observe_data_load(file_name, started, None)
         return []
+    metrics.observe_data_load(file_name, started, len(data))
+    return data
 
 # Root endpoint
 @app.get("/", tags=["Root"])
@@ -63,11 +129,31 @@ async def health_check():
         timestamp=datetime.now()
     )
 
+# Readiness endpoint: 503 until background warm-up has finished
+@app.get("/ready", tags=["Health"])
+async def readiness_check():
+    ready = warmup.is_ready()
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "warming", "steps": warmup.status()}
+    )
+
+# Metrics endpoint (Prometheus text format)
+@app.get("/metrics", tags=["Health"], include_in_schema=False)
+async def get_metrics():
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 # Include routers
 app.include_router(tour_guides.router)
 app.include_router(tours.router)
 app.include_router(destinations.router)
-# app.include_router(bookings.router)
+app.include_router(admin.router)
+app.include_router(bookings_router.router)
+app.include_router(batch.router)
+app.include_router(search.router)
+app.include_router(changes.router)
+app.include_router(home.router)
+app.include_router(export.router)
 
 if __name__ == "__main__":
     # Ensure data directory exists
@@ -83,4 +169,5 @@ if __name__ == "__main__":
         except ImportError:
             print("Warning: initialize_data.py not found or failed to run.")
     
+    import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file
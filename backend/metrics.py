@@ -0,0 +1,409 @@
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Prometheus text exposition format for the /metrics endpoint.
+#
+# Updates on the hot path are plain list/attribute increments with no locks.
+# Request handling happens on the event loop thread, so increments never race
+# there; helpers running on executor threads can at worst lose a rare
+# increment under the GIL, which is an acceptable trade for metrics.
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if value == float("-inf"):
+        return "-Inf"
+    return repr(float(value))
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape_label(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.extend(f'{n}="{_escape_label(v)}"' for n, v in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount=1.0):
+        self.value += amount
+
+
+class _GaugeChild:
+    __slots__ = ("value", "function")
+
+    def __init__(self):
+        self.value = 0.0
+        self.function = None
+
+    def inc(self, amount=1.0):
+        self.value += amount
+
+    def dec(self, amount=1.0):
+        self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+    def set_function(self, function: Callable[[], float]):
+        """
+        Read the gauge from a callback at scrape time instead of tracking it.
+        """
+        self.function = function
+
+    def get(self):
+        if self.function is not None:
+            return self.function()
+        return self.value
+
+
+class _HistogramChild:
+    __slots__ = ("upper_bounds", "counts", "sum")
+
+    def __init__(self, upper_bounds):
+        self.upper_bounds = upper_bounds
+        # One slot per bucket plus the implicit +Inf bucket
+        self.counts = [0] * (len(upper_bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.upper_bounds, value)] += 1
+        self.sum += value
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class _Metric:
+    kind = ""
+    child_class = None
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+
+    def _new_child(self):
+        return self.child_class()
+
+    def labels(self, *values):
+        """
+        Return the child for the given label values, creating it on first use.
+
+        Callers on hot paths should keep the returned child instead of looking
+        it up per request.
+        """
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _unlabelled(self):
+        if self.labelnames:
+            raise ValueError(f"{self.name} requires labels {self.labelnames}")
+        return self._children[()]
+
+    def collect(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        for values, child in list(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+    def _render_child(self, values, child) -> Iterable[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+    child_class = _CounterChild
+
+    def inc(self, amount=1.0):
+        self._unlabelled().inc(amount)
+
+    def _render_child(self, values, child):
+        yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+    child_class = _GaugeChild
+
+    def inc(self, amount=1.0):
+        self._unlabelled().inc(amount)
+
+    def dec(self, amount=1.0):
+        self._unlabelled().dec(amount)
+
+    def set(self, value):
+        self._unlabelled().set(value)
+
+    def set_function(self, function):
+        self._unlabelled().set_function(function)
+
+    def _render_child(self, values, child):
+        try:
+            value = child.get()
+        except Exception:
+            return
+        yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(float(value))}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_LATENCY_BUCKETS):
+        self.upper_bounds = tuple(sorted(float(b) for b in buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.upper_bounds)
+
+    def observe(self, value):
+        self._unlabelled().observe(value)
+
+    def time(self):
+        return self._unlabelled().time()
+
+    def _render_child(self, values, child):
+        counts = list(child.counts)
+        cumulative = 0
+        for bound, count in zip(self.upper_bounds + (float("inf"),), counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, values, [("le", _format_value(bound))])
+            yield f"{self.name}_bucket{labels} {cumulative}"
+        labels = _format_labels(self.labelnames, values)
+        yield f"{self.name}_sum{labels} {_format_value(child.sum)}"
+        yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# HTTP request metrics
+HTTP_REQUEST_DURATION = registry.histogram(
+    "tourease_http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route", "status"],
+)
+HTTP_REQUESTS_IN_FLIGHT = registry.gauge(
+    "tourease_http_requests_in_flight",
+    "HTTP requests currently being handled",
+    ["method", "route"],
+)
+
+# Response cache metrics
+CACHE_HITS = registry.counter("tourease_cache_hits_total", "Cache hits", ["cache"])
+CACHE_MISSES = registry.counter("tourease_cache_misses_total", "Cache misses", ["cache"])
+CACHE_SIZE = registry.gauge("tourease_cache_entries", "Entries held in a cache", ["cache"])
+
+# Upstream API metrics
+UPSTREAM_DURATION = registry.histogram(
+    "tourease_upstream_request_duration_seconds",
+    "Latency of calls to upstream APIs",
+    ["upstream"],
+)
+UPSTREAM_ERRORS = registry.counter(
+    "tourease_upstream_errors_total",
+    "Failed calls to upstream APIs",
+    ["upstream"],
+)
+
+# Data file metrics
+DATA_LOAD_DURATION = registry.histogram(
+    "tourease_data_load_duration_seconds",
+    "Time spent loading a data file",
+    ["file"],
+)
+DATA_LOAD_RECORDS = registry.gauge(
+    "tourease_data_load_records",
+    "Records read from a data file on its last load",
+    ["file"],
+)
+DATA_LOAD_ERRORS = registry.counter(
+    "tourease_data_load_errors_total",
+    "Failed data file loads",
+    ["file"],
+)
+
+
+def render() -> str:
+    return registry.render()
+
+
+@contextmanager
+def track_upstream(upstream: str):
+    """
+    Time a call to an upstream API and count it as an error if it raises.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        UPSTREAM_ERRORS.labels(upstream).inc()
+        raise
+    finally:
+        UPSTREAM_DURATION.labels(upstream).observe(time.perf_counter() - start)
+
+
+def observe_data_load(file_name: str, started: float, records: Optional[int]):
+    """
+    Record a data file load that began at ``started`` (a perf_counter value).
+
+    ``records`` is None when the load failed.
+    """
+    DATA_LOAD_DURATION.labels(file_name).observe(time.perf_counter() - started)
+    if records is None:
+        DATA_LOAD_ERRORS.labels(file_name).inc()
+    else:
+        DATA_LOAD_RECORDS.labels(file_name).set(records)
+
+
+def route_label(route) -> str:
+    """
+    Label a request by its route template so path parameters don't explode
+    the series count. Requests that matched no route share one label.
+    """
+    path = getattr(route, "path", None)
+    return path or "unmatched"
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording per-route latency histograms and in-flight gauges.
+
+    The route template is resolved up front against ``router`` so in-flight
+    requests can be attributed to their route while they are still running.
+    Resolutions, whether found by scanning the routes or learned from the
+    scope after routing ran (nested routers on some FastAPI versions), are
+    memoised per (method, path) in an LRU of ``max_cached_paths`` entries, so
+    paths with ids in them can't crowd out the hot ones.
+    """
+
+    def __init__(self, app, router=None, max_cached_paths=4096):
+        self.app = app
+        self.router = router
+        self.max_cached_paths = max_cached_paths
+        self._routes = OrderedDict()
+        self._children = {}
+
+    def _child(self, metric, key):
+        cache_key = (metric.name,) + key
+        child = self._children.get(cache_key)
+        if child is None:
+            child = self._children[cache_key] = metric.labels(*key)
+        return child
+
+    def _resolve_route(self, scope):
+        key = (scope["method"], scope["path"])
+        label = self._routes.get(key)
+        if label is not None:
+            self._routes.move_to_end(key)
+            return label
+        if self.router is None:
+            return None
+        from starlette.routing import Match
+
+        partial = None
+        for route in self.router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                label = getattr(route, "path", None)
+                break
+            if match == Match.PARTIAL and partial is None:
+                partial = route
+        else:
+            label = getattr(partial, "path", None)
+        if label is not None:
+            self._remember_route(scope, label)
+        return label
+
+    def _remember_route(self, scope, label):
+        self._routes[(scope["method"], scope["path"])] = label
+        if len(self._routes) > self.max_cached_paths:
+            self._routes.popitem(last=False)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = self._resolve_route(scope)
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_flight = self._child(HTTP_REQUESTS_IN_FLIGHT, (method, route or "unmatched"))
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_flight.dec()
+            if route is None:
+                route = route_label(scope.get("route"))
+                self._remember_route(scope, route)
+            self._child(HTTP_REQUEST_DURATION, (method, route, str(status_code))).observe(
+                time.perf_counter() - start
+            )
@@ -0,0 +1,257 @@
+"""
+Micro-cache for catalog GET endpoints.
+
+Endpoints opt in with ``@microcache.cached()`` (below ``@router.get``).
+Their successful responses are kept for a few seconds, keyed by path,
+normalized query string and catalog version, so a burst of identical
+requests runs the handler once. Concurrent identical requests that arrive
+while it runs wait for its response instead of running it again.
+
+Query strings are normalized with the route's own query parameters:
+parameters the endpoint doesn't take are dropped, missing ones are filled
+in with their defaults and the rest are sorted, so ``?sort_by=rating`` and
+no query string share an entry.
+
+The route of a path is only known once routing ran, so the first request
+to each path is passed through and its route remembered. Cache hits skip
+the per-router rate limits; worker-level admission control still applies.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode
+
+import catalog
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Set MICROCACHE_ENABLED=0 to pass every request through
+enabled = os.environ.get("MICROCACHE_ENABLED", "1") != "0"
+# How long responses are reused, unless the endpoint sets its own
+default_ttl = float(os.environ.get("MICROCACHE_TTL_SECONDS", 2))
+# Size limits: entries, bytes per response and bytes in total
+max_entries = int(os.environ.get("MICROCACHE_MAX_ENTRIES", 2048))
+max_entry_bytes = int(os.environ.get("MICROCACHE_MAX_ENTRY_BYTES", 1 << 20))
+max_bytes = int(os.environ.get("MICROCACHE_MAX_BYTES", 64 << 20))
+
+MICROCACHE_REQUESTS = metrics.registry.counter(
+    "tourease_microcache_requests_total",
+    "GET requests to micro-cached routes by result (hit, collapsed, miss)",
+    ["route", "result"],
+)
+
+
+def cached(ttl: Optional[float] = None):
+    """
+    Opt an endpoint into the micro-cache, for ``ttl`` seconds (default
+    ``MICROCACHE_TTL_SECONDS``).
+    """
+    def decorate(endpoint):
+        endpoint.microcache_ttl = default_ttl if ttl is None else ttl
+        return endpoint
+    return decorate
+
+
+class RoutePolicy(NamedTuple):
+    """
+    How requests to one opted-in route are cached.
+    """
+    label: str
+    ttl: float
+    # Query parameter name -> default as a query value (None: no default)
+    params: Dict[str, Optional[str]]
+
+
+class Entry(NamedTuple):
+    status: int
+    headers: List[Tuple[bytes, bytes]]
+    body: bytes
+    expires_at: float
+
+
+def _query_value(value) -> Optional[str]:
+    if value is None or isinstance(value, (list, tuple, set, dict)):
+        return None
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def _query_params(dependant, params):
+    for field in dependant.query_params:
+        params[field.alias] = None if field.field_info.is_required() else _query_value(field.default)
+    for sub_dependant in dependant.dependencies:
+        _query_params(sub_dependant, params)
+    return params
+
+
+def route_policy(route) -> Optional[RoutePolicy]:
+    endpoint = getattr(route, "endpoint", None)
+    ttl = getattr(endpoint, "microcache_ttl", None)
+    dependant = getattr(route, "dependant", None)
+    if ttl is None or dependant is None:
+        return None
+    return RoutePolicy(route.path, ttl, _query_params(dependant, {}))
+
+
+def normalize_query(query_string: bytes, params: Dict[str, Optional[str]]) -> str:
+    pairs = [(name, value) for name, value in parse_qsl(query_string.decode("latin-1"), keep_blank_values=True)
+             if name in params]
+    given = {name for name, _ in pairs}
+    pairs.extend((name, default) for name, default in params.items() if name not in given and default is not None)
+    # Stable, so repeated parameters keep their order
+    pairs.sort(key=lambda pair: pair[0])
+    return urlencode(pairs)
+
+
+class MicroCache:
+    """
+    Size-bounded store of recent responses, oldest evicted first.
+    """
+
+    def __init__(self, max_entries: int, max_entry_bytes: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_entry_bytes = max_entry_bytes
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[tuple, Entry]" = OrderedDict()
+        self.size = 0
+        # Responses being produced, awaited by identical requests
+        self.inflight: Dict[tuple, asyncio.Future] = {}
+
+    def get(self, key) -> Optional[Entry]:
+        entry = self.entries.get(key)
+        if entry is not None and entry.expires_at <= time.monotonic():
+            self._remove(key)
+            return None
+        return entry
+
+    def set(self, key, entry: Entry):
+        if len(entry.body) > self.max_entry_bytes:
+            return
+        if key in self.entries:
+            self._remove(key)
+        self.entries[key] = entry
+        self.size += len(entry.body)
+        while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+            self._remove(next(iter(self.entries)))
+
+    def _remove(self, key):
+        self.size -= len(self.entries.pop(key).body)
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+
+cache = MicroCache(max_entries, max_entry_bytes, max_bytes)
+
+metrics.registry.gauge("tourease_microcache_entries", "Responses held in the micro-cache").set_function(
+    lambda: len(cache)
+)
+metrics.registry.gauge("tourease_microcache_bytes", "Response bytes held in the micro-cache").set_function(
+    lambda: cache.size
+)
+
+
+async def _send_entry(send, entry: Entry):
+    await send({"type": "http.response.start", "status": entry.status, "headers": entry.headers})
+    await send({"type": "http.response.body", "body": entry.body})
+
+
+class MicroCacheMiddleware:
+    """
+    ASGI middleware serving opted-in GET routes from ``cache`` and collapsing
+    concurrent identical requests into one handler run.
+
+    The route of each path is learned from the scope after its first request
+    and memoised up to ``max_cached_paths``; later paths are passed through.
+    """
+
+    def __init__(self, app, max_cached_paths=8192):
+        self.app = app
+        self.max_cached_paths = max_cached_paths
+        self._paths: Dict[str, Optional[RoutePolicy]] = {}
+        # Per route object (routes aren't hashable; they live as long as the app)
+        self._policies: Dict[int, Optional[RoutePolicy]] = {}
+
+    def _learn(self, scope):
+        route = scope.get("route")
+        if route is None or len(self._paths) >= self.max_cached_paths:
+            return
+        if id(route) not in self._policies:
+            self._policies[id(route)] = route_policy(route)
+        self._paths[scope["path"]] = self._policies[id(route)]
+
+    async def __call__(self, scope, receive, send):
+        if not enabled or scope["type"] != "http" or scope["method"] != "GET":
+            await self.app(scope, receive, send)
+            return
+        path = scope["path"]
+        if path not in self._paths:
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                self._learn(scope)
+            return
+        policy = self._paths[path]
+        snapshot = catalog.current()
+        if policy is None or snapshot is None:
+            await self.app(scope, receive, send)
+            return
+
+        key = (snapshot.version, path, normalize_query(scope.get("query_string", b""), policy.params))
+        entry = cache.get(key)
+        if entry is not None:
+            MICROCACHE_REQUESTS.labels(policy.label, "hit").inc()
+            await _send_entry(send, entry)
+            return
+        pending = cache.inflight.get(key)
+        if pending is not None:
+            entry = await asyncio.shield(pending)
+            if entry is not None:
+                MICROCACHE_REQUESTS.labels(policy.label, "collapsed").inc()
+                await _send_entry(send, entry)
+                return
+            # The first request's response wasn't shareable (e.g. rate limited)
+            await self.app(scope, receive, send)
+            return
+
+        MICROCACHE_REQUESTS.labels(policy.label, "miss").inc()
+        future = asyncio.get_running_loop().create_future()
+        cache.inflight[key] = future
+        status_code = None
+        headers = []
+        chunks = []
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal status_code, headers, size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = list(message.get("headers", ()))
+            elif message["type"] == "http.response.body" and size <= cache.max_entry_bytes:
+                body = message.get("body", b"")
+                chunks.append(body)
+                size += len(body)
+            await send(message)
+
+        entry = None
+        try:
+            await self.app(scope, receive, send_wrapper)
+            # Only successful responses are shared, and only if the catalog
+            # didn't change while the handler ran
+            current = catalog.current()
+            if status_code == 200 and size <= cache.max_entry_bytes and current is not None \
+                    and current.version == snapshot.version:
+                entry = Entry(status_code, headers, b"".join(chunks), time.monotonic() + policy.ttl)
+                cache.set(key, entry)
+        finally:
+            del cache.inflight[key]
+            future.set_result(entry)
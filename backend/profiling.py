@@ -0,0 +1,249 @@
+import asyncio
+import cProfile
+import hmac
+import io
+import json
+import logging
+import os
+import pstats
+import random
+import threading
+import time
+from itertools import count
+from typing import List, Optional
+from urllib.parse import parse_qsl
+
+logger = logging.getLogger(__name__)
+
+# Base directory for captured profiles
+profile_dir = os.environ.get(
+    "PROFILE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles")
+)
+
+
+def _env_float(name, default=None):
+    value = os.environ.get(name)
+    if value in (None, ""):
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        logger.warning("Ignoring invalid %s=%r", name, value)
+        return default
+
+
+class ProfilingConfig:
+    """
+    Runtime switches for request profiling. Admin endpoints can change these
+    without a restart.
+
+    - ``enabled``: master switch; when off the middleware is a single attribute check
+    - ``slow_threshold_ms``: keep profiles of requests slower than this (None disables auto capture)
+    - ``sample_rate``: fraction of requests profiled for auto capture
+    - ``max_profiles``: size of the on-disk ring buffer
+    """
+
+    def __init__(self):
+        self.enabled = os.environ.get("PROFILING_ENABLED", "").lower() in ("1", "true", "yes")
+        self.slow_threshold_ms = _env_float("PROFILE_SLOW_MS")
+        self.sample_rate = _env_float("PROFILE_SAMPLE_RATE", 1.0)
+        self.max_profiles = int(_env_float("PROFILE_MAX_FILES", 50))
+
+    def as_dict(self):
+        return {
+            "enabled": self.enabled,
+            "slow_threshold_ms": self.slow_threshold_ms,
+            "sample_rate": self.sample_rate,
+            "max_profiles": self.max_profiles,
+        }
+
+
+config = ProfilingConfig()
+
+
+def admin_token() -> Optional[str]:
+    return os.environ.get("ADMIN_TOKEN") or None
+
+
+def is_admin_token(value: Optional[str]) -> bool:
+    token = admin_token()
+    if not token or not value:
+        return False
+    return hmac.compare_digest(value, token)
+
+
+class ProfileStore:
+    """
+    Bounded on-disk ring buffer of pstats dumps. Each profile is stored as
+    ``<id>.prof`` with a ``<id>.json`` sidecar holding request metadata; the
+    oldest profiles are deleted once ``config.max_profiles`` is exceeded.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._seq = count()
+
+    def new_id(self) -> str:
+        return f"{int(time.time() * 1000)}-{os.getpid()}-{next(self._seq)}"
+
+    def _path(self, profile_id, suffix):
+        # Ids are generated here; reject anything that could escape the directory
+        if not profile_id or os.path.basename(profile_id) != profile_id:
+            raise KeyError(profile_id)
+        return os.path.join(self.directory, f"{profile_id}{suffix}")
+
+    def save(self, profile_id, profiler: cProfile.Profile, meta: dict):
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            profiler.dump_stats(self._path(profile_id, ".prof"))
+            with open(self._path(profile_id, ".json"), "w") as f:
+                json.dump(dict(meta, id=profile_id), f)
+            self._trim()
+
+    def _trim(self):
+        metas = sorted(
+            name for name in os.listdir(self.directory) if name.endswith(".json")
+        )
+        excess = len(metas) - max(config.max_profiles, 1)
+        for name in metas[:max(excess, 0)]:
+            profile_id = name[:-len(".json")]
+            for suffix in (".prof", ".json"):
+                try:
+                    os.remove(self._path(profile_id, suffix))
+                except FileNotFoundError:
+                    pass
+
+    def list(self) -> List[dict]:
+        if not os.path.isdir(self.directory):
+            return []
+        profiles = []
+        for name in sorted(os.listdir(self.directory), reverse=True):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), "r") as f:
+                    profiles.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return profiles
+
+    def file_path(self, profile_id) -> str:
+        path = self._path(profile_id, ".prof")
+        if not os.path.exists(path):
+            raise KeyError(profile_id)
+        return path
+
+    def render_text(self, profile_id, sort_by="cumulative", limit=50) -> str:
+        stream = io.StringIO()
+        stats = pstats.Stats(self.file_path(profile_id), stream=stream)
+        stats.sort_stats(sort_by).print_stats(limit)
+        return stream.getvalue()
+
+
+store = ProfileStore(profile_dir)
+
+
+class _ProfiledCoroutine:
+    """
+    Drive a coroutine with the profiler enabled only while that coroutine's
+    own steps run, so concurrent requests sharing the event loop don't end up
+    in its profile.
+    """
+
+    def __init__(self, coro, profiler):
+        self._coro = coro
+        self._profiler = profiler
+
+    def __await__(self):
+        inner = self._coro.__await__()
+        value, error = None, None
+        while True:
+            self._profiler.enable()
+            try:
+                if error is not None:
+                    yielded = inner.throw(error)
+                else:
+                    yielded = inner.send(value)
+            except StopIteration as stop:
+                return stop.value
+            finally:
+                self._profiler.disable()
+            try:
+                value, error = (yield yielded), None
+            except BaseException as exc:
+                value, error = None, exc
+
+
+def _explicitly_requested(scope) -> bool:
+    for name, value in scope.get("headers", ()):
+        if name == b"x-profile":
+            return is_admin_token(value.decode("latin-1"))
+    query_string = scope.get("query_string", b"")
+    if b"_profile=" in query_string:
+        for name, value in parse_qsl(query_string.decode("latin-1")):
+            if name == "_profile":
+                return is_admin_token(value)
+    return False
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware capturing a cProfile of individual requests.
+
+    A request is profiled when ``X-Profile: <admin token>`` (or the
+    ``_profile=<admin token>`` query parameter) is sent, or is sampled for
+    auto capture when ``config.slow_threshold_ms`` is set; auto-captured
+    profiles are kept only if the request was slower than the threshold.
+    Explicitly profiled responses carry an ``X-Profile-Id`` header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not config.enabled or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        explicit = _explicitly_requested(scope)
+        threshold = config.slow_threshold_ms
+        sampled = threshold is not None and random.random() < config.sample_rate
+        if not (explicit or sampled):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = store.new_id()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if explicit:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"x-profile-id", profile_id.encode()))
+                    message = dict(message, headers=headers)
+            await send(message)
+
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        try:
+            await _ProfiledCoroutine(self.app(scope, receive, send_wrapper), profiler)
+        finally:
+            duration_ms = (time.perf_counter() - start) * 1000
+            if explicit or duration_ms >= threshold:
+                meta = {
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "query": scope.get("query_string", b"").decode("latin-1"),
+                    "status": status_code,
+                    "duration_ms": round(duration_ms, 3),
+                    "trigger": "explicit" if explicit else "slow",
+                    "captured_at": time.time(),
+                }
+                loop = asyncio.get_running_loop()
+                try:
+                    await loop.run_in_executor(None, store.save, profile_id, profiler, meta)
+                except Exception as e:
+                    logger.error("Error saving profile %s: %s", profile_id, e)
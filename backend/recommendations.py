@@ -0,0 +1,366 @@
+"""
+"Similar tours" from feature vectors built per catalog version.
+
+Each tour becomes one L2-normalized row of a dense float32 matrix made of
+weighted blocks:
+
+- TF-IDF over the name, description and includes (the ``max_terms`` terms
+  shared by the most tours; terms used by a single tour can't make two tours
+  similar and are dropped);
+- one-hot languages and location;
+- standardized price, duration and rating.
+
+Cosine similarity is then a dot product: neighbors of a batch of tours come
+from one matrix product and ``argpartition``. Neighbor lists of the top-rated
+tours are precomputed, and lists computed on demand are kept in a bounded
+LRU. When the tours change, only changed rows are re-vectorized (with the
+vocabulary and scaling of the last full build) and cached lists are patched
+by scoring them against the changed rows; a full rebuild happens once enough
+of the catalog changed.
+"""
+import logging
+import math
+import os
+import re
+import threading
+import time
+import warnings
+import zlib
+from collections import Counter, OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Text terms in the vocabulary (caps the matrix width at large catalogs)
+max_terms = int(os.environ.get("SIMILAR_TOURS_MAX_TERMS", 256))
+max_locations = int(os.environ.get("SIMILAR_TOURS_MAX_LOCATIONS", 128))
+# Top-rated tours whose neighbor lists are computed up front
+precompute_count = int(os.environ.get("SIMILAR_TOURS_PRECOMPUTE", 1000))
+# Neighbor lists kept per worker
+cache_size = int(os.environ.get("SIMILAR_TOURS_CACHE_SIZE", 10000))
+# Share of changed tours after which the vocabulary is rebuilt
+rebuild_ratio = float(os.environ.get("SIMILAR_TOURS_REBUILD_RATIO", 0.1))
+
+# Neighbors stored per tour (the endpoint's maximum limit)
+NEIGHBORS = 50
+# Tours scored per matrix product when precomputing
+BATCH_SIZE = 256
+
+# Relative weight of each feature block
+WEIGHTS = {"text": 1.0, "location": 0.6, "languages": 0.4, "numeric": 0.4}
+
+NUMERIC_FIELDS = ("price", "duration_hours", "rating")
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_STOP_WORDS = frozenset(
+    "and the for with from your our you are all into over its this that of to in on at by an a or"
+    .split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN.findall(text.lower()) if len(t) > 2 and t not in _STOP_WORDS]
+
+
+def _number(value) -> float:
+    return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else math.nan
+
+
+class TourFeatures(NamedTuple):
+    """
+    The fields of one tour that feed its vector.
+    """
+    id: str
+    text: str
+    location: Optional[str]
+    languages: Tuple[str, ...]
+    numbers: Tuple[float, ...]
+
+    @property
+    def signature(self) -> int:
+        return zlib.crc32(repr(self[1:]).encode())
+
+
+def extract(table) -> List[TourFeatures]:
+    """
+    Read the feature fields of every tour once.
+    """
+    features = []
+    for row in table:
+        includes = row.get("includes") or []
+        text = " ".join([str(row.get("name") or ""), str(row.get("description") or "")]
+                        + [str(item) for item in includes])
+        location = row.get("location")
+        languages = tuple(lang for lang in (row.get("languages") or []) if isinstance(lang, str))
+        features.append(TourFeatures(
+            row.get("id"), text, location if isinstance(location, str) else None, languages,
+            tuple(_number(row.get(field)) for field in NUMERIC_FIELDS),
+        ))
+    return features
+
+
+def _numeric(tours: Sequence[TourFeatures]) -> np.ndarray:
+    numeric = np.array([tour.numbers for tour in tours], dtype=np.float64).reshape(len(tours), len(NUMERIC_FIELDS))
+    # Prices and durations are compared on a log scale
+    numeric[:, :2] = np.log1p(np.clip(numeric[:, :2], 0, None))
+    return numeric
+
+
+class Vocabulary:
+    """
+    Feature layout and scaling fixed at a full build.
+    """
+
+    def __init__(self, tours: Sequence[TourFeatures]):
+        tokens = [tokenize(tour.text) for tour in tours]
+        n = len(tours)
+        df = Counter(term for doc in tokens for term in set(doc))
+        shared = sorted((term for term, count in df.items() if count > 1), key=lambda t: (-df[t], t))
+        self.terms = {term: i for i, term in enumerate(shared[:max_terms])}
+        self.idf = np.array(
+            [math.log((1 + n) / (1 + df[term])) + 1 for term in self.terms], dtype=np.float32
+        )
+        locations = Counter(tour.location for tour in tours if tour.location is not None)
+        shared = sorted((loc for loc, count in locations.items() if count > 1),
+                        key=lambda loc: (-locations[loc], loc))
+        self.locations = {loc: i for i, loc in enumerate(shared[:max_locations])}
+        languages = sorted({lang for tour in tours for lang in tour.languages})
+        self.languages = {lang: i for i, lang in enumerate(languages)}
+
+        numeric = _numeric(tours)
+        with warnings.catch_warnings():
+            # Columns without any value come out as NaN and are replaced
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            self.mean = np.nan_to_num(np.nanmean(numeric, axis=0))
+            self.std = np.nan_to_num(np.nanstd(numeric, axis=0), nan=1.0)
+        self.std[self.std == 0] = 1.0
+        self.size = n
+        self._tokens = tokens
+
+    @property
+    def width(self) -> int:
+        return len(self.terms) + len(self.locations) + len(self.languages) + len(NUMERIC_FIELDS)
+
+    def vectors(self, tours: Sequence[TourFeatures], tokens: Optional[List[List[str]]] = None) -> np.ndarray:
+        """
+        Feature matrix (one L2-normalized row per tour).
+        """
+        if tokens is None:
+            tokens = [tokenize(tour.text) for tour in tours]
+        n = len(tours)
+        t, l = len(self.terms), len(self.locations)
+        out = np.zeros((n, self.width), dtype=np.float32)
+
+        # TF-IDF with sublinear term frequency, built from (row, term, count)
+        # triples
+        row_index, term_index, counts = [], [], []
+        for i, doc in enumerate(tokens):
+            for term, count in Counter(doc).items():
+                j = self.terms.get(term)
+                if j is not None:
+                    row_index.append(i)
+                    term_index.append(j)
+                    counts.append(count)
+        if row_index:
+            rows_, terms_ = np.array(row_index), np.array(term_index)
+            out[rows_, terms_] = (1 + np.log(np.array(counts, dtype=np.float32))) * self.idf[terms_]
+        _normalize(out[:, :t], WEIGHTS["text"])
+
+        for i, tour in enumerate(tours):
+            j = self.locations.get(tour.location)
+            if j is not None:
+                out[i, t + j] = WEIGHTS["location"]
+            languages = [self.languages[lang] for lang in tour.languages if lang in self.languages]
+            if languages:
+                out[i, [t + l + j for j in languages]] = WEIGHTS["languages"] / math.sqrt(len(languages))
+
+        z = np.clip(np.nan_to_num((_numeric(tours) - self.mean) / self.std), -3, 3) / 3
+        out[:, -len(NUMERIC_FIELDS):] = z * WEIGHTS["numeric"] / math.sqrt(len(NUMERIC_FIELDS))
+        _normalize(out, 1.0)
+        return out
+
+
+def _normalize(block: np.ndarray, weight: float):
+    norms = np.linalg.norm(block, axis=1, keepdims=True)
+    np.divide(block * weight, norms, out=block, where=norms > 0)
+
+
+def top_k(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Indices and scores of the ``k`` best columns of each row, best first.
+    """
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        empty = np.zeros((scores.shape[0], 0))
+        return empty.astype(np.int64), empty
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1, kind="stable")
+    return np.take_along_axis(part, order, axis=1), np.take_along_axis(part_scores, order, axis=1)
+
+
+class SimilarityIndex:
+    """
+    Tour vectors and neighbor lists for one version of the tours table.
+    """
+
+    def __init__(self, table, tours: List[TourFeatures], vocabulary: Vocabulary, matrix: np.ndarray,
+                 neighbors: "OrderedDict[str, List[Tuple[str, float]]]", changed_since_build: int = 0):
+        self.table = table
+        self.vocabulary = vocabulary
+        self.matrix = matrix
+        self.ids: List[str] = [tour.id for tour in tours]
+        self.positions: Dict[str, int] = {tour_id: i for i, tour_id in enumerate(self.ids)}
+        self.signatures = [tour.signature for tour in tours]
+        self.ratings = np.array([tour.numbers[NUMERIC_FIELDS.index("rating")] for tour in tours])
+        self.neighbors = neighbors
+        self.changed_since_build = changed_since_build
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(cls, table, tours: Optional[List[TourFeatures]] = None) -> "SimilarityIndex":
+        tours = extract(table) if tours is None else tours
+        vocabulary = Vocabulary(tours)
+        matrix = vocabulary.vectors(tours, vocabulary._tokens)
+        vocabulary._tokens = None
+        index = cls(table, tours, vocabulary, matrix, OrderedDict())
+        index.precompute()
+        return index
+
+    def update(self, table) -> "SimilarityIndex":
+        """
+        Index for a new version of the tours table, reusing unchanged rows.
+        """
+        tours = extract(table)
+        old = {tour_id: (i, self.signatures[i]) for i, tour_id in enumerate(self.ids)}
+        changed = [i for i, tour in enumerate(tours) if old.get(tour.id, (None, None))[1] != tour.signature]
+        removed = len(set(old) - {tour.id for tour in tours})
+        changed_since_build = self.changed_since_build + len(changed) + removed
+        if changed_since_build > rebuild_ratio * max(self.vocabulary.size, 1):
+            return SimilarityIndex.build(table, tours)
+
+        matrix = np.empty((len(tours), self.vocabulary.width), dtype=np.float32)
+        changed_set = set(changed)
+        kept = [i for i in range(len(tours)) if i not in changed_set]
+        if kept:
+            matrix[kept] = self.matrix[[old[tours[i].id][0] for i in kept]]
+        if changed:
+            matrix[changed] = self.vocabulary.vectors([tours[i] for i in changed])
+
+        index = SimilarityIndex(table, tours, self.vocabulary, matrix, OrderedDict(), changed_since_build)
+        index._patch_neighbors(self.neighbors, {tours[i].id for i in changed}, changed)
+        return index
+
+    def _patch_neighbors(self, neighbors, changed_ids, changed_rows):
+        # Keep each cached list's unchanged entries and merge in the rescored
+        # changed tours; lists that shrank below NEIGHBORS are recomputed
+        sources = [tour_id for tour_id in neighbors
+                   if tour_id in self.positions and tour_id not in changed_ids]
+        if changed_rows and sources:
+            scores = self.matrix[[self.positions[t] for t in sources]] @ self.matrix[changed_rows].T
+        refresh = [tour_id for tour_id in neighbors if tour_id in changed_ids and tour_id in self.positions]
+        for n, tour_id in enumerate(sources):
+            previous = neighbors[tour_id]
+            entries = [(other, score) for other, score in previous
+                       if other in self.positions and other not in changed_ids]
+            if len(entries) < len(previous) and len(previous) == NEIGHBORS:
+                # Tours that ranked below the old list's last entry are
+                # unknown, so only changed tours scoring above it can fill
+                # the gap
+                floor = previous[-1][1]
+            else:
+                floor = -math.inf
+            if changed_rows:
+                entries += [(self.ids[i], float(s)) for i, s in zip(changed_rows, scores[n])
+                            if self.ids[i] != tour_id and s >= floor]
+            entries.sort(key=lambda entry: -entry[1])
+            if len(entries) < min(NEIGHBORS, len(self.ids) - 1):
+                refresh.append(tour_id)
+            else:
+                self.neighbors[tour_id] = entries[:NEIGHBORS]
+        self._compute(refresh)
+
+    def _compute(self, tour_ids: List[str]):
+        for start in range(0, len(tour_ids), BATCH_SIZE):
+            batch = tour_ids[start:start + BATCH_SIZE]
+            rows = np.array([self.positions[t] for t in batch])
+            scores = self.matrix[rows] @ self.matrix.T
+            scores[np.arange(len(rows)), rows] = -np.inf
+            indices, values = top_k(scores, NEIGHBORS)
+            with self._lock:
+                for tour_id, idx, vals in zip(batch, indices, values):
+                    self.neighbors[tour_id] = [
+                        (self.ids[i], float(v)) for i, v in zip(idx, vals) if np.isfinite(v)
+                    ]
+                    self.neighbors.move_to_end(tour_id)
+                while len(self.neighbors) > cache_size:
+                    self.neighbors.popitem(last=False)
+
+    def precompute(self):
+        """
+        Neighbor lists for the top-rated tours.
+        """
+        count = min(precompute_count, cache_size, len(self.ids))
+        if count <= 0:
+            return
+        best = np.argsort(-np.nan_to_num(self.ratings, nan=-np.inf), kind="stable")[:count]
+        self._compute([self.ids[i] for i in best])
+
+    def cached(self, tour_id: str) -> Optional[List[Tuple[str, float]]]:
+        with self._lock:
+            entries = self.neighbors.get(tour_id)
+            if entries is not None:
+                self.neighbors.move_to_end(tour_id)
+            return entries
+
+    def similar(self, tour_id: str) -> Optional[List[Tuple[str, float]]]:
+        """
+        Up to NEIGHBORS ``(tour id, similarity)`` pairs, most similar first
+        (None for an unknown tour). Computes and caches missing lists.
+        """
+        if tour_id not in self.positions:
+            return None
+        entries = self.cached(tour_id)
+        if entries is None:
+            self._compute([tour_id])
+            entries = self.cached(tour_id) or []
+        return entries
+
+
+_index: Optional[SimilarityIndex] = None
+_build_lock = threading.Lock()
+
+
+def index_for(table) -> SimilarityIndex:
+    """
+    The index for ``table``, building or updating it when the tours table
+    changed (blocking; call off the event loop).
+    """
+    global _index
+    index = _index
+    if index is not None and index.table is table:
+        return index
+    with _build_lock:
+        index = _index
+        if index is not None and index.table is table:
+            return index
+        started = time.perf_counter()
+        if index is None:
+            index = SimilarityIndex.build(table)
+            kind = "built"
+        else:
+            index = index.update(table)
+            kind = "built" if index.changed_since_build == 0 else "updated"
+        logger.info("Similar-tours index %s for %d tours in %.0f ms",
+                    kind, len(index.ids), (time.perf_counter() - started) * 1000)
+        _index = index
+        return index
+
+
+def current() -> Optional[SimilarityIndex]:
+    """
+    The last built index (None before the first build).
+    """
+    return _index
@@ -0,0 +1,263 @@
+"""
+Visiting order for a set of destinations.
+
+A nearest-neighbour tour is improved with 2-opt and Or-opt moves until no
+move helps or the time budget runs out. Distances are great-circle
+kilometres from a vectorized haversine matrix, and every move evaluation
+scores all candidate positions at once with NumPy.
+
+All variants are solved as a path whose first node is fixed:
+
+- round trip: the path returns to its first node;
+- open path from a given start: the path ends at a virtual node with zero
+  distance to everything, so the last leg is free;
+- open path with free ends: the virtual node is the fixed first node and the
+  path returns to it, so both the first and last leg are free.
+
+Solving runs in a process pool (``solve_async``) so it never holds the event
+loop or the GIL of the serving process. The pool is started on the first
+request; when its processes can't start (spawn re-imports the entry point,
+which fails without an ``if __name__ == "__main__"`` guard) solving falls
+back to a thread.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from loop_monitor import run_blocking
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Worker processes for route solving (0: solve in the blocking thread pool
+# instead)
+pool_size = int(os.environ.get("ROUTE_OPTIMIZER_PROCESSES", 2))
+
+# How long starting the worker processes may take before solving falls back
+# to a thread
+POOL_START_TIMEOUT = 30
+
+_EPS = 1e-9
+
+
+def distance_matrix(coordinates: Sequence[Sequence[float]]) -> np.ndarray:
+    """
+    Pairwise haversine distances in km for ``[lat, lng]`` pairs.
+    """
+    points = np.radians(np.asarray(coordinates, dtype=np.float64))
+    lat, lng = points[:, 0:1], points[:, 1:2]
+    dlat = lat - lat.T
+    dlng = lng - lng.T
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat) * np.cos(lat.T) * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def nearest_neighbour(dist: np.ndarray, first: int) -> np.ndarray:
+    """
+    Greedy tour from ``first``, always moving to the closest unvisited point.
+    """
+    n = len(dist)
+    visited = np.zeros(n, dtype=bool)
+    order = [first]
+    visited[first] = True
+    while len(order) < n:
+        row = np.where(visited, np.inf, dist[order[-1]])
+        nxt = int(np.argmin(row))
+        order.append(nxt)
+        visited[nxt] = True
+    return np.array(order, dtype=np.int64)
+
+
+def _next_nodes(path: np.ndarray, closing: int) -> np.ndarray:
+    # Successor of every position; the last node is followed by ``closing``
+    return np.append(path[1:], closing)
+
+
+def two_opt(path: np.ndarray, dist: np.ndarray, closing: Optional[int], deadline: float) -> Tuple[np.ndarray, bool]:
+    """
+    Reverse segments ``path[i..j]`` (i >= 1) while that shortens the path.
+    ``closing`` is the node after the last one (None: the first node).
+    """
+    n = len(path)
+    improved_any = False
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        for i in range(1, n - 1):
+            close = path[0] if closing is None else closing
+            a, b = path[i - 1], path[i]
+            c = path[i + 1:]
+            d = _next_nodes(path, close)[i + 1:]
+            delta = dist[a, c] + dist[b, d] - dist[a, b] - dist[c, d]
+            j = int(np.argmin(delta))
+            if delta[j] < -_EPS:
+                end = i + 1 + j
+                path[i:end + 1] = path[i:end + 1][::-1].copy()
+                improved = improved_any = True
+            if time.perf_counter() >= deadline:
+                break
+    return path, improved_any
+
+
+def or_opt(path: np.ndarray, dist: np.ndarray, closing: Optional[int], deadline: float) -> Tuple[np.ndarray, bool]:
+    """
+    Move segments of 1-3 nodes (optionally reversed) to the best position
+    elsewhere in the path while that shortens it.
+    """
+    n = len(path)
+    improved_any = False
+    for length in (1, 2, 3):
+        i = 1
+        while i + length <= n and time.perf_counter() < deadline:
+            close = path[0] if closing is None else closing
+            segment = path[i:i + length]
+            first, last = segment[0], segment[-1]
+            prev = path[i - 1]
+            nxt = path[i + length] if i + length < n else close
+            removal_gain = dist[prev, first] + dist[last, nxt] - dist[prev, nxt]
+
+            rest = np.concatenate([path[:i], path[i + length:]])
+            a = rest
+            b = _next_nodes(rest, close)
+            forward = dist[a, first] + dist[last, b] - dist[a, b]
+            backward = dist[a, last] + dist[first, b] - dist[a, b]
+            # Putting the segment back where it was is not a move
+            forward[i - 1] = np.inf
+            backward[i - 1] = np.inf if length == 1 else backward[i - 1]
+            k_forward, k_backward = int(np.argmin(forward)), int(np.argmin(backward))
+            if forward[k_forward] <= backward[k_backward]:
+                k, cost, insert = k_forward, forward[k_forward], segment
+            else:
+                k, cost, insert = k_backward, backward[k_backward], segment[::-1]
+            if cost - removal_gain < -_EPS:
+                path = np.concatenate([rest[:k + 1], insert, rest[k + 1:]])
+                improved_any = True
+            else:
+                i += 1
+    return path, improved_any
+
+
+def solve(
+    coordinates: Sequence[Sequence[float]],
+    start: Optional[int] = None,
+    round_trip: bool = False,
+    time_budget: float = 0.25,
+) -> Tuple[List[int], float, List[float]]:
+    """
+    Order the points to minimise total distance.
+
+    Returns the visiting order (indices into ``coordinates``), the total
+    distance in km and the distance of each leg (including the return leg
+    for a round trip).
+    """
+    deadline = time.perf_counter() + time_budget
+    n = len(coordinates)
+    if n == 0:
+        return [], 0.0, []
+    dist = distance_matrix(coordinates)
+    if n == 1:
+        return [0], 0.0, []
+
+    # Virtual node ``n`` with zero distance to every point
+    padded = np.zeros((n + 1, n + 1))
+    padded[:n, :n] = dist
+    virtual = n
+
+    if round_trip:
+        first = 0 if start is None else start
+        path = nearest_neighbour(dist, first)
+        closing = None
+    elif start is not None:
+        path = nearest_neighbour(dist, start)
+        closing = virtual
+    else:
+        # Start the greedy tour at the point farthest from the others
+        first = int(np.argmax(dist.sum(axis=1)))
+        path = np.concatenate([[virtual], nearest_neighbour(dist, first)])
+        closing = None
+
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        path, improved_2opt = two_opt(path, padded, closing, deadline)
+        path, improved_or = or_opt(path, padded, closing, deadline)
+        improved = improved_2opt or improved_or
+
+    order = [int(node) for node in path if node != virtual]
+    legs = dist[order[:-1], order[1:]].tolist()
+    if round_trip:
+        legs.append(float(dist[order[-1], order[0]]))
+    return order, float(sum(legs)), legs
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+# Why the worker processes couldn't start; solving stays in a thread
+_pool_error: Optional[BaseException] = None
+
+
+def start_pool() -> Optional[ProcessPoolExecutor]:
+    """
+    Start the worker processes with a trivial problem and return the pool,
+    or None when solving runs in a thread (blocking: spawning them takes a
+    while, so call it off the event loop).
+    """
+    global _pool, _pool_error
+    with _pool_lock:
+        if _pool is not None or _pool_error is not None or pool_size <= 0:
+            return _pool
+        # spawn: forking a process that runs threads (executor, watchdog) is unsafe
+        pool = ProcessPoolExecutor(max_workers=pool_size, mp_context=multiprocessing.get_context("spawn"))
+        try:
+            pool.submit(solve, [[0, 0], [0, 1]], None, False, 0.01).result(timeout=POOL_START_TIMEOUT)
+        except Exception as e:
+            pool.shutdown(wait=False, cancel_futures=True)
+            _pool_error = e
+            logger.warning("Route optimizer processes failed to start, solving in a thread instead: %r", e)
+            return None
+        _pool = pool
+        return pool
+
+
+def _discard_pool(pool: ProcessPoolExecutor):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def solve_async(coordinates, start=None, round_trip=False, time_budget=0.25):
+    """
+    Run ``solve`` in the process pool, starting it on first use, or in the
+    bounded blocking pool when there is no process pool.
+    """
+    args = (coordinates, start, round_trip, time_budget)
+    pool = _pool
+    if pool is None and _pool_error is None and pool_size > 0:
+        pool = await run_blocking(start_pool)
+    if pool is not None:
+        try:
+            return await asyncio.get_running_loop().run_in_executor(pool, solve, *args)
+        except BrokenProcessPool as e:
+            # A worker died (e.g. killed for memory): solve this one in a
+            # thread and start a new pool on the next request
+            logger.warning("Route optimizer pool broke, solving in a thread: %r", e)
+            _discard_pool(pool)
+    return await run_blocking(solve, *args)
+
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,138 @@
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, status
+from fastapi.responses import FileResponse, PlainTextResponse
+from pydantic import BaseModel, Field
+from typing import List, Optional
+
+import admission
+import catalog
+import destination_sync
+import locations
+import upstream
+import profiling
+from loop_monitor import run_blocking
+
+
+# Admin endpoints are only available with the ADMIN_TOKEN configured
+async def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not profiling.admin_token():
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin endpoints are disabled (ADMIN_TOKEN not set)"
+        )
+    if not profiling.is_admin_token(x_admin_token):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid admin token"
+        )
+
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["Admin"],
+    dependencies=[Depends(require_admin)],
+    responses={401: {"description": "Invalid admin token"}},
+)
+
+
+# Profiling models
+class ProfilingSettings(BaseModel):
+    enabled: bool
+    slow_threshold_ms: Optional[float] = Field(None, gt=0)
+    sample_rate: float = Field(1.0, ge=0, le=1)
+    max_profiles: int = Field(50, ge=1, le=1000)
+
+
+@router.get("/profiling", response_model=ProfilingSettings)
+async def get_profiling_settings():
+    """
+    Get the current request profiling settings.
+    """
+    return profiling.config.as_dict()
+
+
+@router.put("/profiling", response_model=ProfilingSettings)
+async def update_profiling_settings(settings: ProfilingSettings):
+    """
+    Change request profiling settings without restarting the server.
+    """
+    profiling.config.enabled = settings.enabled
+    profiling.config.slow_threshold_ms = settings.slow_threshold_ms
+    profiling.config.sample_rate = settings.sample_rate
+    profiling.config.max_profiles = settings.max_profiles
+    return profiling.config.as_dict()
+
+
+@router.get("/profiles", response_model=List[dict])
+async def list_profiles():
+    """
+    List captured request profiles, newest first.
+    """
+    return profiling.store.list()
+
+
+@router.get("/profiles/{profile_id}")
+async def download_profile(
+    profile_id: str,
+    format: str = Query("pstats", pattern="^(pstats|text)$"),
+    sort_by: str = Query("cumulative", pattern="^(cumulative|tottime|calls|ncalls)$"),
+    limit: int = Query(50, ge=1, le=500)
+):
+    """
+    Download a captured profile.
+
+    `format=pstats` returns the raw dump for `python -m pstats` or snakeviz;
+    `format=text` returns the top functions as plain text.
+    """
+    try:
+        if format == "text":
+            return PlainTextResponse(profiling.store.render_text(profile_id, sort_by, limit))
+        return FileResponse(
+            profiling.store.file_path(profile_id),
+            media_type="application/octet-stream",
+            filename=f"{profile_id}.prof"
+        )
+    except KeyError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Profile {profile_id} not found"
+        )
+
+
+@router.get("/admission", response_model=dict)
+async def get_admission_settings():
+    """
+    Get the effective admission control settings of each router.
+    """
+    return {
+        "enabled": admission.admission_enabled,
+        "shed_lag_ms": admission.shed_lag * 1000,
+        "critical_lag_ms": admission.critical_lag * 1000,
+        "max_in_flight": admission.max_in_flight,
+        "policies": admission.policies(),
+    }
+
+
+@router.post("/destinations/sync", response_model=dict)
+async def sync_destinations(dry_run: bool = False):
+    """
+    Refresh destination data from restcountries now and return what changed.
+    """
+    try:
+        summary = await destination_sync.sync(dry_run=dry_run)
+    except upstream.UpstreamError as e:
+        raise HTTPException(status_code=e.status_code, detail=f"Sync failed: {e}")
+    if summary is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Another worker is already syncing destinations"
+        )
+    return summary
+
+
+@router.get("/locations/unresolved", response_model=List[dict])
+async def get_unresolved_locations():
+    """
+    List tour locations that don't match any destination, most tours first.
+    """
+    index = await run_blocking(locations.index_for, await catalog.get_catalog())
+    return index.unresolved_report()
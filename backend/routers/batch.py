@@ -0,0 +1,155 @@
+from fastapi import APIRouter, Depends, Request, status
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
+from pydantic import BaseModel, Field
+from urllib.parse import urlsplit
+import asyncio
+import json
+import logging
+import os
+
+import admission
+import catalog
+
+logger = logging.getLogger(__name__)
+
+# Most sub-requests in one batch, and how long one may take
+batch_max_requests = int(os.environ.get("BATCH_MAX_REQUESTS", 20))
+batch_item_timeout = float(os.environ.get("BATCH_ITEM_TIMEOUT_SECONDS", 10))
+
+# Batch models
+class BatchItem(BaseModel):
+    # Relative URL of a GET endpoint, e.g. "/destinations/dest-001/weather"
+    path: str = Field(..., min_length=1, max_length=2048)
+    # Echoed back to match results to requests (default: the item's index)
+    id: Optional[str] = Field(None, max_length=128)
+
+class BatchRequest(BaseModel):
+    requests: List[BatchItem] = Field(..., min_length=1, max_length=batch_max_requests)
+
+# Per-client rate limit for the batch endpoint itself; every sub-request is
+# also admitted and rate limited like a separate request
+admission_policy = admission.policy("batch")
+
+router = APIRouter(
+    prefix="/batch",
+    tags=["Batch"],
+    dependencies=[Depends(admission_policy)],
+)
+
+# Request headers not passed on to sub-requests
+_dropped_headers = {b"content-length", b"content-type", b"transfer-encoding", b"expect"}
+
+def sub_request_scope(scope, path):
+    """
+    ASGI scope for a GET of ``path`` made by the client of ``scope``.
+    """
+    url = urlsplit(path)
+    if url.scheme or url.netloc or not url.path.startswith("/") or url.path.startswith("//"):
+        raise ValueError("path must be a relative URL starting with /")
+    if url.path.rstrip("/") == router.prefix:
+        raise ValueError("batches can't be nested")
+    if url.path.startswith(admission.stream_paths):
+        raise ValueError("streaming endpoints can't be batched")
+    sub_scope = {
+        "type": "http",
+        "asgi": scope.get("asgi", {"version": "3.0"}),
+        "http_version": scope.get("http_version", "1.1"),
+        "method": "GET",
+        "scheme": scope.get("scheme", "http"),
+        "server": scope.get("server"),
+        "client": scope.get("client"),
+        "root_path": scope.get("root_path", ""),
+        "path": url.path,
+        "raw_path": url.path.encode(),
+        "query_string": url.query.encode(),
+        "headers": [(name, value) for name, value in scope["headers"] if name not in _dropped_headers],
+    }
+    if "state" in scope:
+        sub_scope["state"] = dict(scope["state"])
+    return sub_scope
+
+async def dispatch(app, scope):
+    """
+    Run a sub-request through the ASGI app in-process; returns the status,
+    content type and body.
+    """
+    done = asyncio.Event()
+    request_sent = False
+    response = {"status": 500, "content_type": b"", "body": []}
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            for name, value in message.get("headers", ()):
+                if name == b"content-type":
+                    response["content_type"] = value
+        elif message["type"] == "http.response.body":
+            response["body"].append(message.get("body", b""))
+            if not message.get("more_body", False):
+                done.set()
+
+    try:
+        await app(scope, receive, send)
+    finally:
+        done.set()
+    return response["status"], response["content_type"], b"".join(response["body"])
+
+def result_line(index, item_id, status_code, content_type, body):
+    # JSON bodies are spliced in as they are rather than parsed and re-encoded
+    head = json.dumps({"index": index, "id": item_id if item_id is not None else str(index), "status": status_code})
+    if content_type.startswith(b"application/json") and body:
+        return head[:-1].encode() + b', "body": ' + body + b"}\n"
+    return (head[:-1] + ', "body": ' + json.dumps(body.decode("utf-8", "replace")) + "}\n").encode()
+
+def error_line(index, item_id, status_code, detail):
+    return result_line(index, item_id, status_code, b"application/json", json.dumps({"detail": detail}).encode())
+
+@router.post("/")
+async def run_batch(batch: BatchRequest, request: Request):
+    """
+    Run several GET requests in one round trip.
+
+    Sub-requests run concurrently in-process against one catalog snapshot.
+    The response is newline-delimited JSON with one line per sub-request, in
+    order of completion: `{"index", "id", "status", "body"}`.
+    """
+    app = request.app
+    snapshot = await catalog.get_catalog()
+
+    async def run_item(index, item):
+        try:
+            scope = sub_request_scope(request.scope, item.path)
+        except ValueError as e:
+            return error_line(index, item.id, status.HTTP_400_BAD_REQUEST, str(e))
+        # Each task has its own copy of the context, so the pin stays local
+        with catalog.pinned(snapshot):
+            try:
+                status_code, content_type, body = await asyncio.wait_for(dispatch(app, scope), batch_item_timeout)
+            except asyncio.TimeoutError:
+                return error_line(index, item.id, status.HTTP_504_GATEWAY_TIMEOUT, "Sub-request timed out")
+            except Exception as e:
+                logger.error("Batch sub-request %s failed: %s", item.path, e)
+                return error_line(index, item.id, status.HTTP_500_INTERNAL_SERVER_ERROR, "Internal server error")
+        return result_line(index, item.id, status_code, content_type, body)
+
+    # Start the sub-requests now; results are streamed as they complete
+    tasks = [asyncio.ensure_future(run_item(index, item)) for index, item in enumerate(batch.requests)]
+
+    async def results():
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
@@ -0,0 +1,100 @@
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from typing import Optional
+from pydantic import BaseModel, Field
+from datetime import date
+import logging
+
+import admission
+import bookings
+import catalog
+import warmup
+
+logger = logging.getLogger(__name__)
+
+# Booking models
+class BookingCreate(BaseModel):
+    tour_id: str
+    date: date
+    participants: int = Field(..., gt=0)
+    customer_name: str = Field(..., min_length=1)
+    customer_email: Optional[str] = None
+    # Book right away instead of holding the places until confirmed
+    confirm: bool = False
+
+# Per-client rate limit for every endpoint in this router
+admission_policy = admission.policy("bookings")
+
+router = APIRouter(
+    prefix="/bookings",
+    tags=["Bookings"],
+    dependencies=[Depends(admission_policy)],
+    responses={404: {"description": "Booking not found"}},
+)
+
+# Replay the booking log during warm-up rather than on the first request
+@warmup.register("bookings")
+async def warm_bookings():
+    await bookings.get_engine()
+
+@router.post("/", response_model=dict, status_code=status.HTTP_201_CREATED)
+async def create_booking(
+    booking: BookingCreate,
+    idempotency_key: Optional[str] = Header(None, max_length=128),
+):
+    """
+    Hold places on a tour date (or book them with `confirm`).
+
+    Holds expire unless confirmed in time. Send an `Idempotency-Key` header to
+    make retries safe: a repeated key returns the original booking.
+    """
+    tour = (await catalog.get_catalog()).tours.get(booking.tour_id)
+    if not tour:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Tour with ID {booking.tour_id} not found"
+        )
+    if booking.date < date.today():
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_CONTENT, detail="Date is in the past")
+    capacity = tour.get("max_participants", 0)
+    if booking.participants > capacity:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_CONTENT,
+            detail=f"This tour takes at most {capacity} participants"
+        )
+
+    customer = {"customer_name": booking.customer_name}
+    if booking.customer_email:
+        customer["customer_email"] = booking.customer_email
+    engine = await bookings.get_engine()
+    result = await engine.reserve(
+        booking.tour_id, booking.date, booking.participants, capacity,
+        idempotency_key=idempotency_key, customer=customer, confirm=booking.confirm,
+    )
+    return result.to_dict()
+
+@router.get("/{booking_id}", response_model=dict)
+async def get_booking(booking_id: str):
+    """
+    Get a specific booking.
+    """
+    engine = await bookings.get_engine()
+    booking = await engine.get(booking_id)
+    if booking is None:
+        raise bookings.BookingNotFound(booking_id)
+    return booking.to_dict()
+
+@router.post("/{booking_id}/confirm", response_model=dict)
+async def confirm_booking(booking_id: str):
+    """
+    Confirm a held booking before its hold expires. Confirming twice is a no-op.
+    """
+    engine = await bookings.get_engine()
+    return (await engine.confirm(booking_id)).to_dict()
+
+@router.post("/{booking_id}/cancel", response_model=dict)
+async def cancel_booking(booking_id: str):
+    """
+    Cancel a booking and release its places. Cancelling twice is a no-op.
+    """
+    engine = await bookings.get_engine()
+    return (await engine.cancel(booking_id)).to_dict()
@@ -0,0 +1,72 @@
+from fastapi import APIRouter, Depends, Query
+from typing import Optional
+import logging
+
+import admission
+import catalog
+import changes
+from loop_monitor import run_blocking
+
+logger = logging.getLogger(__name__)
+
+# Most changes returned per page
+max_limit = 5000
+
+# Per-client rate limit for every endpoint in this router
+admission_policy = admission.policy("changes")
+
+router = APIRouter(
+    prefix="/changes",
+    tags=["Changes"],
+    dependencies=[Depends(admission_policy)],
+)
+
+@router.get("/", response_model=dict)
+async def list_changes(
+    since: Optional[int] = Query(None, ge=0, description="Version the client is synced to"),
+    epoch: Optional[str] = Query(None, max_length=32, description="Epoch returned with that version"),
+    limit: int = Query(500, ge=1, le=max_limit),
+):
+    """
+    Catalog rows changed after version `since`, oldest first.
+
+    Each change is an `upsert` with the row's current data or a `delete`.
+    Store the returned `version` and `epoch` and pass them back; when
+    `has_more` is set, ask again right away. `resync_required` means the
+    changes since `since` are no longer retained, or `epoch` is missing or
+    from another log: fetch `version` and `epoch` with no `since`, download
+    the full lists and sync from there.
+    """
+    await catalog.get_catalog()
+    log = changes.log
+    snapshot, visible = log.view
+    # A version means nothing without its epoch (another log, or the log
+    # before it was recreated)
+    entries, has_more = (None, False)
+    if since is not None and epoch is not None:
+        # Changes after ``visible`` were recorded by a worker that already
+        # reloaded; this one serves them after its next freshness check
+        entries, has_more = await run_blocking(log.since, epoch, since, visible, limit)
+    if entries is None:
+        return {
+            "epoch": log.epoch,
+            "version": visible,
+            "resync_required": since is not None,
+            "has_more": False,
+            "changes": [],
+        }
+
+    results = []
+    for version, name, row_id in entries:
+        row = snapshot.tables[name].get(row_id) if name in snapshot.tables else None
+        if row is None:
+            results.append({"version": version, "entity": name, "id": row_id, "op": "delete"})
+        else:
+            results.append({"version": version, "entity": name, "id": row_id, "op": "upsert", "data": row.to_dict()})
+    return {
+        "epoch": log.epoch,
+        "version": entries[-1][0] if has_more else max(since, visible),
+        "resync_required": False,
+        "has_more": has_more,
+        "changes": results,
+    }
@@ -1,46 +1,63 @@
-from fastapi import APIRouter, HTTPException, Query
-from typing import List, Optional
-import httpx
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from typing import List, Optional, Tuple
+from pydantic import BaseModel, Field
+import asyncio
+import calendar
+import hashlib
+import importlib
 import os
-import json
-from datetime import datetime
+import logging
+import math
+import zlib
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from itertools import islice
+
+import admission
+import catalog
+import destination_sync
+import event_stream
+import fieldsets
+import locations
+import microcache
+import warmup
+from loop_monitor import run_blocking
+import upstream
+from shared_cache import create_cache
+from routers.tours import Tour, filter_tours, sort_tours
+
+logger = logging.getLogger(__name__)
+
+# Admission control: a per-client rate limit for every endpoint, and a cap on
+# concurrent cache misses (upstream calls, trending/flight recomputation);
+# misses are shed first when the worker is overloaded
+admission_policy = admission.policy("destinations", max_concurrency=4, max_queue=16)
 
 router = APIRouter(
     prefix="/destinations",
     tags=["Destinations"],
+    dependencies=[Depends(admission_policy)],
     responses={404: {"description": "Not found"}},
 )
 
-# Cache for API responses to avoid rate limiting
-cache = {}
+# Cache for API responses to avoid rate limiting (shared between workers
+# when CACHE_BACKEND=sqlite)
 cache_timeout = 3600  # 1 hour
+cache = create_cache("destinations", default_ttl=cache_timeout)
 
-# Base data directory path
-data_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
+# Function to load destinations from the catalog snapshot
+async def load_destinations():
+    return (await catalog.get_catalog()).destinations
 
-# Function to save destinations data
-def save_destinations(destinations):
-    try:
-        file_path = os.path.join(data_dir, "destinations.json")
-        with open(file_path, 'w') as f:
-            json.dump(destinations, f, indent=2)
-        return True
-    except Exception as e:
-        print(f"Error saving destinations: {str(e)}")
-        return False
+# Helper function to scope cache keys to the loaded data files
+def data_cache_key(prefix):
+    return f"{prefix}_{catalog.current().fingerprint}"
 
-# Function to load destinations from local file
-def load_destinations():
-    file_path = os.path.join(data_dir, "destinations.json")
-    if not os.path.exists(file_path):
-        return []
-    
-    try:
-        with open(file_path, 'r') as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"Error loading destinations: {str(e)}")
-        return []
+# httpx is only needed for upstream calls; import it during warm-up instead
+# of at startup
+@warmup.register("httpx")
+async def warm_httpx():
+    await run_blocking(importlib.import_module, "httpx")
 
 # Helper function to convert weather codes to descriptions
 def get_weather_description(code):
@@ -76,48 +93,190 @@ def get_weather_description(code):
     }
     return weather_codes.get(code, "Unknown")
 
+# Function to fetch current weather for a destination from Open-Meteo
+async def fetch_weather(destination):
+    async with admission_policy.cold_path():
+        return await _fetch_weather(destination)
+
+async def _fetch_weather(destination):
+    lat, lng = destination.get("coordinates", [0, 0])[:2]
+    # Use Open-Meteo API for weather data (doesn't require API key)
+    weather_data = await upstream.open_meteo.get_json(
+        "/v1/forecast",
+        params={
+            "latitude": lat,
+            "longitude": lng,
+            "current": "temperature_2m,relative_humidity_2m,apparent_temperature,precipitation,rain,weather_code,wind_speed_10m",
+            "timezone": "auto"
+        }
+    )
+    
+    # Format the weather data
+    if "current" not in weather_data:
+        raise HTTPException(status_code=500, detail="Weather data format not as expected")
+    
+    current = weather_data["current"]
+    units = weather_data.get("current_units", {})
+    return upstream.remember(f"weather_{destination['id']}", {
+        "destination_id": destination["id"],
+        "destination_name": destination["name"],
+        "temperature": {
+            "value": current.get("temperature_2m", 0),
+            "unit": units.get("temperature_2m", "°C")
+        },
+        "apparent_temperature": {
+            "value": current.get("apparent_temperature", 0),
+            "unit": units.get("apparent_temperature", "°C")
+        },
+        "humidity": {
+            "value": current.get("relative_humidity_2m", 0),
+            "unit": units.get("relative_humidity_2m", "%")
+        },
+        "precipitation": {
+            "value": current.get("precipitation", 0),
+            "unit": units.get("precipitation", "mm")
+        },
+        "wind_speed": {
+            "value": current.get("wind_speed_10m", 0),
+            "unit": units.get("wind_speed_10m", "km/h")
+        },
+        "weather_code": current.get("weather_code", 0),
+        "weather_description": get_weather_description(current.get("weather_code", 0)),
+        "timestamp": current.get("time", datetime.now().isoformat()),
+        "data_source": "Open-Meteo API"
+    })
+
+# Hourly series behind the forecast and climate endpoints; numpy is imported
+# during warm-up rather than at startup
+HOURLY_VARIABLES = ("temperature_2m", "precipitation")
+forecast_past_days = 60  # older days come from the Open-Meteo archive API
+forecast_horizon_days = 16
+climate_lag_days = 6  # the archive lags a few days behind
+_hourly_store = None
+_series_locks = defaultdict(asyncio.Lock)
+
+def hourly_store():
+    global _hourly_store
+    if _hourly_store is None:
+        import timeseries
+        _hourly_store = timeseries.HourlyStore("open-meteo", HOURLY_VARIABLES)
+    return _hourly_store
+
+@warmup.register("timeseries")
+async def warm_timeseries():
+    await run_blocking(hourly_store)
+
+# The store's reads can wait for a write in progress, stat its file and load
+# a series from disk, so these helpers are called off the event loop
+def daily_window(destination_id, start_day, end_day):
+    import timeseries
+    return timeseries.daily(hourly_store().window(destination_id, start_day, end_day))
+
+def fetch_times(destination_id, start_day, end_day):
+    return hourly_store().get(destination_id).fetch_times(start_day, end_day)
+
+# Function to fetch one window of hourly data into the local series cache
+async def fetch_hourly(destination, client, start_day, end_day, today):
+    import timeseries
+    lat, lng = destination.get("coordinates", [0, 0])[:2]
+    data = await client.get_json(
+        "/v1/archive" if client is upstream.open_meteo_archive else "/v1/forecast",
+        params={
+            "latitude": lat,
+            "longitude": lng,
+            "hourly": ",".join(HOURLY_VARIABLES),
+            "start_date": timeseries.day_date(start_day).isoformat(),
+            "end_date": timeseries.day_date(end_day).isoformat(),
+            "timezone": "auto"
+        }
+    )
+    hourly = data.get("hourly")
+    if not isinstance(hourly, dict) or "time" not in hourly:
+        raise upstream.UpstreamError(client.name, "hourly data format not as expected")
+    hours = timeseries.parse_hours(hourly["time"])
+    values = {
+        name: timeseries.to_array(hourly.get(name) or [None] * len(hours))
+        for name in HOURLY_VARIABLES
+    }
+    await run_blocking(hourly_store().update, destination["id"], hours, values, start_day, end_day, today)
+
+# Function to make sure the hourly cache covers a date range; only the
+# missing windows are fetched. Returns True when stale data had to be used.
+async def ensure_hourly(destination, start_day, end_day):
+    store = await run_blocking(hourly_store)
+    import timeseries
+    today = timeseries.day_number(datetime.now().date())
+    async with _series_locks[destination["id"]]:
+        windows = await run_blocking(store.missing_windows, destination["id"], start_day, end_day)
+        if not windows:
+            return False
+        try:
+            async with admission_policy.cold_path():
+                for window_start, window_end in windows:
+                    # Split at the boundary between archive and forecast data
+                    boundary = today - forecast_past_days
+                    if window_start < boundary:
+                        await fetch_hourly(destination, upstream.open_meteo_archive, window_start, min(window_end, boundary - 1), today)
+                    if window_end >= boundary:
+                        await fetch_hourly(destination, upstream.open_meteo, max(window_start, boundary), window_end, today)
+        except upstream.UpstreamError:
+            # Serve what we have if every day was fetched at some point
+            fetched_at = await run_blocking(fetch_times, destination["id"], start_day, end_day)
+            if not fetched_at.all():
+                raise
+            return True
+    return False
+
+# Helper function to turn an aggregate array into JSON values
+def json_values(values):
+    import numpy as np
+    return np.where(np.isnan(values), None, np.round(values.astype(float), 1)).tolist()
+
 # Define all the endpoints with exact paths first (no path parameters)
 
-@router.get("/trending", response_model=List[dict])
-async def get_trending_destinations(limit: int = Query(5, ge=1, le=20)):
-    """
-    Get a list of trending travel destinations.
-    
-    This endpoint returns a curated list of destinations that are currently trending based on 
-    real-time data and seasonal travel patterns.
-    """
-    cache_key = f"trending_{limit}"
-    
-    # Check cache first
-    if cache_key in cache:
-        return cache[cache_key]
-    
-    # Get base destinations data
-    destinations = load_destinations()
-    
-    if not destinations:
-        raise HTTPException(status_code=500, detail="Destination data not available")
-    
+# Route optimization runs in worker processes; NumPy is loaded during
+# warm-up rather than at startup, the pool on the first route request
+route_max_destinations = int(os.environ.get("ROUTE_MAX_DESTINATIONS", 300))
+_route_optimizer = None
+
+def route_optimizer():
+    global _route_optimizer
+    if _route_optimizer is None:
+        _route_optimizer = importlib.import_module("route_optimizer")
+    return _route_optimizer
+
+@warmup.register("route-optimizer")
+async def warm_route_optimizer():
+    await run_blocking(route_optimizer)
+
+def shutdown_route_optimizer():
+    if _route_optimizer is not None:
+        _route_optimizer.shutdown()
+
+class RouteRequest(BaseModel):
+    destination_ids: List[str] = Field(..., min_length=2)
+    start_id: Optional[str] = Field(None, description="Destination to start from (default: best start)")
+    round_trip: bool = False
+    time_budget_ms: int = Field(250, ge=10, le=5000, description="Time allowed for improving the route")
+
+# Helper function for the season (northern hemisphere) of a month and the
+# regions and subregions trending in it
+def trending_season(month):
+    if 3 <= month <= 5:  # Spring
+        return "spring", ["Europe", "Asia"], ["Southern Europe", "Eastern Asia", "South-Eastern Asia"]
+    if 6 <= month <= 8:  # Summer
+        return "summer", ["Europe", "North America"], ["Mediterranean", "Northern Europe", "Western Europe", "Caribbean"]
+    if 9 <= month <= 11:  # Fall
+        return "fall", ["Asia", "Oceania"], ["South-Eastern Asia", "Australia and New Zealand"]
+    # Winter
+    return "winter", ["North America", "Asia", "Oceania"], ["Caribbean", "South-Eastern Asia", "Polynesia"]
+
+# Helper function ranking destinations by trending score for a month
+def rank_trending(destinations, month, limit):
     # In a real application, we would integrate with a travel API like Amadeus or Skyscanner
     # For demonstration, we'll simulate trending by selecting destinations from specific regions 
     # based on current season (northern hemisphere)
-    
-    # Get current month to determine season (approximate)
-    current_month = datetime.now().month
-    
-    # Determine season and trending regions
-    if 3 <= current_month <= 5:  # Spring
-        trending_regions = ["Europe", "Asia"]
-        trending_subregions = ["Southern Europe", "Eastern Asia", "South-Eastern Asia"]
-    elif 6 <= current_month <= 8:  # Summer
-        trending_regions = ["Europe", "North America"]
-        trending_subregions = ["Mediterranean", "Northern Europe", "Western Europe", "Caribbean"]
-    elif 9 <= current_month <= 11:  # Fall
-        trending_regions = ["Asia", "Oceania"]
-        trending_subregions = ["South-Eastern Asia", "Australia and New Zealand"]
-    else:  # Winter
-        trending_regions = ["North America", "Asia", "Oceania"]
-        trending_subregions = ["Caribbean", "South-Eastern Asia", "Polynesia"]
+    _, trending_regions, trending_subregions = trending_season(month)
     
     # Filter destinations by trending regions and subregions
     trending_destinations = [
@@ -130,41 +289,123 @@ async def get_trending_destinations(limit: int = Query(5, ge=1, le=20)):
         trending_destinations = sorted(destinations, key=lambda x: x.get("population", 0), reverse=True)
     
     # Add trending score (calculated based on region, population, and a "seasonal factor")
+    scored_destinations = []
     for destination in trending_destinations:
         region_score = 2 if destination.get("region") in trending_regions else 1
         subregion_score = 3 if destination.get("subregion") in trending_subregions else 1
         population_factor = min(destination.get("population", 0) / 10000000, 10)  # Cap at 10
         
         # Calculate trending score
-        destination["trending_score"] = (region_score * subregion_score * population_factor)
+        scored_destinations.append((region_score * subregion_score * population_factor, destination))
     
     # Sort by trending score
-    trending_destinations = sorted(trending_destinations, key=lambda x: x.get("trending_score", 0), reverse=True)
+    scored_destinations.sort(key=lambda x: x[0], reverse=True)
     
-    # Cache results
-    result = trending_destinations[:limit]
-    cache[cache_key] = result
+    return [
+        dict(destination.to_dict(), trending_score=score)
+        for score, destination in scored_destinations[:limit]
+    ]
+
+# Helper function for the most popular destinations (higher population =
+# more popular for this simple example)
+def rank_popular(destinations, limit):
+    return sorted(destinations, key=lambda x: x.get("population", 0), reverse=True)[:limit]
+
+@router.get("/trending", response_model=List[dict])
+async def get_trending_destinations(
+    limit: int = Query(5, ge=1, le=20),
+    fields: Optional[Tuple[str, ...]] = Depends(fieldsets.fields_param),
+):
+    """
+    Get a list of trending travel destinations.
     
-    return result
+    This endpoint returns a curated list of destinations that are currently trending based on 
+    real-time data and seasonal travel patterns.
+    """
+    # Get base destinations data
+    destinations = await load_destinations()
+    
+    cache_key = data_cache_key(f"trending_{limit}")
+    
+    # Check cache first
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return fieldsets.project_dicts(cached, fields) if fields else cached
+    
+    if not destinations:
+        raise HTTPException(status_code=500, detail="Destination data not available")
+    
+    # Recomputing is shed first when the worker is overloaded
+    admission_policy.admit_cold()
+    
+    result = rank_trending(destinations, datetime.now().month, limit)
+    cache.set(cache_key, result)
+    
+    return fieldsets.project_dicts(result, fields) if fields else result
 
 @router.get("/popular", response_model=List[dict])
-async def get_popular_destinations(limit: int = Query(5, ge=1, le=20)):
+@microcache.cached()
+async def get_popular_destinations(
+    limit: int = Query(5, ge=1, le=20),
+    fields: Optional[Tuple[str, ...]] = Depends(fieldsets.fields_param),
+):
     """
     Get a list of popular travel destinations.
     
     This endpoint returns destinations with high populations as a proxy for popularity.
     """
-    destinations = load_destinations()
+    destinations = await load_destinations()
     
-    # Sort by population (higher = more popular for this simple example)
-    sorted_destinations = sorted(destinations, key=lambda x: x.get("population", 0), reverse=True)
+    popular = rank_popular(destinations, limit)
     
-    return sorted_destinations[:limit]
+    if fields:
+        return fieldsets.project_rows(destinations, popular, fields)
+    return [d.to_dict() for d in popular]
+
+# Helper function for the deterministic part of a simulated flight price:
+# returns the distance factor and the base price with popularity and
+# seasonal premiums applied
+def flight_base_price(destination, origin, month):
+    # Base price factors
+    distance_factor = 1.0
+    popularity_factor = 1.0
+    seasonal_factor = 1.0
+    
+    # Calculate distance factor based on region
+    dest_region = destination.get("region", "")
+    if dest_region == "Europe":
+        distance_factor = 1.5 if origin in ["NYC", "BOS", "MIA"] else 2.5
+    elif dest_region == "Asia":
+        distance_factor = 2.5 if origin in ["LAX", "SFO"] else 3.0
+    elif dest_region == "Africa":
+        distance_factor = 2.8
+    elif dest_region == "Oceania":
+        distance_factor = 3.2
+    elif dest_region == "South America":
+        distance_factor = 1.8 if origin in ["MIA", "ATL"] else 2.2
+    else:  # North America, Caribbean, etc.
+        distance_factor = 1.0
+    
+    # Popularity affects price (more popular = higher price)
+    population = destination.get("population", 0)
+    popularity_factor = min(1.0 + (population / 50000000), 1.5)
+    
+    # Seasonal variations
+    if 6 <= month <= 8:  # Summer
+        if dest_region in ["Europe", "North America"]:
+            seasonal_factor = 1.3  # Summer premium for popular destinations
+    elif 11 <= month <= 1:  # Winter holiday season
+        seasonal_factor = 1.25  # Holiday premium
+    
+    # Base price calculation (in USD)
+    base_price = 250 * distance_factor
+    return distance_factor, base_price * popularity_factor * seasonal_factor
 
 @router.get("/flights", response_model=List[dict])
 async def get_flight_estimates(
     origin: str = Query(..., description="Origin city code (e.g., 'NYC', 'LON')"),
-    limit: int = Query(10, ge=1, le=50)
+    limit: int = Query(10, ge=1, le=50),
+    fields: Optional[Tuple[str, ...]] = Depends(fieldsets.fields_param),
 ):
     """
     Get estimated flight prices to various destinations.
@@ -172,17 +413,22 @@ async def get_flight_estimates(
     This endpoint returns simulated flight price data that mimics real-world pricing patterns.
     In a production app, this would integrate with a flight API like Skyscanner or Amadeus.
     """
-    cache_key = f"flights_{origin}_{limit}_{datetime.now().strftime('%Y-%m-%d')}"
+    # Load destinations
+    destinations = await load_destinations()
+    
+    cache_key = data_cache_key(f"flights_{origin}_{limit}_{datetime.now().strftime('%Y-%m-%d')}")
     
     # Check cache
-    if cache_key in cache:
-        return cache[cache_key]
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return fieldsets.project_dicts(cached, fields) if fields else cached
     
-    # Load destinations
-    destinations = load_destinations()
     if not destinations:
         raise HTTPException(status_code=500, detail="Destination data not available")
     
+    # Recomputing is shed first when the worker is overloaded
+    admission_policy.admit_cold()
+    
     # Create a deterministic but seemingly random price generator
     import hashlib
     import random
@@ -196,47 +442,14 @@ async def get_flight_estimates(
     flight_estimates = []
     
     # Generate flight prices for destinations
-    for destination in destinations[:limit]:
-        # Base price factors
-        distance_factor = 1.0
-        popularity_factor = 1.0
-        seasonal_factor = 1.0
-        
-        # Calculate distance factor based on region
-        dest_region = destination.get("region", "")
-        if dest_region == "Europe":
-            distance_factor = 1.5 if origin in ["NYC", "BOS", "MIA"] else 2.5
-        elif dest_region == "Asia":
-            distance_factor = 2.5 if origin in ["LAX", "SFO"] else 3.0
-        elif dest_region == "Africa":
-            distance_factor = 2.8
-        elif dest_region == "Oceania":
-            distance_factor = 3.2
-        elif dest_region == "South America":
-            distance_factor = 1.8 if origin in ["MIA", "ATL"] else 2.2
-        else:  # North America, Caribbean, etc.
-            distance_factor = 1.0
-        
-        # Popularity affects price (more popular = higher price)
-        population = destination.get("population", 0)
-        popularity_factor = min(1.0 + (population / 50000000), 1.5)
-        
-        # Seasonal variations
-        current_month = datetime.now().month
-        if 6 <= current_month <= 8:  # Summer
-            if dest_region in ["Europe", "North America"]:
-                seasonal_factor = 1.3  # Summer premium for popular destinations
-        elif 11 <= current_month <= 1:  # Winter holiday season
-            seasonal_factor = 1.25  # Holiday premium
-        
-        # Base price calculation (in USD)
-        base_price = 250 * distance_factor
+    for destination in islice(destinations, limit):
+        distance_factor, base_price = flight_base_price(destination, origin, datetime.now().month)
         
         # Add "randomness" to make prices look realistic
         random_factor = 0.8 + (random.random() * 0.4)  # 0.8 to 1.2
         
         # Calculate final price
-        flight_price = round(base_price * popularity_factor * seasonal_factor * random_factor, -1)  # Round to nearest 10
+        flight_price = round(base_price * random_factor, -1)  # Round to nearest 10
         
         # Create flight estimate object
         flight_info = {
@@ -260,65 +473,102 @@ async def get_flight_estimates(
     flight_estimates.sort(key=lambda x: x["price_estimate"]["amount"])
     
     # Cache the results
-    cache[cache_key] = flight_estimates
+    cache.set(cache_key, flight_estimates)
     
-    return flight_estimates
+    return fieldsets.project_dicts(flight_estimates, fields) if fields else flight_estimates
+
+# Live flight prices: recomputed once per tick for each origin with open
+# streams and fanned out to its subscribers as deltas
+flight_stream_tick = float(os.environ.get("FLIGHT_STREAM_TICK_SECONDS", 5))
+flight_stream_destinations = int(os.environ.get("FLIGHT_STREAM_DESTINATIONS", 50))
+# Ticks per full cycle of the simulated intraday price drift
+flight_stream_cycle = 720
+
+def flight_stream_price(base_price, seed, tick):
+    # Daily level like /flights plus a slow drift, so only some prices move
+    # from one tick to the next
+    day_factor = 0.8 + (seed % 10000) / 10000 * 0.4
+    phase = (seed >> 16) % flight_stream_cycle
+    drift = 1.0 + 0.04 * math.sin(2 * math.pi * (tick + phase) / flight_stream_cycle)
+    return round(base_price * day_factor * drift, -1)
+
+async def compute_flight_stream(origin, tick):
+    destinations = await load_destinations()
+    now = datetime.now()
+    today = now.strftime('%Y-%m-%d')
+    entries = {}
+    for destination in islice(destinations, flight_stream_destinations):
+        distance_factor, base_price = flight_base_price(destination, origin, now.month)
+        seed = zlib.crc32(f"{origin}_{destination['id']}_{today}".encode())
+        price = flight_stream_price(base_price, seed, tick)
+        previous = flight_stream_price(base_price, seed, tick - 1)
+        entries[destination["id"]] = {
+            "destination_id": destination["id"],
+            "destination_name": destination["name"],
+            "origin": origin,
+            "price_estimate": {"currency": "USD", "amount": price},
+            "flight_time_estimate": f"{round(distance_factor * 3)} hours",
+            "price_trend": "rising" if price > previous else "falling" if price < previous else "stable",
+            "data_source": "Simulated data",
+        }
+    return entries
+
+flight_feeds = event_stream.FeedHub(
+    "flights",
+    compute_flight_stream,
+    tick_seconds=flight_stream_tick,
+    max_subscribers=int(os.environ.get("FLIGHT_STREAM_MAX_SUBSCRIBERS", 10000)),
+    max_feeds=int(os.environ.get("FLIGHT_STREAM_MAX_ORIGINS", 256)),
+    heartbeat=float(os.environ.get("FLIGHT_STREAM_HEARTBEAT_SECONDS", 15)),
+    send_timeout=float(os.environ.get("FLIGHT_STREAM_SEND_TIMEOUT_SECONDS", 30)),
+)
+
+@router.get("/flights/stream")
+async def stream_flight_estimates(
+    origin: str = Query(..., min_length=2, max_length=16, description="Origin city code (e.g., 'NYC', 'LON')"),
+    last_event_id: Optional[str] = Header(None, max_length=32),
+):
+    """
+    Stream live flight price estimates from an origin as server-sent events.
+    
+    The first event is a `snapshot` with every destination; after that,
+    `delta` events carry only the entries whose price changed. Reconnecting
+    with `Last-Event-ID` resumes from the deltas missed in between.
+    """
+    return flight_feeds.stream(origin, last_event_id)
 
 @router.get("/", response_model=List[dict])
+@microcache.cached()
 async def get_destinations(
     query: Optional[str] = None,
     country: Optional[str] = None,
-    limit: int = Query(10, ge=1, le=50)
+    limit: int = Query(10, ge=1, le=50),
+    fields: Optional[Tuple[str, ...]] = Depends(fieldsets.fields_param),
 ):
     """
     Get a list of destinations with real travel data.
     
-    Uses CountryAPI to get real country data.
+    Uses real country data from restcountries, refreshed in the background.
     """
-    cache_key = f"destinations_{query}_{country}_{limit}"
+    # Check if we have local data
+    local_data = await load_destinations()
     
-    # Check if we have cached data
-    if cache_key in cache:
-        return cache[cache_key][:limit]
+    cache_key = data_cache_key(f"destinations_{query}_{country}_{limit}" + (f"_{','.join(fields)}" if fields else ""))
     
-    # Check if we have local data
-    local_data = load_destinations()
-    if local_data:
-        destinations = local_data
-    else:
-        # Fetch real data from API
-        try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.get("https://restcountries.com/v3.1/all")
-                response.raise_for_status()
-                countries_data = response.json()
-                
-                destinations = []
-                for country in countries_data:
-                    try:
-                        destination = {
-                            "id": f"dest-{len(destinations) + 1:03d}",
-                            "name": country.get("name", {}).get("common", "Unknown"),
-                            "capital": country.get("capital", ["Unknown"])[0] if country.get("capital") else "Unknown",
-                            "region": country.get("region", "Unknown"),
-                            "subregion": country.get("subregion", "Unknown"),
-                            "population": country.get("population", 0),
-                            "languages": list(country.get("languages", {}).values()) if country.get("languages") else [],
-                            "currencies": [curr["name"] for curr in country.get("currencies", {}).values()] if country.get("currencies") else [],
-                            "flag": country.get("flags", {}).get("png", ""),
-                            "coordinates": country.get("latlng", [0, 0]),
-                            "timezones": country.get("timezones", []),
-                            "created_at": datetime.now().isoformat(),
-                            "updated_at": datetime.now().isoformat()
-                        }
-                        destinations.append(destination)
-                    except Exception as e:
-                        print(f"Error processing country data: {str(e)}")
-                
-                # Save data to file for future use
-                save_destinations(destinations)
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Failed to fetch destinations: {str(e)}")
+    # Check if we have cached data
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return cached[:limit]
+    
+    if not local_data:
+        # The background sync downloads the data; don't make the request wait
+        destination_sync.request_sync()
+        raise HTTPException(
+            status_code=503,
+            detail="Destination data is not available yet",
+            headers={"Retry-After": "30"}
+        )
+    destinations = list(local_data)
     
     # Filter by query
     if query:
@@ -339,9 +589,74 @@ async def get_destinations(
         ]
     
     # Cache the results
-    cache[cache_key] = destinations
+    if fields:
+        result = fieldsets.project_rows(local_data, destinations[:limit], fields)
+    else:
+        result = [d.to_dict() for d in destinations[:limit]]
+    cache.set(cache_key, result)
     
-    return destinations[:limit]
+    return result
+
+@router.post("/route", response_model=dict)
+async def optimize_route(request: RouteRequest):
+    """
+    Get a short visiting order for a set of destinations.
+
+    The order is built with a nearest-neighbour heuristic and improved with
+    2-opt and Or-opt moves within the time budget; distances are great-circle
+    kilometres between the destinations' coordinates. Results for the same
+    set of destinations are cached.
+    """
+    destination_ids = list(dict.fromkeys(request.destination_ids))
+    if len(destination_ids) > route_max_destinations:
+        raise HTTPException(
+            status_code=422,
+            detail=f"At most {route_max_destinations} destinations can be routed at once",
+        )
+    if request.start_id is not None and request.start_id not in destination_ids:
+        raise HTTPException(status_code=422, detail="start_id must be one of destination_ids")
+
+    destinations = await load_destinations()
+    rows = [destinations.get(destination_id) for destination_id in destination_ids]
+    unknown = [destination_id for destination_id, row in zip(destination_ids, rows) if not row]
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"Destinations not found: {', '.join(unknown)}")
+    coordinates = [row.get("coordinates") for row in rows]
+    missing = [destination_id for destination_id, coords in zip(destination_ids, coordinates)
+               if not coords or len(coords) < 2]
+    if missing:
+        raise HTTPException(
+            status_code=422, detail=f"Destination coordinates not available: {', '.join(missing)}"
+        )
+
+    # The same set of destinations gets the same route whatever order it was
+    # sent in
+    destination_ids, coordinates = zip(*sorted(zip(destination_ids, coordinates)))
+    digest = hashlib.sha1("\n".join(destination_ids).encode()).hexdigest()
+    cache_key = data_cache_key(f"route_{digest}_{request.start_id}_{request.round_trip}")
+
+    async def compute():
+        # Solving is CPU work: shed first under load, and bounded per worker
+        async with admission_policy.cold_path():
+            start = None if request.start_id is None else destination_ids.index(request.start_id)
+            order, total, legs = await route_optimizer().solve_async(
+                [list(coords[:2]) for coords in coordinates], start, request.round_trip,
+                request.time_budget_ms / 1000,
+            )
+        stops = [destination_ids[i] for i in order]
+        if request.round_trip:
+            stops.append(stops[0])
+        return {
+            "order": [destination_ids[i] for i in order],
+            "round_trip": request.round_trip,
+            "total_distance_km": round(total, 1),
+            "legs": [
+                {"from": a, "to": b, "distance_km": round(distance, 1)}
+                for a, b, distance in zip(stops, stops[1:], legs)
+            ],
+        }
+
+    return await cache.get_or_compute(cache_key, compute)
 
 # These endpoints have path parameters, so they should be defined after the fixed-path endpoints
 
@@ -352,95 +667,185 @@ async def get_destination_weather(destination_id: str):
     
     This endpoint returns real weather data for the destination.
     """
-    destinations = load_destinations()
+    destinations = await load_destinations()
     
     # Find the destination
-    destination = None
-    for d in destinations:
-        if d["id"] == destination_id:
-            destination = d
-            break
+    destination = destinations.get(destination_id)
     
     if not destination:
         raise HTTPException(status_code=404, detail="Destination not found")
     
     cache_key = f"weather_{destination_id}_{datetime.now().strftime('%Y-%m-%d')}"
     
-    # Check cache
-    if cache_key in cache:
-        return cache[cache_key]
-    
     # Get coordinates for the destination
     coords = destination.get("coordinates", [0, 0])
     if not coords or len(coords) < 2:
         raise HTTPException(status_code=404, detail="Destination coordinates not available")
     
-    # Use Open-Meteo API for weather data (doesn't require API key)
+    # Concurrent misses for the same destination share one upstream call
     try:
-        lat, lng = coords
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(
-                "https://api.open-meteo.com/v1/forecast",
-                params={
-                    "latitude": lat,
-                    "longitude": lng,
-                    "current": "temperature_2m,relative_humidity_2m,apparent_temperature,precipitation,rain,weather_code,wind_speed_10m",
-                    "timezone": "auto"
-                }
-            )
-            response.raise_for_status()
-            weather_data = response.json()
-            
-            # Format the weather data
-            if "current" in weather_data:
-                current = weather_data["current"]
-                weather_info = {
-                    "destination_id": destination_id,
-                    "destination_name": destination["name"],
-                    "temperature": {
-                        "value": current.get("temperature_2m", 0),
-                        "unit": weather_data.get("current_units", {}).get("temperature_2m", "°C")
-                    },
-                    "apparent_temperature": {
-                        "value": current.get("apparent_temperature", 0),
-                        "unit": weather_data.get("current_units", {}).get("apparent_temperature", "°C")
-                    },
-                    "humidity": {
-                        "value": current.get("relative_humidity_2m", 0),
-                        "unit": weather_data.get("current_units", {}).get("relative_humidity_2m", "%")
-                    },
-                    "precipitation": {
-                        "value": current.get("precipitation", 0),
-                        "unit": weather_data.get("current_units", {}).get("precipitation", "mm")
-                    },
-                    "wind_speed": {
-                        "value": current.get("wind_speed_10m", 0),
-                        "unit": weather_data.get("current_units", {}).get("wind_speed_10m", "km/h")
-                    },
-                    "weather_code": current.get("weather_code", 0),
-                    "weather_description": get_weather_description(current.get("weather_code", 0)),
-                    "timestamp": current.get("time", datetime.now().isoformat()),
-                    "data_source": "Open-Meteo API"
-                }
-                
-                # Cache the result
-                cache[cache_key] = weather_info
-                
-                return weather_info
-            else:
-                raise HTTPException(status_code=500, detail="Weather data format not as expected")
+        return await cache.get_or_compute(cache_key, lambda: fetch_weather(destination))
+    except HTTPException:
+        raise
+    except upstream.UpstreamError as e:
+        # Serve the last good reading, marked stale, rather than an error
+        return upstream.stale_or_raise(f"weather_{destination_id}", e, lambda w: dict(w, stale=True))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch weather data: {str(e)}")
 
+@router.get("/{destination_id}/forecast", response_model=dict)
+async def get_destination_forecast(
+    destination_id: str,
+    start_date: Optional[date] = Query(None, description="First day (default: today)"),
+    end_date: Optional[date] = Query(None, description="Last day (default: 6 days after start_date)")
+):
+    """
+    Get daily weather for a date range at a destination.
+    
+    Returns minimum, maximum and mean temperature and total precipitation per day,
+    from forecasts for upcoming days and recorded weather for past days.
+    """
+    destinations = await load_destinations()
+    destination = destinations.get(destination_id)
+    if not destination:
+        raise HTTPException(status_code=404, detail="Destination not found")
+    
+    today = datetime.now().date()
+    start_date = start_date or today
+    end_date = end_date or start_date + timedelta(days=6)
+    if end_date < start_date:
+        raise HTTPException(status_code=400, detail="end_date must not be before start_date")
+    if (end_date - start_date).days >= 31:
+        raise HTTPException(status_code=400, detail="Date range is limited to 31 days")
+    if end_date > today + timedelta(days=forecast_horizon_days - 1):
+        raise HTTPException(status_code=400, detail=f"Forecasts are available up to {forecast_horizon_days} days ahead")
+    
+    # Imports timeseries (and NumPy) off the event loop if warm-up hasn't yet
+    store = await run_blocking(hourly_store)
+    import timeseries
+    start_day, end_day = timeseries.day_number(start_date), timeseries.day_number(end_date)
+    if start_day < timeseries.day_number(today) - store.retention_days:
+        raise HTTPException(status_code=400, detail="start_date is too far in the past")
+    
+    stale = await ensure_hourly(destination, start_day, end_day)
+    days = await run_blocking(daily_window, destination_id, start_day, end_day)
+    values = {name: json_values(array) for name, array in days.items()}
+    
+    result = {
+        "destination_id": destination["id"],
+        "destination_name": destination["name"],
+        "start_date": start_date.isoformat(),
+        "end_date": end_date.isoformat(),
+        "units": {"temperature": "°C", "precipitation": "mm"},
+        "days": [
+            {"date": (start_date + timedelta(days=i)).isoformat(), **{name: values[name][i] for name in values}}
+            for i in range(end_day - start_day + 1)
+        ],
+        "data_source": "Open-Meteo API"
+    }
+    if stale:
+        result["stale"] = True
+    return result
+
+@router.get("/{destination_id}/climate", response_model=dict)
+async def get_destination_climate(destination_id: str, years: int = Query(1, ge=1, le=3)):
+    """
+    Get climate-style monthly averages for a destination.
+    
+    Averages recorded daily temperatures and monthly precipitation over the last `years` years.
+    """
+    destinations = await load_destinations()
+    destination = destinations.get(destination_id)
+    if not destination:
+        raise HTTPException(status_code=404, detail="Destination not found")
+    
+    await run_blocking(hourly_store)
+    import timeseries
+    end_date = datetime.now().date() - timedelta(days=climate_lag_days)
+    end_day = timeseries.day_number(end_date)
+    start_day = end_day - 365 * years + 1
+    
+    stale = await ensure_hourly(destination, start_day, end_day)
+    days = await run_blocking(daily_window, destination_id, start_day, end_day)
+    months = timeseries.monthly(start_day, days)
+    values = {name: json_values(months[name]) for name in days}
+    
+    result = {
+        "destination_id": destination["id"],
+        "destination_name": destination["name"],
+        "start_date": timeseries.day_date(start_day).isoformat(),
+        "end_date": end_date.isoformat(),
+        "units": {"temperature": "°C", "precipitation": "mm"},
+        "months": [
+            {
+                "month": month + 1,
+                "name": calendar.month_name[month + 1],
+                **{name: values[name][month] for name in values},
+                "days": int(months["days"][month])
+            }
+            for month in range(12)
+        ],
+        "data_source": "Open-Meteo API"
+    }
+    if stale:
+        result["stale"] = True
+    return result
+
+# Location index linking tours to destinations, rebuilt off the event loop
+# when the tours or destinations changed
+async def location_index():
+    snapshot = await catalog.get_catalog()
+    index = locations.current()
+    if locations.is_current(index, snapshot):
+        return index
+    return await run_blocking(locations.index_for, snapshot)
+
+@warmup.register("locations")
+async def warm_locations():
+    await location_index()
+
+@router.get("/{destination_id}/tours", response_model=List[Tour])
+@microcache.cached()
+async def get_destination_tours(
+    destination_id: str,
+    location: Optional[str] = None,
+    guide_id: Optional[str] = None,
+    language: Optional[str] = None,
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    sort_by: Optional[str] = "rating",
+    fields: Optional[Tuple[str, ...]] = Depends(fieldsets.fields_param),
+):
+    """
+    Get the tours in a destination, with the same filters and sort orders
+    as the tour list.
+
+    Tour locations are matched to destinations when the catalog is loaded,
+    so only the destination's own tours are looked at.
+    """
+    index = await location_index()
+    if index.destinations.get(destination_id) is None:
+        raise HTTPException(status_code=404, detail="Destination not found")
+    table = index.tours
+    rows = [table.row(i) for i in index.tour_rows(destination_id)]
+    tours = sort_tours(filter_tours(rows, location, guide_id, language, min_price, max_price), sort_by)
+    
+    if fields:
+        return fieldsets.model_response(Tour, fieldsets.project_rows(table, tours, fields), fields)
+    return [t.to_dict() for t in tours]
+
 @router.get("/{destination_id}", response_model=dict)
-async def get_destination(destination_id: str):
+@microcache.cached()
+async def get_destination(destination_id: str, fields: Optional[Tuple[str, ...]] = Depends(fieldsets.fields_param)):
     """
     Get detailed information about a specific destination.
     """
-    destinations = load_destinations()
+    destinations = await load_destinations()
     
-    for destination in destinations:
-        if destination["id"] == destination_id:
-            return destination
+    destination = destinations.get(destination_id)
+    if destination:
+        if fields:
+            return fieldsets.projector(destinations, fields)(destination.index)
+        return destination.to_dict()
     
     raise HTTPException(status_code=404, detail="Destination not found") 
\ No newline at end of file
@@ -0,0 +1,182 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import Optional
+import csv
+import io
+import json
+import logging
+import os
+import zlib
+
+import admission
+import catalog
+from loop_monitor import run_blocking
+
+logger = logging.getLogger(__name__)
+
+# Rows serialized per chunk (off the event loop), and concurrent exports
+# per worker
+export_batch_rows = int(os.environ.get("EXPORT_BATCH_ROWS", 2000))
+max_exports = int(os.environ.get("EXPORT_MAX_CONCURRENT", 4))
+# Compression level for gzip-encoded exports (1 is fastest)
+gzip_level = int(os.environ.get("EXPORT_GZIP_LEVEL", 6))
+
+# Per-client rate limit for every endpoint in this router
+admission_policy = admission.policy("export", rate=1, burst=10)
+
+router = APIRouter(
+    prefix="/export",
+    tags=["Export"],
+    dependencies=[Depends(admission_policy)],
+)
+
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+_encode_json = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+
+# Exports currently streaming in this worker
+_active = 0
+
+def _csv_cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (list, dict)):
+        return _encode_json(value)
+    return value
+
+def _csv_value(row, path):
+    top, _, sub = path.partition(".")
+    value = row.get(top)
+    if sub:
+        value = value.get(sub) if isinstance(value, dict) else None
+    return _csv_cell(value)
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    """
+    Whether an Accept-Encoding header allows gzip: listed (or ``*``) with a
+    q-value above 0, so "gzip;q=0" refuses it.
+    """
+    wildcard = False
+    for item in accept_encoding.split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip().lower()
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding in ("gzip", "x-gzip"):
+            return quality > 0
+        if coding == "*":
+            wildcard = quality > 0
+    return wildcard
+
+def busy_response():
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Too many exports in progress, retry later"},
+        headers={"Retry-After": "30"},
+    )
+
+def serialize_rows(table, positions, export_format, compressor=None, header=False) -> bytes:
+    """
+    One chunk of the export: the rows at ``positions`` serialized (and
+    compressed) in one go (blocking; call off the event loop).
+    """
+    if export_format == "ndjson":
+        data = "".join([_encode_json(table.to_dict(i)) + "\n" for i in positions])
+    else:
+        # Columns are the schema's field paths; nested fields are flattened
+        # ("contact.email") and lists are JSON-encoded
+        columns = [path for path, _ in table.schema]
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        if header:
+            writer.writerow(columns)
+        for i in positions:
+            row = table.to_dict(i)
+            writer.writerow([_csv_value(row, path) for path in columns])
+        data = buffer.getvalue()
+    encoded = data.encode()
+    return compressor.compress(encoded) if compressor is not None else encoded
+
+class ExportResponse(StreamingResponse):
+    """
+    Streaming export holding one of the worker's export slots while it is
+    sent; 503 if none is free by then.
+    """
+
+    async def __call__(self, scope, receive, send):
+        global _active
+        if _active >= max_exports:
+            await busy_response()(scope, receive, send)
+            return
+        _active += 1
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            _active -= 1
+
+@router.get("/{entity}")
+async def export_entity(
+    entity: str,
+    request: Request,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    cursor: Optional[str] = Query(None, max_length=256, description="Resume after the row with this id"),
+):
+    """
+    Stream every row of `tours`, `tour_guides` or `destinations` as NDJSON
+    or CSV, ordered by id.
+
+    Rows come from the catalog snapshot current when the export started and
+    are serialized in chunks, so memory use doesn't grow with the table.
+    Send `Accept-Encoding: gzip` to get the stream gzip-compressed. To resume
+    an interrupted export, pass the id of the last row received as `cursor`.
+    """
+    name = entity.replace("-", "_")
+    snapshot = await catalog.get_catalog()
+    table = snapshot.tables.get(name)
+    if table is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Unknown entity '{entity}'; use {', '.join(snapshot.tables)}"
+        )
+    # Checked again when the response starts, which is when a slot is taken
+    if _active >= max_exports:
+        return busy_response()
+
+    start = table.position_after(cursor) if cursor is not None else 0
+    compressor = None
+    if accepts_gzip(request.headers.get("accept-encoding", "")):
+        compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+    id_index = table.id_index
+
+    async def chunks():
+        position = start
+        header = format == "csv"
+        while position < len(id_index) or header:
+            positions = id_index[position:position + export_batch_rows]
+            chunk = await run_blocking(serialize_rows, table, positions, format, compressor, header)
+            position += len(positions)
+            header = False
+            if chunk:
+                yield chunk
+        if compressor is not None:
+            yield compressor.flush()
+
+    headers = {
+        "Content-Disposition": f'attachment; filename="{name}.{format}"',
+        "X-Export-Rows": str(len(id_index) - start),
+        "Vary": "Accept-Encoding",
+    }
+    if compressor is not None:
+        headers["Content-Encoding"] = "gzip"
+    return ExportResponse(chunks(), media_type=FORMATS[format], headers=headers)
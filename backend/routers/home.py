@@ -0,0 +1,124 @@
+from fastapi import APIRouter, Depends, Request, Response
+from typing import NamedTuple, Optional
+from datetime import datetime
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+
+import admission
+import catalog
+import warmup
+from loop_monitor import run_blocking
+from routers.destinations import rank_popular, rank_trending, trending_season
+from routers.export import accepts_gzip
+
+logger = logging.getLogger(__name__)
+
+# Items in each section of the homepage
+section_size = int(os.environ.get("HOME_SECTION_SIZE", 5))
+# How long clients and proxies may reuse the page without revalidating
+home_max_age = int(os.environ.get("HOME_MAX_AGE_SECONDS", 60))
+
+# Per-client rate limit for every endpoint in this router
+admission_policy = admission.policy("home")
+
+router = APIRouter(
+    tags=["Home"],
+    dependencies=[Depends(admission_policy)],
+)
+
+class HomePage(NamedTuple):
+    """
+    The serialized homepage for one catalog snapshot and season.
+    """
+    snapshot: catalog.Catalog
+    season: str
+    body: bytes
+    gzipped: bytes
+    etag: str
+
+def build_home(snapshot, month) -> HomePage:
+    """
+    Rank every section and serialize the page (blocking; call off the event
+    loop).
+    """
+    season = trending_season(month)[0]
+    page = {
+        "season": season,
+        "trending_destinations": rank_trending(snapshot.destinations, month, section_size),
+        "popular_destinations": [d.to_dict() for d in rank_popular(snapshot.destinations, section_size)],
+        "top_rated_tours": [
+            t.to_dict() for t in sorted(snapshot.tours, key=lambda t: t.get("rating", 0), reverse=True)[:section_size]
+        ],
+        "featured_guides": [
+            g.to_dict() for g in sorted(snapshot.tour_guides, key=lambda g: g.get("rating", 0), reverse=True)[:section_size]
+        ],
+    }
+    body = json.dumps(page, separators=(",", ":")).encode()
+    # The ETag only depends on the content, so every worker agrees on it
+    etag = '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+    return HomePage(snapshot, season, body, gzip.compress(body, compresslevel=9, mtime=0), etag)
+
+# The last built page, and a rebuild after a catalog or season change
+# running in the background while requests keep getting the previous page
+_page: Optional[HomePage] = None
+_rebuild: Optional[asyncio.Task] = None
+
+async def _build_page(snapshot, month):
+    global _page
+    try:
+        _page = await run_blocking(build_home, snapshot, month)
+    except Exception as e:
+        logger.error("Rebuilding the homepage failed: %s", e)
+
+async def home_page() -> HomePage:
+    global _page, _rebuild
+    snapshot = await catalog.get_catalog()
+    month = datetime.now().month
+    page = _page
+    if page is None:
+        _page = page = await run_blocking(build_home, snapshot, month)
+    elif (page.snapshot is not snapshot or page.season != trending_season(month)[0]) and (
+        _rebuild is None or _rebuild.done()
+    ):
+        _rebuild = asyncio.get_running_loop().create_task(_build_page(snapshot, month))
+    return page
+
+@warmup.register("home")
+async def warm_home():
+    await home_page()
+
+def _etag_matches(if_none_match, etag):
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+@router.get("/home")
+async def get_home(request: Request):
+    """
+    Everything the landing page shows in one response: trending and popular
+    destinations, top-rated tours and featured guides.
+
+    The page is built once per catalog version and season and served as
+    stored bytes with an `ETag`; send `If-None-Match` to get a 304 when it
+    hasn't changed.
+    """
+    page = await home_page()
+    # The compressed representation has its own ETag
+    compressed = accepts_gzip(request.headers.get("accept-encoding", ""))
+    etag = page.etag[:-1] + '-gzip"' if compressed else page.etag
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={home_max_age}",
+        "Vary": "Accept-Encoding",
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    if compressed:
+        headers["Content-Encoding"] = "gzip"
+        return Response(page.gzipped, media_type="application/json", headers=headers)
+    return Response(page.body, media_type="application/json", headers=headers)
@@ -0,0 +1,66 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from typing import List, Optional
+import asyncio
+import logging
+
+import admission
+import catalog
+import suggestions
+import warmup
+from loop_monitor import run_blocking
+
+logger = logging.getLogger(__name__)
+
+# Per-client rate limit for every endpoint in this router
+admission_policy = admission.policy("search")
+
+router = APIRouter(
+    tags=["Search"],
+    dependencies=[Depends(admission_policy)],
+)
+
+# Rebuild of the suggestion index after a catalog change, running in the
+# background while requests keep using the previous index
+_rebuild: Optional[asyncio.Task] = None
+
+async def _build_index(snapshot):
+    try:
+        await run_blocking(suggestions.index_for, snapshot)
+    except Exception as e:
+        logger.error("Rebuilding the suggestion index failed: %s", e)
+
+async def suggestion_index():
+    global _rebuild
+    snapshot = await catalog.get_catalog()
+    index = suggestions.current()
+    if index is None:
+        return await run_blocking(suggestions.index_for, snapshot)
+    if not suggestions.is_current(index, snapshot) and (_rebuild is None or _rebuild.done()):
+        _rebuild = asyncio.get_running_loop().create_task(_build_index(snapshot))
+    return index
+
+@warmup.register("suggestions")
+async def warm_suggestions():
+    await suggestion_index()
+
+@router.get("/suggest", response_model=List[dict])
+async def suggest(
+    q: str = Query(..., min_length=1, max_length=100, description="What has been typed so far"),
+    types: Optional[str] = Query(None, description="Comma-separated: destination, tour, guide (default: all)"),
+    limit: int = Query(8, ge=1, le=suggestions.MAX_LIMIT),
+):
+    """
+    Suggest destinations, tours and guides whose name (or capital, location,
+    specialization) has a word starting with the query, most popular first.
+    """
+    selected = suggestions.TYPE_NAMES
+    if types:
+        selected = tuple(name.strip() for name in types.split(",") if name.strip())
+        unknown = [name for name in selected if name not in suggestions.TYPE_NAMES]
+        if unknown:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_CONTENT,
+                detail=f"Unknown type '{unknown[0]}'; use {', '.join(suggestions.TYPE_NAMES)}"
+            )
+    index = await suggestion_index()
+    return index.suggest(q, selected, limit)
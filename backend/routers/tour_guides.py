@@ -1,38 +1,34 @@
 import os
-import json
-from fastapi import APIRouter, HTTPException, status, Query
-from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from typing import List, Optional, Tuple
 from pydantic import BaseModel, Field
-from datetime import datetime
-import sys
+from datetime import date, datetime
+import importlib
+import logging
+import time
 
-# Add parent directory to path to import from main
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import admission
+import catalog
+import fieldsets
+import microcache
+import warmup
+from loop_monitor import run_blocking
+
+logger = logging.getLogger(__name__)
+
+# Most tour requests in one assignment call
+assign_max_requests = int(os.environ.get("ASSIGN_MAX_REQUESTS", 10000))
+
+# Per-client rate limit for every endpoint in this router
+admission_policy = admission.policy("tour-guides")
 
 router = APIRouter(
     prefix="/tour-guides",
     tags=["Tour Guides"],
+    dependencies=[Depends(admission_policy)],
     responses={404: {"description": "Tour guide not found"}},
 )
 
-# Replace import from main to avoid circular import
-# from main import load_data
-
-# Copy of the load_data function from main.py
-def load_data(file_name):
-    data_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
-    file_path = os.path.join(data_dir, file_name)
-    
-    if not os.path.exists(file_path):
-        return []
-    
-    try:
-        with open(file_path, 'r') as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"Error loading {file_name}: {str(e)}")
-        return []
-
 # Tour Guide models
 class TourGuideContact(BaseModel):
     email: str
@@ -67,21 +63,77 @@ class TourGuide(TourGuideBase):
     class Config:
         orm_mode = True
 
+# Assignment models
+class TourRequestItem(BaseModel):
+    # Echoed back to match results to requests (default: the item's index)
+    id: Optional[str] = Field(None, max_length=128)
+    date: date
+    language: str = Field(..., min_length=1, max_length=64)
+    specialization: Optional[str] = Field(None, max_length=128)
+    group_size: int = Field(1, gt=0, le=1000)
+
+class AssignmentBatch(BaseModel):
+    requests: List[TourRequestItem] = Field(..., min_length=1, max_length=assign_max_requests)
+    # Requests a guide can take per day (default: ASSIGN_GUIDE_DAILY_CAPACITY)
+    daily_capacity: Optional[int] = Field(None, ge=1, le=24)
+
+class Assignment(BaseModel):
+    request_id: str
+    guide_id: str
+    score: float
+    specialization_match: bool
+
+class UnassignedRequest(BaseModel):
+    request_id: str
+    reason: str
+
+class AssignmentResult(BaseModel):
+    assignments: List[Assignment]
+    unassigned: List[UnassignedRequest]
+    guides_used: int
+    elapsed_ms: float
+
 # Helper function to load tour guides data
-def get_tour_guides():
-    return load_data("tour_guides.json")
+async def get_tour_guides():
+    return (await catalog.get_catalog()).tour_guides
+
+# Assignment solver (NumPy); loaded and its guide arrays built during warm-up
+# rather than at startup
+_assignment = None
+
+def assignment():
+    global _assignment
+    if _assignment is None:
+        _assignment = importlib.import_module("assignment")
+    return _assignment
+
+async def guide_matrix():
+    tour_guides = await get_tour_guides()
+    matrix = assignment().current()
+    if matrix is not None and matrix.table is tour_guides:
+        return matrix
+    # Building (or rebuilding after a data change) is CPU work
+    return await run_blocking(assignment().matrix_for, tour_guides)
+
+@warmup.register("assignment")
+async def warm_assignment():
+    await run_blocking(assignment)
+    await guide_matrix()
 
 @router.get("/", response_model=List[TourGuide])
+@microcache.cached()
 async def get_all_tour_guides(
     specialization: Optional[str] = None,
     language: Optional[str] = None,
     min_rating: Optional[float] = Query(None, ge=0, le=5),
-    sort_by: Optional[str] = "rating"
+    sort_by: Optional[str] = "rating",
+    fields: Optional[Tuple[str, ...]] = Depends(fieldsets.fields_param),
 ):
     """
     Get all tour guides with optional filtering.
     """
-    tour_guides = get_tour_guides()
+    table = await get_tour_guides()
+    tour_guides = list(table)
     
     # Apply filters
     if specialization:
@@ -101,17 +153,67 @@ async def get_all_tour_guides(
     elif sort_by == "name":
         tour_guides = sorted(tour_guides, key=lambda tg: tg["name"])
     
-    return tour_guides
+    if fields:
+        return fieldsets.model_response(TourGuide, fieldsets.project_rows(table, tour_guides, fields), fields)
+    return [tg.to_dict() for tg in tour_guides]
+
+@router.post("/assign", response_model=AssignmentResult)
+async def assign_tour_guides(batch: AssignmentBatch):
+    """
+    Assign guides to a batch of tour requests.
+
+    A guide can take a request if they speak its language and work on the
+    weekday of its date; guides whose specialization matches score higher,
+    then by rating and experience. Each guide takes at most `daily_capacity`
+    requests per day. Scarce requests (few suitable guides) are placed
+    first, larger groups first among equals, and every request that can't
+    be placed comes back with the reason.
+    """
+    started = time.perf_counter()
+    async with admission_policy.cold_path():
+        matrix = await guide_matrix()
+        requests = [
+            assignment().TourRequest(item.date, item.language, item.specialization, item.group_size)
+            for item in batch.requests
+        ]
+        capacity = batch.daily_capacity or assignment().default_daily_capacity
+        chosen, reasons = await run_blocking(assignment().assign, matrix, requests, capacity)
+
+    assignments = []
+    unassigned = []
+    guides_used = set()
+    for i, item in enumerate(batch.requests):
+        request_id = item.id if item.id is not None else str(i)
+        if chosen[i] is None:
+            unassigned.append({"request_id": request_id, "reason": reasons[i]})
+            continue
+        guide, score, specialization_match = chosen[i]
+        guides_used.add(guide)
+        assignments.append({
+            "request_id": request_id,
+            "guide_id": matrix.ids[guide],
+            "score": round(score, 4),
+            "specialization_match": specialization_match,
+        })
+    return {
+        "assignments": assignments,
+        "unassigned": unassigned,
+        "guides_used": len(guides_used),
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
 
 @router.get("/{guide_id}", response_model=TourGuide)
-async def get_tour_guide(guide_id: str):
+@microcache.cached()
+async def get_tour_guide(guide_id: str, fields: Optional[Tuple[str, ...]] = Depends(fieldsets.fields_param)):
     """
     Get a specific tour guide by ID.
     """
-    tour_guides = get_tour_guides()
-    for guide in tour_guides:
-        if guide["id"] == guide_id:
-            return guide
+    tour_guides = await get_tour_guides()
+    guide = tour_guides.get(guide_id)
+    if guide:
+        if fields:
+            return fieldsets.model_response(TourGuide, fieldsets.projector(tour_guides, fields)(guide.index), fields)
+        return guide.to_dict()
     
     raise HTTPException(
         status_code=status.HTTP_404_NOT_FOUND,
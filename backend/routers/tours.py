@@ -1,30 +1,19 @@
-from fastapi import APIRouter, HTTPException, status, Query
-from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from typing import List, Optional, Tuple
 from pydantic import BaseModel, Field
-from datetime import datetime
-import sys
-import os
-import json
-
-# Remove this to avoid circular import
-# Add parent directory to path to import from main
-# sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-# from main import load_data
-
-# Copy of the load_data function from main.py
-def load_data(file_name):
-    data_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
-    file_path = os.path.join(data_dir, file_name)
-    
-    if not os.path.exists(file_path):
-        return []
-    
-    try:
-        with open(file_path, 'r') as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"Error loading {file_name}: {str(e)}")
-        return []
+from datetime import date, datetime, timedelta
+import importlib
+import logging
+
+import admission
+import bookings
+import catalog
+import fieldsets
+import microcache
+import warmup
+from loop_monitor import run_blocking
+
+logger = logging.getLogger(__name__)
 
 # Tour models
 class TourBase(BaseModel):
@@ -51,33 +40,50 @@ class Tour(TourBase):
     class Config:
         orm_mode = True
 
+# Per-client rate limit for every endpoint in this router
+admission_policy = admission.policy("tours")
+
 router = APIRouter(
     prefix="/tours",
     tags=["Tours"],
+    dependencies=[Depends(admission_policy)],
     responses={404: {"description": "Tour not found"}},
 )
 
 # Helper function to load tours data
-def get_tours():
-    return load_data("tours.json")
+async def get_tours():
+    return (await catalog.get_catalog()).tours
 
 # Helper function to load tour guides data
-def get_tour_guides():
-    return load_data("tour_guides.json")
+async def get_tour_guides():
+    return (await catalog.get_catalog()).tour_guides
 
-@router.get("/", response_model=List[Tour])
-async def get_all_tours(
-    location: Optional[str] = None,
-    guide_id: Optional[str] = None,
-    language: Optional[str] = None,
-    min_price: Optional[float] = Query(None, ge=0),
-    max_price: Optional[float] = Query(None, ge=0),
-    sort_by: Optional[str] = "rating"
-):
-    """
-    Get all tours with optional filtering.
-    """
-    tours = get_tours()
+# Similar-tours index (NumPy); loaded and built during warm-up rather than
+# at startup
+_recommendations = None
+
+def recommendations():
+    global _recommendations
+    if _recommendations is None:
+        _recommendations = importlib.import_module("recommendations")
+    return _recommendations
+
+async def similarity_index():
+    tours = await get_tours()
+    index = recommendations().current()
+    if index is not None and index.table is tours:
+        return index
+    # Building (or updating after a data change) is CPU work
+    return await run_blocking(recommendations().index_for, tours)
+
+@warmup.register("recommendations")
+async def warm_recommendations():
+    await run_blocking(recommendations)
+    await similarity_index()
+
+# Helper function applying the tour list filters
+def filter_tours(tours, location=None, guide_id=None, language=None, min_price=None, max_price=None):
+    tours = list(tours)
     
     # Apply filters
     if location:
@@ -95,6 +101,10 @@ async def get_all_tours(
     if max_price is not None:
         tours = [t for t in tours if t["price"] <= max_price]
     
+    return tours
+
+# Helper function applying a tour list sort order
+def sort_tours(tours, sort_by):
     # Apply sorting
     if sort_by == "rating":
         tours = sorted(tours, key=lambda t: t["rating"], reverse=True)
@@ -107,15 +117,39 @@ async def get_all_tours(
     
     return tours
 
+@router.get("/", response_model=List[Tour])
+@microcache.cached()
+async def get_all_tours(
+    location: Optional[str] = None,
+    guide_id: Optional[str] = None,
+    language: Optional[str] = None,
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    sort_by: Optional[str] = "rating",
+    fields: Optional[Tuple[str, ...]] = Depends(fieldsets.fields_param),
+):
+    """
+    Get all tours with optional filtering.
+    """
+    table = await get_tours()
+    tours = sort_tours(filter_tours(table, location, guide_id, language, min_price, max_price), sort_by)
+    
+    if fields:
+        return fieldsets.model_response(Tour, fieldsets.project_rows(table, tours, fields), fields)
+    return [t.to_dict() for t in tours]
+
 @router.get("/{tour_id}", response_model=Tour)
-async def get_tour(tour_id: str):
+@microcache.cached()
+async def get_tour(tour_id: str, fields: Optional[Tuple[str, ...]] = Depends(fieldsets.fields_param)):
     """
     Get a specific tour by ID.
     """
-    tours = get_tours()
-    for tour in tours:
-        if tour["id"] == tour_id:
-            return tour
+    tours = await get_tours()
+    tour = tours.get(tour_id)
+    if tour:
+        if fields:
+            return fieldsets.model_response(Tour, fieldsets.projector(tours, fields)(tour.index), fields)
+        return tour.to_dict()
     
     raise HTTPException(
         status_code=status.HTTP_404_NOT_FOUND,
@@ -123,16 +157,13 @@ async def get_tour(tour_id: str):
     )
 
 @router.get("/{tour_id}/guide", response_model=dict)
-async def get_tour_guide(tour_id: str):
+@microcache.cached()
+async def get_tour_guide(tour_id: str, fields: Optional[Tuple[str, ...]] = Depends(fieldsets.fields_param)):
     """
     Get the guide information for a specific tour.
     """
-    tours = get_tours()
-    tour = None
-    for t in tours:
-        if t["id"] == tour_id:
-            tour = t
-            break
+    tours = await get_tours()
+    tour = tours.get(tour_id)
     
     if not tour:
         raise HTTPException(
@@ -140,12 +171,70 @@ async def get_tour_guide(tour_id: str):
             detail=f"Tour with ID {tour_id} not found"
         )
     
-    guides = get_tour_guides()
-    for guide in guides:
-        if guide["id"] == tour["guide_id"]:
-            return guide
+    guides = await get_tour_guides()
+    guide = guides.get(tour["guide_id"])
+    if guide:
+        if fields:
+            return fieldsets.projector(guides, fields)(guide.index)
+        return guide.to_dict()
     
     raise HTTPException(
         status_code=status.HTTP_404_NOT_FOUND,
         detail=f"Guide for tour {tour_id} not found"
-    ) 
\ No newline at end of file
+    )
+
+@router.get("/{tour_id}/similar", response_model=List[Tour])
+@microcache.cached()
+async def get_similar_tours(
+    tour_id: str,
+    limit: int = Query(5, ge=1, le=50),
+    fields: Optional[Tuple[str, ...]] = Depends(fieldsets.fields_param),
+):
+    """
+    Get the tours most similar to a specific tour.
+
+    Similarity combines the tours' descriptions, location, languages, price,
+    duration and rating. Lists for the top-rated tours are precomputed.
+    """
+    index = await similarity_index()
+    neighbors = index.cached(tour_id)
+    if neighbors is None:
+        if tour_id not in index.positions:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Tour with ID {tour_id} not found"
+            )
+        # A matrix-vector product over every tour; keep it off the loop
+        neighbors = await run_blocking(index.similar, tour_id)
+
+    tours = index.table
+    similar = [tours.get(other) for other, _ in neighbors[:limit]]
+    if fields:
+        return fieldsets.model_response(Tour, fieldsets.project_rows(tours, similar, fields), fields)
+    return [tour.to_dict() for tour in similar]
+
+@router.get("/{tour_id}/availability", response_model=List[dict])
+async def get_tour_availability(
+    tour_id: str,
+    from_date: Optional[date] = Query(None, alias="from", description="First day (default: today)"),
+    to_date: Optional[date] = Query(None, alias="to", description="Last day (default: 30 days after from)"),
+):
+    """
+    Get the places held, booked and still available per day for a tour.
+    """
+    tours = await get_tours()
+    tour = tours.get(tour_id)
+    if not tour:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Tour with ID {tour_id} not found"
+        )
+    from_date = from_date or date.today()
+    to_date = to_date or from_date + timedelta(days=30)
+    if to_date < from_date:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_CONTENT, detail="'to' is before 'from'")
+    if (to_date - from_date).days >= 366:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_CONTENT, detail="At most 366 days at once")
+
+    engine = await bookings.get_engine()
+    return engine.availability(tour_id, from_date, to_date, tour.get("max_participants", 0))
@@ -0,0 +1,384 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Backend selection: "local" keeps entries in the worker, "sqlite" shares them
+# between all workers on the host through a WAL-mode database file
+cache_backend = os.environ.get("CACHE_BACKEND", "local").lower()
+cache_path = os.environ.get(
+    "CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "shared_cache.sqlite3"),
+)
+
+# How long a worker may hold the right to compute a key before others take over
+lease_timeout = float(os.environ.get("CACHE_LEASE_TIMEOUT", 30))
+
+# How long a read waits for a locked shared cache before counting as a miss
+read_timeout = float(os.environ.get("CACHE_SQLITE_READ_TIMEOUT_MS", 20)) / 1000
+
+# Entries kept per local cache; the least recently used go first
+local_max_entries = int(os.environ.get("CACHE_LOCAL_MAX_ENTRIES", 10000))
+# Expired shared entries and leases are purged every this many writes
+purge_every = int(os.environ.get("CACHE_PURGE_EVERY", 500))
+
+# Result of a shared computation whose leader was cancelled: waiters compute
+# the value themselves
+_RETRY = object()
+
+
+class CacheBackend:
+    """
+    Key/value cache for JSON-serialisable upstream responses.
+
+    ``get_or_compute`` is the single-flight entry point: concurrent callers
+    asking for the same missing key share one computation.
+    """
+
+    def __init__(self, name: str, default_ttl: Optional[float] = None):
+        self.name = name
+        self.default_ttl = default_ttl
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._hits = metrics.CACHE_HITS.labels(name)
+        self._misses = metrics.CACHE_MISSES.labels(name)
+        metrics.CACHE_SIZE.labels(name).set_function(self.__len__)
+
+    def _expiry(self, ttl):
+        ttl = self.default_ttl if ttl is None else ttl
+        return time.time() + ttl if ttl else None
+
+    def get(self, key: str) -> Any:
+        value = self._get(key)
+        if value is None:
+            self._misses.inc()
+        else:
+            self._hits.inc()
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        self._set(key, value, self._expiry(ttl))
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def __contains__(self, key):
+        return self._get(key) is not None
+
+    def _get(self, key):
+        raise NotImplementedError
+
+    def _set(self, key, value, expires_at):
+        raise NotImplementedError
+
+    async def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[Any]],
+        ttl: Optional[float] = None,
+    ) -> Any:
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        # Collapse concurrent misses within this worker first
+        pending = self._inflight.get(key)
+        while pending is not None:
+            value = await asyncio.shield(pending)
+            if value is not _RETRY:
+                return value
+            # Another waiter may already have taken over
+            pending = self._inflight.get(key)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await self._compute_once(key, compute, ttl)
+        except asyncio.CancelledError:
+            # Only the caller that was computing is cancelled (e.g. a batch
+            # item timing out), not the others waiting for the same key
+            future.set_result(_RETRY)
+            raise
+        except BaseException as exc:
+            future.set_exception(exc)
+            # Mark retrieved so an unawaited future doesn't log a warning
+            future.exception()
+            raise
+        else:
+            future.set_result(value)
+            return value
+        finally:
+            del self._inflight[key]
+
+    async def _compute_once(self, key, compute, ttl):
+        value = await compute()
+        if value is not None:
+            self.set(key, value, ttl)
+        return value
+
+
+class LocalCache(CacheBackend):
+    """
+    Per-worker in-memory cache with TTL expiry, bounded to ``max_entries``
+    with least-recently-used eviction.
+    """
+
+    def __init__(self, name, default_ttl=None, max_entries=local_max_entries):
+        self.max_entries = max_entries
+        # key -> (expires_at, value)
+        self._entries: OrderedDict = OrderedDict()
+        super().__init__(name, default_ttl)
+
+    def _get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at is not None and expires_at < time.time():
+            self._entries.pop(key, None)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _set(self, key, value, expires_at):
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def delete(self, key):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCache(CacheBackend):
+    """
+    Host-wide cache shared by every worker through one SQLite file in WAL mode.
+
+    Cross-process single-flight uses a lease row per key: the worker that
+    inserts the lease computes the value, the others poll for it until the
+    lease is released or expires (e.g. because the owning worker died).
+
+    Writing may wait for another worker's write lock, so writes, leases and
+    purges run on one writer thread per process and cache; ``set`` returns
+    without waiting for the write. Reads never wait for writers in WAL mode
+    and run on the caller's thread with a short busy timeout; a database that
+    is still locked (e.g. during a checkpoint) counts as a miss.
+    """
+
+    def __init__(self, name, default_ttl=None, path=cache_path):
+        self.path = path
+        self._conn = None
+        self._reader = None
+        self._writer = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._owner = uuid.uuid4().hex
+        self._writes = 0
+        super().__init__(name, default_ttl)
+
+    def _check_pid(self):
+        # Connections and threads don't survive a fork, so each process
+        # opens its own
+        if self._pid != os.getpid():
+            self._conn = None
+            self._reader = None
+            self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"cache-{self.name}")
+            self._pid = os.getpid()
+
+    def _connection(self):
+        # Write connection, only used on the writer thread
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_entries ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires_at REAL, "
+                "PRIMARY KEY (namespace, key))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_leases ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, owner TEXT NOT NULL, expires_at REAL NOT NULL, "
+                "PRIMARY KEY (namespace, key))"
+            )
+            self._conn = conn
+            # Leftovers from before this process started
+            self._purge(conn)
+        return self._conn
+
+    def _write(self, func, *args):
+        # Runs on the writer thread
+        try:
+            return func(self._connection(), *args)
+        except sqlite3.Error as e:
+            logger.error("Cache write failed in %s: %s", self.name, e)
+            return None
+
+    def _submit(self, func, *args):
+        self._check_pid()
+        return self._writer.submit(self._write, func, *args)
+
+    async def _run_write(self, func, *args):
+        return await asyncio.wrap_future(self._submit(func, *args))
+
+    def _read(self, sql, params):
+        # Reads on the caller's thread; None when the database can't be read
+        # right now (not created yet, or locked)
+        self._check_pid()
+        try:
+            with self._lock:
+                if self._reader is None:
+                    if not os.path.exists(self.path):
+                        return None
+                    self._reader = sqlite3.connect(
+                        self.path, timeout=read_timeout, isolation_level=None, check_same_thread=False
+                    )
+                return self._reader.execute(sql, params).fetchone()
+        except sqlite3.OperationalError as e:
+            logger.debug("Cache read skipped in %s: %s", self.name, e)
+        except sqlite3.Error as e:
+            logger.error("Cache read failed in %s: %s", self.name, e)
+        return None
+
+    def _get(self, key):
+        row = self._read(
+            "SELECT value, expires_at FROM cache_entries WHERE namespace = ? AND key = ?",
+            (self.name, key),
+        )
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at is not None and expires_at < time.time():
+            return None
+        return json.loads(value)
+
+    def _set(self, key, value, expires_at):
+        # Serialized now, so later changes to ``value`` aren't written
+        self._submit(self._write_entry, key, json.dumps(value), expires_at)
+
+    def _write_entry(self, conn, key, value, expires_at):
+        conn.execute(
+            "INSERT OR REPLACE INTO cache_entries (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+            (self.name, key, value, expires_at),
+        )
+        # Expired rows are never read again, but keys like weather_{id}_{date}
+        # are never written again either; purge them now and then
+        self._writes += 1
+        if self._writes % purge_every == 0:
+            self._purge(conn)
+
+    def delete(self, key):
+        self._submit(
+            lambda conn: conn.execute("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (self.name, key))
+        )
+
+    def clear(self):
+        self._submit(lambda conn: conn.execute("DELETE FROM cache_entries WHERE namespace = ?", (self.name,)))
+
+    def purge_expired(self):
+        """
+        Delete expired entries of every namespace and expired leases (in the
+        background).
+        """
+        return self._submit(self._purge)
+
+    def _purge(self, conn):
+        now = time.time()
+        conn.execute("DELETE FROM cache_entries WHERE expires_at IS NOT NULL AND expires_at < ?", (now,))
+        conn.execute("DELETE FROM cache_leases WHERE expires_at < ?", (now,))
+
+    def __len__(self):
+        row = self._read(
+            "SELECT COUNT(*) FROM cache_entries WHERE namespace = ? AND (expires_at IS NULL OR expires_at >= ?)",
+            (self.name, time.time()),
+        )
+        return row[0] if row is not None else 0
+
+    def _acquire_lease(self, conn, key) -> bool:
+        now = time.time()
+        cursor = conn.execute(
+            "INSERT INTO cache_leases (namespace, key, owner, expires_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (namespace, key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+            "WHERE cache_leases.expires_at < ?",
+            (self.name, key, self._owner, now + lease_timeout, now),
+        )
+        return cursor.rowcount == 1
+
+    def _lease_held(self, key) -> bool:
+        row = self._read(
+            "SELECT expires_at FROM cache_leases WHERE namespace = ? AND key = ?",
+            (self.name, key),
+        )
+        return row is not None and row[0] >= time.time()
+
+    def _release_lease(self, conn, key):
+        conn.execute(
+            "DELETE FROM cache_leases WHERE namespace = ? AND key = ? AND owner = ?",
+            (self.name, key, self._owner),
+        )
+
+    async def _compute_once(self, key, compute, ttl):
+        delay = 0.01
+        deadline = time.monotonic() + lease_timeout
+        while True:
+            acquired = await self._run_write(self._acquire_lease, key)
+            if acquired is None:
+                # The lease couldn't be written; compute without it
+                return await super()._compute_once(key, compute, ttl)
+            if acquired:
+                try:
+                    return await super()._compute_once(key, compute, ttl)
+                finally:
+                    # Queued after the value's write, so waiters see the value
+                    # once the lease is gone
+                    self._submit(self._release_lease, key)
+
+            # Another worker is computing this key; wait for its result
+            while self._lease_held(key) and time.monotonic() < deadline:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 0.2)
+                value = self._get(key)
+                if value is not None:
+                    self._hits.inc()
+                    return value
+            value = self._get(key)
+            if value is not None:
+                self._hits.inc()
+                return value
+            if time.monotonic() >= deadline:
+                return await super()._compute_once(key, compute, ttl)
+            # The owner released the lease without a value (it failed); try to take over
+
+
+def create_cache(name: str, default_ttl: Optional[float] = None) -> CacheBackend:
+    """
+    Create the cache configured by ``CACHE_BACKEND`` under namespace ``name``.
+    """
+    if cache_backend == "sqlite":
+        return SQLiteCache(name, default_ttl)
+    if cache_backend != "local":
+        logger.warning("Unknown CACHE_BACKEND %r, using local cache", cache_backend)
+    return LocalCache(name, default_ttl)
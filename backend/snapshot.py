@@ -0,0 +1,292 @@
+"""
+Binary catalog snapshots.
+
+A snapshot is compiled from the JSON data files (or any catalog built by an
+import pipeline) and memory-mapped read-only by every worker, so startup does
+not depend on catalog size and the OS page cache shares the pages between
+worker processes.
+
+    python snapshot.py compile [--output PATH]
+    python snapshot.py verify [PATH]
+
+File layout (little-endian header, native-endian buffers)::
+
+    header (64 bytes) | directory (JSON) | padding | payload (8-byte aligned buffers)
+
+The directory describes each table's schema, the byte range of every column
+buffer within the payload, interned string tables, and the (rare) values that
+didn't fit a column's encoding. Header, directory and payload are covered by
+CRC32 checksums.
+"""
+import argparse
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import time
+import zlib
+from array import array
+
+import catalog
+import metrics
+
+logger = logging.getLogger(__name__)
+
+snapshot_path = os.environ.get(
+    "CATALOG_SNAPSHOT", os.path.join(catalog.data_dir, "catalog.snapshot")
+)
+
+# "full" checks the payload checksum on open; "header" only checks the
+# header and directory, leaving pages untouched until they are read
+verify_mode = os.environ.get("CATALOG_SNAPSHOT_VERIFY", "full").lower()
+
+MAGIC = b"TECATSNP"
+FORMAT_VERSION = 1
+_HEADER = struct.Struct("<8sIIQQQII")
+HEADER_SIZE = 64
+_BYTEORDER = 0 if sys.byteorder == "little" else 1
+
+
+class SnapshotError(Exception):
+    pass
+
+
+class _PayloadWriter:
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def add(self, data, typecode):
+        # Keep every buffer 8-byte aligned so memoryview casts stay aligned
+        self.buffer.extend(bytes(-len(self.buffer) % 8))
+        raw = data.tobytes() if isinstance(data, array) else bytes(data)
+        entry = {"offset": len(self.buffer), "length": len(raw), "typecode": typecode}
+        self.buffer.extend(raw)
+        return entry
+
+
+def _column_buffers(column):
+    if isinstance(column, catalog.StringColumn):
+        return {"blob": (column.blob, "B"), "offsets": (column.offsets, "Q")}
+    if isinstance(column, catalog.CategoryColumn):
+        return {"codes": (column.codes, "I")}
+    if isinstance(column, catalog.CategoryListColumn):
+        return {"offsets": (column.offsets, "I"), "codes": (column.codes, "I")}
+    if isinstance(column, (catalog.IntColumn, catalog.DateTimeColumn)):
+        return {"values": (column.values, "q")}
+    if isinstance(column, catalog.NumberColumn):
+        return {"values": (column.values, "d")}
+    if isinstance(column, catalog.NumberListColumn):
+        return {"offsets": (column.offsets, "I"), "values": (column.values, "d")}
+    raise SnapshotError(f"Unsupported column type {type(column).__name__}")
+
+
+def _as_array(data, typecode):
+    if isinstance(data, array) and data.typecode == typecode:
+        return data
+    result = array(typecode)
+    result.frombytes(bytes(data))
+    return result
+
+
+def compile_snapshot(snapshot: catalog.Catalog, path=None):
+    """
+    Write ``snapshot`` to ``path`` atomically; workers that have the previous
+    file mapped keep reading it until they reload.
+    """
+    path = path or snapshot_path
+    payload = _PayloadWriter()
+    tables = {}
+    for name, table in snapshot.tables.items():
+        columns = {}
+        for field, _ in table.schema:
+            column = table.columns[field]
+            entry = {
+                "buffers": {
+                    key: payload.add(_as_array(data, typecode) if typecode != "B" else data, typecode)
+                    for key, (data, typecode) in _column_buffers(column).items()
+                },
+                "overrides": {str(i): v for i, v in column.overrides.items()},
+            }
+            if column.missing is not None:
+                entry["missing"] = payload.add(column.missing, "B")
+            columns[field] = entry
+        tables[name] = {
+            "schema": [list(item) for item in table.schema],
+            "rows": len(table),
+            "columns": columns,
+            "id_index": payload.add(_as_array(table.id_index, "I"), "I"),
+            "extras": {str(i): v for i, v in table.extras.items()},
+        }
+    directory = json.dumps({
+        "created_at": time.time(),
+        "sources": {name: list(stamp) for name, stamp in snapshot.sources.items()},
+        "interners": {domain: interner.strings for domain, interner in snapshot.interners.items()},
+        "tables": tables,
+    }).encode("utf-8")
+
+    payload_offset = HEADER_SIZE + len(directory)
+    payload_offset += -payload_offset % 8
+    header = _HEADER.pack(
+        MAGIC, FORMAT_VERSION, _BYTEORDER, len(directory), payload_offset,
+        len(payload.buffer), zlib.crc32(directory), zlib.crc32(payload.buffer),
+    )
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(header.ljust(HEADER_SIZE, b"\0"))
+        f.write(directory)
+        f.write(bytes(payload_offset - HEADER_SIZE - len(directory)))
+        f.write(payload.buffer)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return path
+
+
+def _read_header(mm):
+    if len(mm) < HEADER_SIZE:
+        raise SnapshotError("File too small")
+    magic, version, byteorder, dir_len, payload_offset, payload_len, dir_crc, payload_crc = (
+        _HEADER.unpack_from(mm, 0)
+    )
+    if magic != MAGIC:
+        raise SnapshotError("Not a catalog snapshot")
+    if version != FORMAT_VERSION:
+        raise SnapshotError(f"Unsupported snapshot format {version}")
+    if byteorder != _BYTEORDER:
+        raise SnapshotError("Snapshot was compiled on a machine with different byte order")
+    if payload_offset + payload_len > len(mm):
+        raise SnapshotError("Truncated snapshot")
+    return dir_len, payload_offset, payload_len, dir_crc, payload_crc
+
+
+def _open(path, verify):
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        dir_len, payload_offset, payload_len, dir_crc, payload_crc = _read_header(mm)
+        directory_bytes = mm[HEADER_SIZE:HEADER_SIZE + dir_len]
+        if zlib.crc32(directory_bytes) != dir_crc:
+            raise SnapshotError("Directory checksum mismatch")
+        if verify == "full":
+            # Release the views before the mapping may be closed below
+            with memoryview(mm) as view, view[payload_offset:payload_offset + payload_len] as region:
+                valid = zlib.crc32(region) == payload_crc
+            if not valid:
+                raise SnapshotError("Payload checksum mismatch")
+        payload = memoryview(mm)[payload_offset:payload_offset + payload_len]
+        return mm, payload, json.loads(directory_bytes)
+    except BaseException:
+        mm.close()
+        raise
+
+
+def _buffer(payload, entry):
+    start = entry["offset"]
+    return payload[start:start + entry["length"]].cast(entry["typecode"])
+
+
+def _build_column(kind, entry, payload, interners):
+    base, _, domain = kind.partition(":")
+    buffers = {key: _buffer(payload, value) for key, value in entry["buffers"].items()}
+    if base == "str":
+        column = catalog.StringColumn(buffers["blob"], buffers["offsets"])
+    elif base == "cat":
+        column = catalog.CategoryColumn(interners[domain], buffers["codes"])
+    elif base == "cat_list":
+        column = catalog.CategoryListColumn(interners[domain], buffers["offsets"], buffers["codes"])
+    elif base == "int":
+        column = catalog.IntColumn(buffers["values"])
+    elif base == "number":
+        column = catalog.NumberColumn(buffers["values"])
+    elif base == "number_list":
+        column = catalog.NumberListColumn(buffers["offsets"], buffers["values"])
+    elif base == "datetime":
+        column = catalog.DateTimeColumn(buffers["values"])
+    else:
+        raise SnapshotError(f"Unknown column kind {kind}")
+    if "missing" in entry:
+        column.missing = _buffer(payload, entry["missing"])
+    column.overrides = {int(i): v for i, v in entry["overrides"].items()}
+    return column
+
+
+def load_snapshot(path=None, version=1, verify=None) -> catalog.Catalog:
+    """
+    Memory-map a snapshot and wrap its buffers as catalog tables without
+    copying them.
+    """
+    path = path or snapshot_path
+    mm, payload, directory = _open(path, verify or verify_mode)
+    interners = {
+        domain: catalog.Interner(strings) for domain, strings in directory["interners"].items()
+    }
+    tables = {}
+    for name, spec in directory["tables"].items():
+        schema = [tuple(item) for item in spec["schema"]]
+        columns = {
+            field: _build_column(kind, spec["columns"][field], payload, interners)
+            for field, kind in schema
+        }
+        extras = {int(i): v for i, v in spec["extras"].items()}
+        tables[name] = catalog.Table(name, schema, columns, _buffer(payload, spec["id_index"]), extras)
+    for name, (_, schema) in catalog.ENTITIES.items():
+        if name not in tables:
+            tables[name] = catalog.Table.from_records(name, schema, [], interners)
+    sources = {name: tuple(stamp) for name, stamp in directory["sources"].items()}
+    snapshot = catalog.Catalog(tables, version, sources, interners)
+    # Keep the mapping alive for as long as the catalog is in use
+    snapshot.mapping = mm
+    return snapshot
+
+
+def load_if_fresh(sources, version=1):
+    """
+    Load the snapshot if it was compiled from the data files currently on
+    disk (data files that are absent are taken from the snapshot). Returns
+    None when there is no usable snapshot so the caller can fall back to JSON.
+    """
+    if not os.path.exists(snapshot_path):
+        return None
+    started = time.perf_counter()
+    try:
+        snapshot = load_snapshot(snapshot_path, version)
+    except (SnapshotError, OSError, ValueError, KeyError) as e:
+        logger.error("Ignoring catalog snapshot %s: %s", snapshot_path, e)
+        metrics.observe_data_load("catalog.snapshot", started, None)
+        return None
+    for file_name, stamp in sources.items():
+        if stamp != (0, 0) and snapshot.sources.get(file_name) != stamp:
+            logger.info("Catalog snapshot is older than %s, loading JSON", file_name)
+            return None
+    metrics.observe_data_load(
+        "catalog.snapshot", started, sum(len(table) for table in snapshot.tables.values())
+    )
+    snapshot.sources = dict(sources)
+    return snapshot
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile or verify the catalog snapshot")
+    sub = parser.add_subparsers(dest="command", required=True)
+    compile_parser = sub.add_parser("compile", help="Compile the JSON data files into a snapshot")
+    compile_parser.add_argument("--output", default=snapshot_path)
+    verify_parser = sub.add_parser("verify", help="Check a snapshot's checksums")
+    verify_parser.add_argument("path", nargs="?", default=snapshot_path)
+    args = parser.parse_args(argv)
+
+    if args.command == "compile":
+        started = time.perf_counter()
+        snapshot = catalog.load_catalog(use_snapshot=False)
+        compile_snapshot(snapshot, args.output)
+        counts = ", ".join(f"{len(table)} {name}" for name, table in snapshot.tables.items())
+        print(f"Wrote {args.output} ({counts}) in {time.perf_counter() - started:.2f}s")
+    else:
+        snapshot = load_snapshot(args.path, verify="full")
+        counts = ", ".join(f"{len(table)} {name}" for name, table in snapshot.tables.items())
+        print(f"{args.path} OK ({counts})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+"""
+Search-box suggestions: prefix lookups over destination, tour and guide
+names (and a few secondary fields) that return the most popular matches.
+
+Each indexed string is normalized (case-folded, accents stripped, runs of
+other characters collapsed to one space) into one shared UTF-8 blob. Keys
+are the string and every suffix starting at a later word, so "york" finds
+"New York"; they are stored as offsets into the blob and sorted, so the keys
+with a prefix are one contiguous range found with two binary searches.
+
+Every key carries a weight computed at build time (entity popularity times
+a factor for the field and for matching a later word). A segment tree over
+the sorted keys stores the position of the heaviest key of each node, so
+the top k of a range come out of a small heap of sub-ranges in
+O(k log n) without looking at the other matches.
+
+Indexes are built per table, off the event loop; a table that didn't change
+between catalog versions keeps its index.
+"""
+import heapq
+import logging
+import math
+import re
+import threading
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+_SEPARATORS = re.compile(r"[^0-9a-z]+")
+
+
+def normalize(text: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return _SEPARATORS.sub(" ", stripped).strip()
+
+
+class FieldSpec(NamedTuple):
+    """
+    An indexed field and its weight relative to the entity's name.
+    """
+    name: str
+    factor: float
+
+
+class TypeSpec(NamedTuple):
+    """
+    How one entity type is indexed.
+    """
+    type: str
+    table: str
+    fields: Tuple[FieldSpec, ...]
+    popularity: object  # row -> popularity in [0, 1]
+
+
+def _destination_popularity(row):
+    population = row.get("population") or 0
+    return min(math.log10(population + 1) / 9, 1.0)
+
+
+def _tour_popularity(row):
+    return min(max((row.get("rating") or 0) / 5, 0.0), 1.0)
+
+
+def _guide_popularity(row):
+    rating = min(max((row.get("rating") or 0) / 5, 0.0), 1.0)
+    experience = min(math.log10((row.get("tours_conducted") or 0) + 1) / 3, 1.0)
+    return rating * (0.5 + 0.5 * experience)
+
+
+TYPES = (
+    TypeSpec("destination", "destinations", (FieldSpec("name", 1.0), FieldSpec("capital", 0.8)),
+             _destination_popularity),
+    TypeSpec("tour", "tours", (FieldSpec("name", 1.0), FieldSpec("location", 0.7)), _tour_popularity),
+    TypeSpec("guide", "tour_guides", (FieldSpec("name", 1.0), FieldSpec("specialization", 0.6)),
+             _guide_popularity),
+)
+TYPE_NAMES = tuple(spec.type for spec in TYPES)
+
+# Weight factor for keys that start at a later word of the string
+LATER_WORD_FACTOR = 0.75
+
+# Most suggestions returned at once
+MAX_LIMIT = 20
+# Results for prefixes up to this many bytes (the widest ranges, typed by
+# everyone) are kept once computed
+SHORT_PREFIX = 2
+
+
+class PrefixIndex:
+    """
+    Sorted prefix keys of one table's fields with per-key weights.
+    """
+
+    def __init__(self, spec: TypeSpec, table):
+        self.spec = spec
+        self.table = table
+        # Indexed strings: table row, field and span in the blob
+        self.rows = array("I")
+        self.fields = array("B")
+        self.ends = array("I")
+        chunks = []
+        starts = array("I")
+        key_strings = array("I")
+        weights = []
+        offset = 0
+        for row in table:
+            popularity = spec.popularity(row)
+            for field_number, field in enumerate(spec.fields):
+                value = row.get(field.name)
+                if not isinstance(value, str):
+                    continue
+                text = normalize(value)
+                if not text:
+                    continue
+                encoded = text.encode()
+                string = len(self.rows)
+                self.rows.append(row.index)
+                self.fields.append(field_number)
+                self.ends.append(offset + len(encoded))
+                weight = popularity * field.factor
+                position = 0
+                while position >= 0:
+                    starts.append(offset + position)
+                    key_strings.append(string)
+                    weights.append(weight if position == 0 else weight * LATER_WORD_FACTOR)
+                    position = encoded.find(b" ", position)
+                    if position >= 0:
+                        position += 1
+                chunks.append(encoded)
+                offset += len(encoded)
+        self.blob = b"".join(chunks)
+        self._short: Dict[bytes, List[Tuple[float, int]]] = {}
+
+        blob, ends = self.blob, self.ends
+        order = sorted(range(len(starts)), key=lambda i: blob[starts[i]:ends[key_strings[i]]])
+        self.starts = array("I", (starts[i] for i in order))
+        self.key_strings = array("I", (key_strings[i] for i in order))
+        self.weights = array("f", (weights[i] for i in order))
+        self._build_tree()
+
+    def __len__(self):
+        return len(self.starts)
+
+    def _build_tree(self):
+        # Implicit binary tree: leaf ``size + i`` is key i, node j holds the
+        # position of the heaviest key below it (-1 for empty padding)
+        n = len(self.weights)
+        size = 1
+        while size < n:
+            size *= 2
+        tree = array("i", [-1]) * (2 * size)
+        tree[size:size + n] = array("i", range(n))
+        weights = self.weights
+        for node in range(size - 1, 0, -1):
+            left, right = tree[2 * node], tree[2 * node + 1]
+            if right < 0 or (left >= 0 and weights[left] >= weights[right]):
+                tree[node] = left
+            else:
+                tree[node] = right
+        self.size = size
+        self.tree = tree
+
+    def _argmax(self, lo, hi):
+        # Heaviest key position in [lo, hi)
+        tree, weights = self.tree, self.weights
+        best = -1
+        best_weight = -1.0
+        lo += self.size
+        hi += self.size
+        while lo < hi:
+            if lo & 1:
+                candidate = tree[lo]
+                if weights[candidate] > best_weight:
+                    best, best_weight = candidate, weights[candidate]
+                lo += 1
+            if hi & 1:
+                hi -= 1
+                candidate = tree[hi]
+                if weights[candidate] > best_weight:
+                    best, best_weight = candidate, weights[candidate]
+            lo >>= 1
+            hi >>= 1
+        return best
+
+    def key_range(self, prefix: bytes) -> Tuple[int, int]:
+        blob, starts, ends, key_strings = self.blob, self.starts, self.ends, self.key_strings
+
+        def key(i):
+            return blob[starts[i]:ends[key_strings[i]]]
+
+        lo = bisect_left(range(len(starts)), prefix, key=key)
+        # 0xff never occurs in UTF-8, so this sorts after every key with the prefix
+        hi = bisect_left(range(lo, len(starts)), prefix + b"\xff", key=key) + lo
+        return lo, hi
+
+    def top(self, prefix: bytes, limit: int) -> List[Tuple[float, int]]:
+        """
+        (weight, indexed string) for the heaviest rows with a key starting
+        with ``prefix``, each row once.
+        """
+        if len(prefix) <= SHORT_PREFIX:
+            results = self._short.get(prefix)
+            if results is None:
+                results = self._short[prefix] = self._top(prefix, MAX_LIMIT)
+            return results[:limit]
+        return self._top(prefix, limit)
+
+    def _top(self, prefix, limit):
+        lo, hi = self.key_range(prefix)
+        if lo >= hi:
+            return []
+        weights, key_strings, rows = self.weights, self.key_strings, self.rows
+        heap = []
+        best = self._argmax(lo, hi)
+        heap.append((-weights[best], best, lo, hi))
+        results = []
+        seen = set()
+        while heap and len(results) < limit:
+            weight, position, lo, hi = heapq.heappop(heap)
+            string = key_strings[position]
+            row = rows[string]
+            if row not in seen:
+                seen.add(row)
+                results.append((-weight, string))
+            if lo < position:
+                best = self._argmax(lo, position)
+                heapq.heappush(heap, (-weights[best], best, lo, position))
+            if position + 1 < hi:
+                best = self._argmax(position + 1, hi)
+                heapq.heappush(heap, (-weights[best], best, position + 1, hi))
+        return results
+
+    def suggestion(self, weight: float, string: int) -> dict:
+        row = self.table.row(self.rows[string])
+        field = self.spec.fields[self.fields[string]].name
+        return {
+            "type": self.spec.type,
+            "id": row.get("id"),
+            "name": row.get("name"),
+            "field": field,
+            "match": row.get(field),
+            "score": round(weight, 4),
+        }
+
+
+class SuggestIndex:
+    """
+    Prefix indexes of every entity type for one catalog snapshot.
+    """
+
+    def __init__(self, indexes: Dict[str, PrefixIndex]):
+        self.indexes = indexes
+
+    def suggest(self, query: str, types: Sequence[str] = TYPE_NAMES, limit: int = 8) -> List[dict]:
+        prefix = normalize(query).encode()
+        if not prefix:
+            return []
+        candidates = []
+        for type_name in types:
+            index = self.indexes.get(type_name)
+            if index is not None:
+                candidates.extend((weight, index, string) for weight, string in index.top(prefix, limit))
+        candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+        return [index.suggestion(weight, string) for weight, index, string in candidates[:limit]]
+
+    def __len__(self):
+        return sum(len(index) for index in self.indexes.values())
+
+
+_index: Optional[SuggestIndex] = None
+_build_lock = threading.Lock()
+
+
+def _tables(snapshot):
+    return {spec.type: snapshot.tables.get(spec.table) for spec in TYPES}
+
+
+def is_current(index: Optional[SuggestIndex], snapshot) -> bool:
+    return index is not None and all(
+        index.indexes[name].table is table for name, table in _tables(snapshot).items() if table is not None
+    )
+
+
+def index_for(snapshot) -> SuggestIndex:
+    """
+    The index for a catalog snapshot, rebuilding only the types whose table
+    changed (blocking; call off the event loop).
+    """
+    global _index
+    with _build_lock:
+        index = _index
+        if is_current(index, snapshot):
+            return index
+        started = time.perf_counter()
+        indexes = {}
+        for spec in TYPES:
+            table = snapshot.tables.get(spec.table)
+            if table is None:
+                continue
+            previous = index.indexes.get(spec.type) if index is not None else None
+            indexes[spec.type] = previous if previous is not None and previous.table is table else PrefixIndex(spec, table)
+        _index = SuggestIndex(indexes)
+        logger.info("Suggestion index built with %d keys in %.0f ms",
+                    len(_index), (time.perf_counter() - started) * 1000)
+        return _index
+
+
+def current() -> Optional[SuggestIndex]:
+    """
+    The last built index (None before the first build).
+    """
+    return _index
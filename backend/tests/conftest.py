@@ -0,0 +1,63 @@
+import os
+import sys
+
+import pytest
+
+# Backend modules are imported by their flat names, as in main.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import catalog
+import changes
+import snapshot
+import upstream
+import upstream_sim
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(scope="session")
+def upstream_sim_url():
+    # One simulator for the whole session; tests set its faults
+    with upstream_sim.serve() as url:
+        yield url
+
+
+@pytest.fixture
+def simulator(upstream_sim_url):
+    """
+    The upstream simulator, without faults and with fresh statistics.
+    """
+    upstream_sim.configure(upstream_sim.Faults())
+    upstream_sim.simulator.reset_stats()
+    yield upstream_sim.simulator
+    upstream_sim.configure(upstream_sim.Faults())
+
+
+@pytest.fixture
+def upstreams(simulator, upstream_sim_url):
+    """
+    The API's upstream clients pointed at the simulator, with closed
+    breakers and no last good responses.
+    """
+    for client in upstream.clients:
+        client.breaker.record_success()
+    upstream.last_good.clear()
+    with upstream_sim.attach(upstream_sim_url):
+        yield simulator
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """
+    An empty data directory with its own catalog and change log, checked
+    for changed files on every request.
+    """
+    monkeypatch.setattr(catalog, "data_dir", str(tmp_path))
+    monkeypatch.setattr(catalog, "_current", None)
+    monkeypatch.setattr(catalog, "reload_check_interval", 0)
+    monkeypatch.setattr(snapshot, "snapshot_path", str(tmp_path / "catalog.snapshot"))
+    monkeypatch.setattr(changes, "log", changes.ChangeLog(1000, str(tmp_path / "changes.sqlite3")))
+    return tmp_path
@@ -0,0 +1,128 @@
+import asyncio
+import json
+from datetime import date, timedelta
+
+import pytest
+
+import bookings
+
+pytestmark = pytest.mark.anyio
+
+DAY = date.today() + timedelta(days=30)
+
+
+@pytest.fixture
+async def engine(tmp_path):
+    engine = bookings.BookingEngine(str(tmp_path / "bookings.log"), fsync=False, sync_interval=0.02)
+    yield engine
+    await engine.close()
+
+
+async def reserve_all(engine, count, seats=1, capacity=10):
+    results = await asyncio.gather(
+        *[engine.reserve("tour-001", DAY, seats, capacity) for _ in range(count)],
+        return_exceptions=True,
+    )
+    made = [result for result in results if isinstance(result, bookings.Booking)]
+    conflicts = [result for result in results if isinstance(result, bookings.BookingConflict)]
+    assert len(made) + len(conflicts) == count
+    return made, conflicts
+
+
+def log_records(path):
+    with open(path, "rb") as f:
+        return [json.loads(line) for line in f]
+
+
+async def test_concurrent_reserves_never_overbook(engine):
+    made, conflicts = await reserve_all(engine, 25, seats=3)
+    assert len(made) == 3
+    assert len(conflicts) == 22
+    assert engine.used("tour-001", DAY.toordinal()) == 9
+    assert engine.availability("tour-001", DAY, DAY, 10)[0]["available"] == 1
+
+
+async def test_workers_sharing_the_log_never_overbook(engine, tmp_path):
+    # A second worker appending to the same log
+    other = bookings.BookingEngine(engine.path, fsync=False, sync_interval=0.02)
+    try:
+        (made, _), (other_made, _) = await asyncio.gather(reserve_all(engine, 8), reserve_all(other, 8))
+        assert len(made) + len(other_made) == 10
+        await engine.sync()
+        await other.sync()
+        assert engine.used("tour-001", DAY.toordinal()) == 10
+        assert other.used("tour-001", DAY.toordinal()) == 10
+    finally:
+        await other.close()
+    assert len(log_records(engine.path)) == 10
+
+
+async def test_idempotent_retry_returns_the_same_booking(engine):
+    first, retried = await asyncio.gather(
+        engine.reserve("tour-001", DAY, 2, 10, idempotency_key="key-1"),
+        engine.reserve("tour-001", DAY, 2, 10, idempotency_key="key-1"),
+    )
+    assert retried is first
+    # Also once written
+    assert (await engine.reserve("tour-001", DAY, 2, 10, idempotency_key="key-1")).id == first.id
+    assert engine.used("tour-001", DAY.toordinal()) == 2
+    assert len(log_records(engine.path)) == 1
+
+    with pytest.raises(bookings.IdempotencyMismatch):
+        await engine.reserve("tour-001", DAY, 3, 10, idempotency_key="key-1")
+
+    # After a restart the key still finds the booking
+    await engine.close()
+    restarted = bookings.BookingEngine(engine.path, fsync=False)
+    try:
+        assert (await restarted.reserve("tour-001", DAY, 2, 10, idempotency_key="key-1")).id == first.id
+    finally:
+        await restarted.close()
+
+
+async def test_hold_expires_through_the_wheel(tmp_path):
+    engine = bookings.BookingEngine(str(tmp_path / "bookings.log"), hold_seconds=0.05, fsync=False,
+                                    sync_interval=0.02)
+    engine.wheel = bookings.TimerWheel(tick=0.01)
+    try:
+        held = await engine.reserve("tour-001", DAY, 4, 10)
+        assert held.status == bookings.HELD
+        assert engine.used("tour-001", DAY.toordinal()) == 4
+        for _ in range(100):
+            if engine.bookings[held.id].status != bookings.HELD:
+                break
+            await asyncio.sleep(0.02)
+        assert engine.bookings[held.id].status == bookings.EXPIRED
+        assert engine.used("tour-001", DAY.toordinal()) == 0
+        assert len(engine.wheel) == 0
+        with pytest.raises(bookings.BookingConflict, match="expired"):
+            await engine.confirm(held.id)
+    finally:
+        await engine.close()
+    assert [record["op"] for record in log_records(engine.path)] == ["booking", "expire"]
+
+
+async def test_confirmed_booking_is_not_expired(engine):
+    held = await engine.reserve("tour-001", DAY, 1, 10)
+    confirmed = await engine.confirm(held.id)
+    assert confirmed.status == bookings.CONFIRMED
+    assert held.id not in engine.wheel._where
+    assert engine.counters["tour-001"][DAY.toordinal()] == [0, 1]
+
+
+async def test_replay_ignores_and_truncates_a_torn_last_line(engine):
+    kept = await engine.reserve("tour-001", DAY, 2, 10, confirm=True)
+    await engine.close()
+    # A crash in the middle of appending the next record
+    with open(engine.path, "ab") as f:
+        f.write(b'{"op":"booking","id":"bk-torn","tour_id":"tour-001","da')
+
+    restarted = bookings.BookingEngine(engine.path, fsync=False)
+    try:
+        assert (await restarted.get(kept.id)).status == bookings.CONFIRMED
+        assert restarted.used("tour-001", DAY.toordinal()) == 2
+        # The next write drops the torn bytes before appending
+        await restarted.reserve("tour-001", DAY, 1, 10)
+    finally:
+        await restarted.close()
+    assert [record["seats"] for record in log_records(engine.path)] == [2, 1]
@@ -0,0 +1,152 @@
+import json
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+import catalog
+import changes
+
+
+class Snapshot:
+    """
+    What ChangeLog.record needs of a catalog snapshot.
+    """
+
+    def __init__(self, fingerprint):
+        self.fingerprint = fingerprint
+
+
+def build(tours, guides=None):
+    return catalog.build_catalog({"tours": tours, "tour_guides": guides or []})
+
+
+def tour(tour_id, name, price=100):
+    return {"id": tour_id, "name": name, "price": price}
+
+
+@pytest.fixture
+def log(tmp_path):
+    return changes.ChangeLog(100, str(tmp_path / "changes.sqlite3"))
+
+
+def record_chain(log, *steps):
+    # Record a series of (fingerprint, changed) transitions from an empty log
+    previous = None
+    for fingerprint, changed in steps:
+        snapshot = Snapshot(fingerprint)
+        log.record(snapshot, changed, previous)
+        previous = snapshot
+    return previous
+
+
+def test_diff_merges_sorted_ids():
+    previous = build([tour("t-a", "A"), tour("t-b", "B"), tour("t-c", "C")], [{"id": "g-1", "name": "Guide"}])
+    current = catalog.Catalog(
+        {
+            "tours": build([tour("t-d", "D"), tour("t-c", "C"), tour("t-b", "B", price=120)]).tours,
+            # Reused unchanged: not diffed at all
+            "tour_guides": previous.tour_guides,
+            "destinations": previous.destinations,
+        },
+        2, {},
+    )
+    # Removed, changed and added, in id order; unchanged rows aren't listed
+    assert changes.diff(previous, current) == [("tours", "t-a"), ("tours", "t-b"), ("tours", "t-d")]
+
+
+def test_rows_are_listed_once_at_their_latest_version(log):
+    record_chain(log, ("s1", []), ("s2", [("tours", "t-a"), ("tours", "t-b"), ("tours", "t-c")]),
+                 ("s3", [("tours", "t-a")]))
+    assert (log.version, len(log)) == (4, 3)
+    entries, has_more = log.since(log.epoch, 0, log.version, 10)
+    assert entries == [(2, "tours", "t-b"), (3, "tours", "t-c"), (4, "tours", "t-a")]
+    assert not has_more
+
+    # Paging and a visible version below the head
+    assert log.since(log.epoch, 0, log.version, 2) == ([(2, "tours", "t-b"), (3, "tours", "t-c")], True)
+    assert log.since(log.epoch, 2, 3, 10) == ([(3, "tours", "t-c")], False)
+
+
+def test_workers_share_versions(log):
+    s1 = record_chain(log, ("s1", []))
+    other = changes.ChangeLog(100, log.path)
+    other.record(s1, [], None)
+
+    # The first worker to reload records the transition
+    s2 = Snapshot("s2")
+    log.record(s2, [("tours", "t-a"), ("tours", "t-b")], s1)
+    # A worker reaching the same state later only notes its version
+    other.record(s2, [("tours", "t-a"), ("tours", "t-b")], s1)
+    assert other.epoch == log.epoch
+    assert other.view == (s2, 2)
+    assert len(other) == 2
+    assert other.since(log.epoch, 0, 2, 10) == ([(1, "tours", "t-a"), (2, "tours", "t-b")], False)
+
+
+def test_head_mismatch_restarts_the_window(log):
+    record_chain(log, ("s1", []), ("s2", [("tours", "t-a"), ("tours", "t-b")]))
+    # A diff that doesn't start from the log's head (files changed while every
+    # worker was down) can't be appended
+    log.record(Snapshot("s9"), [("tours", "t-c")], Snapshot("s7"))
+    assert log.version == 3
+    assert len(log) == 0
+    assert log.since(log.epoch, 2, 3, 10) == (None, False)
+    assert log.since(log.epoch, 3, 3, 10) == ([], False)
+
+
+def test_trim_raises_the_floor(tmp_path):
+    log = changes.ChangeLog(8, str(tmp_path / "changes.sqlite3"))
+    record_chain(log, ("s1", []), ("s2", [("tours", f"t-{i}") for i in range(10)]))
+    # Trimmed to 3/4 of the bound: the oldest 4 entries are gone
+    assert len(log) == 6
+    assert log.since(log.epoch, 3, 10, 100) == (None, False)
+    entries, _ = log.since(log.epoch, 4, 10, 100)
+    assert [version for version, _, _ in entries] == [5, 6, 7, 8, 9, 10]
+
+
+def test_other_epoch_requires_resync(log):
+    record_chain(log, ("s1", []), ("s2", [("tours", "t-a")]))
+    assert log.since("00000000", 0, 1, 10) == (None, False)
+
+
+def write_tours(data_dir, tours):
+    path = data_dir / "tours.json"
+    with open(path, "w") as f:
+        json.dump(tours, f)
+    # Make sure the change is noticed even within the file system's
+    # timestamp resolution
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+
+def test_changes_endpoint_paging_and_resync(data_dir):
+    import main
+
+    api = TestClient(main.app)
+    write_tours(data_dir, [tour("t-a", "A"), tour("t-b", "B")])
+    start = api.get("/changes/").json()
+    assert start["resync_required"] is False
+    epoch, version = start["epoch"], start["version"]
+
+    # A version without its epoch, or from another log, can't be served
+    assert api.get("/changes/", params={"since": version}).json()["resync_required"] is True
+    assert api.get("/changes/", params={"since": version, "epoch": "00000000"}).json()["resync_required"] is True
+
+    write_tours(data_dir, [tour("t-b", "B", price=150), tour("t-c", "C"), tour("t-d", "D")])
+    page = api.get("/changes/", params={"since": version, "epoch": epoch, "limit": 2}).json()
+    assert page["has_more"] is True
+    assert [(change["id"], change["op"]) for change in page["changes"]] == [("t-a", "delete"), ("t-b", "upsert")]
+    assert page["changes"][1]["data"]["price"] == 150
+    assert page["version"] == page["changes"][-1]["version"]
+
+    rest = api.get("/changes/", params={"since": page["version"], "epoch": epoch, "limit": 2}).json()
+    assert rest["has_more"] is False
+    assert [change["id"] for change in rest["changes"]] == ["t-c", "t-d"]
+    done = api.get("/changes/", params={"since": rest["version"], "epoch": epoch}).json()
+    assert (done["changes"], done["has_more"], done["version"]) == ([], False, rest["version"])
+
+    # Versions from before the retained window
+    changes.log.max_entries = 1
+    write_tours(data_dir, [tour("t-e", "E")])
+    assert api.get("/changes/", params={"since": version, "epoch": epoch}).json()["resync_required"] is True
@@ -0,0 +1,145 @@
+import asyncio
+import json
+import os
+import time
+
+import pytest
+
+import catalog
+import destination_sync
+import upstream_sim
+
+COUNTRIES = {country["cca3"]: country for country in upstream_sim.COUNTRIES}
+NOW = "2025-01-01T00:00:00"
+
+
+@pytest.fixture
+def data_dir(data_dir, monkeypatch):
+    # The sync's own state and lock files too
+    monkeypatch.setattr(destination_sync, "state_path", str(data_dir / ".destination_sync.json"))
+    monkeypatch.setattr(destination_sync, "lock_path", str(data_dir / ".destination_sync.lock"))
+    return data_dir
+
+
+def write_destinations(data_dir, records):
+    with open(data_dir / destination_sync.destinations_file, "w") as f:
+        json.dump(records, f)
+
+
+def read_destinations(data_dir):
+    with open(data_dir / destination_sync.destinations_file) as f:
+        return {record["id"]: record for record in json.load(f)}
+
+
+@pytest.mark.anyio
+async def test_fetch_countries_joins_field_groups(upstreams):
+    countries = await destination_sync.fetch_countries()
+    assert set(countries) == set(COUNTRIES)
+    # One request per field group, joined on cca3
+    assert upstreams.requests == len(destination_sync.FIELD_GROUPS)
+    assert countries["FRA"]["name"]["common"] == "France"
+    assert countries["FRA"]["currencies"] == COUNTRIES["FRA"]["currencies"]
+
+
+def test_diff_keeps_ids():
+    synced = dict(destination_sync.transform(COUNTRIES["USA"]), id="dest-001", updated_at="earlier")
+    current = [
+        synced,
+        # From before the sync: matched by name, keeps its id
+        {"id": "dest-002", "name": "France", "capital": "Paris (old)"},
+        # Not a restcountries country
+        {"id": "dest-custom", "name": "Atlantis"},
+        # Synced before, no longer upstream
+        {"id": "dest-zzz", "name": "Gone", "country_code": "ZZZ"},
+        # Holds the id Japan would get
+        {"id": "dest-jpn", "name": "Not Japan"},
+    ]
+    records, summary = destination_sync.diff(current, COUNTRIES, NOW)
+    by_id = {record["id"]: record for record in records}
+
+    assert summary == {"added": len(COUNTRIES) - 3, "updated": 1, "removed": 1, "unchanged": 3}
+    assert by_id["dest-001"] is synced
+    assert by_id["dest-002"]["country_code"] == "FRA"
+    assert by_id["dest-002"]["capital"] == "Paris"
+    assert by_id["dest-002"]["updated_at"] == NOW
+    assert by_id["dest-custom"] == {"id": "dest-custom", "name": "Atlantis"}
+    assert "dest-zzz" not in by_id
+    assert by_id["dest-jpn"]["name"] == "Not Japan"
+    assert not any(record.get("country_code") == "JPN" for record in records)
+    assert by_id["dest-ita"]["created_at"] == NOW
+    # Current order first, new countries appended
+    assert [record["id"] for record in records[:4]] == ["dest-001", "dest-002", "dest-custom", "dest-jpn"]
+
+
+@pytest.mark.anyio
+async def test_sync_rewrites_only_on_change(upstreams, data_dir):
+    write_destinations(data_dir, [{"id": "dest-002", "name": "France", "capital": "Paris (old)"}])
+
+    dry_run = await destination_sync.sync(dry_run=True)
+    assert dry_run["added"] == len(COUNTRIES) - 1
+    assert list(read_destinations(data_dir)) == ["dest-002"]
+
+    summary = await destination_sync.sync()
+    assert (summary["added"], summary["updated"], summary["removed"]) == (len(COUNTRIES) - 1, 1, 0)
+    records = read_destinations(data_dir)
+    assert records["dest-002"]["country_code"] == "FRA"
+    assert records["dest-usa"]["name"] == "United States"
+    # The catalog serves the synced data
+    assert len(catalog.current().destinations) == len(COUNTRIES)
+
+    path = data_dir / destination_sync.destinations_file
+    mtime = os.stat(path).st_mtime_ns
+    summary = await destination_sync.sync()
+    assert summary["unchanged"] == len(COUNTRIES)
+    assert os.stat(path).st_mtime_ns == mtime
+    assert destination_sync.last_success() > 0
+
+
+@pytest.mark.anyio
+async def test_background_sync_waits_after_startup(upstreams, data_dir, monkeypatch):
+    # No data file: a sync is overdue, but starting doesn't run it
+    monkeypatch.setattr(destination_sync, "startup_delay", 60)
+    destination_sync.start()
+    try:
+        await asyncio.sleep(0.1)
+        assert upstreams.requests == 0
+        assert not (data_dir / destination_sync.destinations_file).exists()
+
+        # Asking for it (as GET /destinations does without data) runs it now
+        destination_sync.request_sync()
+        for _ in range(100):
+            if (data_dir / destination_sync.destinations_file).exists():
+                break
+            await asyncio.sleep(0.05)
+        assert len(read_destinations(data_dir)) == len(COUNTRIES)
+    finally:
+        await destination_sync.stop()
+
+
+def test_background_sync_can_be_disabled(monkeypatch):
+    monkeypatch.setattr(destination_sync, "sync_enabled", False)
+    assert destination_sync.start() is None
+
+
+@pytest.mark.anyio
+async def test_background_sync_backs_off_while_another_worker_syncs(upstreams, data_dir, monkeypatch):
+    fcntl = pytest.importorskip("fcntl")
+    monkeypatch.setattr(destination_sync, "startup_delay", 0)
+    attempts = []
+    sync = destination_sync.sync
+
+    async def counted_sync():
+        attempts.append(time.monotonic())
+        return await sync()
+
+    monkeypatch.setattr(destination_sync, "sync", counted_sync)
+    # Another worker holds the sync lock
+    with open(destination_sync.lock_path, "w") as held:
+        fcntl.flock(held, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        destination_sync.start()
+        try:
+            await asyncio.sleep(0.2)
+        finally:
+            await destination_sync.stop()
+    assert len(attempts) == 1
+    assert upstreams.requests == 0
@@ -0,0 +1,101 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI, Response
+from fastapi.testclient import TestClient
+
+import catalog
+import microcache
+
+
+@pytest.fixture
+def app(monkeypatch):
+    monkeypatch.setattr(microcache, "cache", microcache.MicroCache(100, 1024, 1 << 20))
+    monkeypatch.setattr(catalog, "_current", catalog.build_catalog({}, version=1))
+    app = FastAPI()
+    app.add_middleware(microcache.MicroCacheMiddleware)
+    app.state.calls = 0
+
+    def called():
+        app.state.calls += 1
+        return app.state.calls
+
+    @app.get("/items")
+    @microcache.cached(ttl=60)
+    async def items(sort_by: str = "rating", limit: int = 10):
+        return {"call": called(), "sort_by": sort_by, "limit": limit}
+
+    @app.get("/slow")
+    @microcache.cached(ttl=60)
+    async def slow():
+        call = called()
+        await asyncio.sleep(0.05)
+        return {"call": call}
+
+    @app.get("/maybe")
+    @microcache.cached(ttl=60)
+    async def maybe(missing: bool = False):
+        call = called()
+        return Response(status_code=404) if missing else {"call": call}
+
+    @app.get("/big")
+    @microcache.cached(ttl=60)
+    async def big():
+        return {"call": called(), "padding": "x" * 2048}
+
+    return app
+
+
+def calls_for(api, url, times=2):
+    # The first request to a path only teaches the middleware its route
+    api.get(url)
+    before = api.app.state.calls
+    responses = [api.get(url) for _ in range(times)]
+    return api.app.state.calls - before, responses
+
+
+def test_query_is_normalized(app):
+    api = TestClient(app)
+    handled, responses = calls_for(api, "/items")
+    assert handled == 1
+    assert responses[0].json() == responses[1].json()
+
+    # Defaults filled in, unknown parameters dropped, order ignored
+    for url in ("/items?sort_by=rating", "/items?limit=10&sort_by=rating", "/items?utm_source=mail"):
+        assert api.get(url).json() == responses[0].json()
+    assert app.state.calls == 2
+
+    assert api.get("/items?sort_by=price").json()["sort_by"] == "price"
+    assert app.state.calls == 3
+
+
+@pytest.mark.anyio
+async def test_concurrent_requests_are_collapsed(app):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        await client.get("/slow")
+        responses = await asyncio.gather(*[client.get("/slow") for _ in range(5)])
+    assert app.state.calls == 2
+    assert {response.json()["call"] for response in responses} == {2}
+
+
+def test_errors_and_large_responses_are_not_cached(app):
+    api = TestClient(app)
+    handled, responses = calls_for(api, "/maybe?missing=true")
+    assert handled == 2
+    assert all(response.status_code == 404 for response in responses)
+
+    handled, responses = calls_for(api, "/big")
+    assert handled == 2
+    assert len(microcache.cache) == 0
+
+
+def test_catalog_change_invalidates(app, monkeypatch):
+    api = TestClient(app)
+    calls_for(api, "/items")
+    assert app.state.calls == 2
+
+    monkeypatch.setattr(catalog, "_current", catalog.build_catalog({}, version=2))
+    assert api.get("/items").json()["call"] == 3
+    assert api.get("/items").json()["call"] == 3
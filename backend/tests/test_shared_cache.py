@@ -0,0 +1,44 @@
+import asyncio
+
+import pytest
+
+from shared_cache import LocalCache
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_concurrent_misses_share_one_computation():
+    cache = LocalCache("test", default_ttl=60)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"value": len(calls)}
+
+    results = await asyncio.gather(*[cache.get_or_compute("key", compute) for _ in range(5)])
+    assert results == [{"value": 1}] * 5
+    assert len(calls) == 1
+    assert cache.get("key") == {"value": 1}
+
+
+async def test_cancelled_leader_does_not_cancel_waiters():
+    cache = LocalCache("test", default_ttl=60)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"value": len(calls)}
+
+    leader = asyncio.ensure_future(cache.get_or_compute("key", compute))
+    await asyncio.sleep(0.01)
+    waiters = [asyncio.ensure_future(cache.get_or_compute("key", compute)) for _ in range(3)]
+    await asyncio.sleep(0.01)
+    # As when a /batch item times out while leading the fetch
+    leader.cancel()
+
+    assert await asyncio.gather(*waiters) == [{"value": 2}] * 3
+    assert leader.cancelled()
+    # The waiters took over with one computation between them
+    assert len(calls) == 2
@@ -0,0 +1,111 @@
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import upstream
+import upstream_sim
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def client(simulator, upstream_sim_url):
+    breaker = upstream.CircuitBreaker("test", threshold=2, reset_timeout=0.2)
+    return upstream.UpstreamClient("test", upstream_sim_url, timeout=1.0, retries=2, backoff=0.001, breaker=breaker)
+
+
+async def test_retries_until_success(client, simulator):
+    # With this seed the first two draws fail and the third succeeds
+    upstream_sim.configure(upstream_sim.Faults(error_rate=0.5, status=503, seed=7))
+    countries = await client.get_json("/v3.1/all", params={"fields": "cca3"})
+    assert len(countries) == len(upstream_sim.COUNTRIES)
+    assert simulator.stats()["statuses"] == {"200": 1, "503": 2}
+    assert client.breaker.state == "closed"
+
+
+async def test_gives_up_after_retries(client, simulator):
+    upstream_sim.configure(upstream_sim.Faults(error_rate=1, status=500))
+    with pytest.raises(upstream.UpstreamError, match="HTTP 500"):
+        await client.get_json("/v3.1/all")
+    assert simulator.requests == 3
+    assert client.breaker.failures == 1
+
+
+async def test_client_errors_are_not_retried(client, simulator):
+    with pytest.raises(upstream.UpstreamError, match="HTTP 404"):
+        await client.get_json("/missing")
+    assert simulator.requests == 1
+    assert client.breaker.failures == 0
+
+
+async def test_timeouts_respect_request_budget(client, simulator):
+    upstream_sim.configure(upstream_sim.Faults(latency_ms=500))
+    started = time.monotonic()
+    with upstream.deadline(0.2):
+        with pytest.raises(upstream.UpstreamTimeout):
+            await client.get_json("/v3.1/all")
+    assert time.monotonic() - started < 0.45
+
+
+async def test_breaker_opens_and_recovers(client, simulator):
+    upstream_sim.configure(upstream_sim.Faults(error_rate=1, status=503))
+    for _ in range(2):
+        with pytest.raises(upstream.UpstreamError):
+            await client.get_json("/v3.1/all")
+    assert client.breaker.state == "open"
+
+    # Open: fails fast without calling the upstream
+    requests = simulator.requests
+    with pytest.raises(upstream.CircuitOpen):
+        await client.get_json("/v3.1/all")
+    assert simulator.requests == requests
+
+    # Half-open after the reset timeout: a successful trial closes it
+    upstream_sim.configure(upstream_sim.Faults())
+    time.sleep(0.25)
+    assert client.breaker.state == "half-open"
+    await client.get_json("/v3.1/all", params={"fields": "cca3"})
+    assert client.breaker.state == "closed"
+
+
+async def test_stream_json_array(client, simulator):
+    items = [item async for item in client.stream_json_array("/v3.1/all", params={"fields": "cca3"})]
+    assert [item["cca3"] for item in items] == [country["cca3"] for country in upstream_sim.COUNTRIES]
+
+
+def test_weather_served_stale_when_upstream_fails(upstreams, monkeypatch):
+    import main
+    from routers import destinations
+
+    monkeypatch.setattr(destinations, "cache", destinations.create_cache("destinations-test", default_ttl=3600))
+    api = TestClient(main.app)
+
+    fresh = api.get("/destinations/dest-001/weather")
+    assert fresh.status_code == 200
+    assert "stale" not in fresh.json()
+
+    # Later reads miss the cache while the upstream is down
+    destinations.cache.clear()
+    upstream_sim.configure(upstream_sim.Faults(error_rate=1, status=503))
+    stale = api.get("/destinations/dest-001/weather")
+    assert stale.status_code == 200
+    assert stale.json()["stale"] is True
+    assert stale.json()["temperature"] == fresh.json()["temperature"]
+
+    # Nothing to fall back on for a destination never fetched
+    assert api.get("/destinations/dest-002/weather").status_code in (502, 503)
+
+
+async def test_stream_client_errors_do_not_open_the_breaker(client, simulator):
+    for _ in range(3):
+        with pytest.raises(upstream.UpstreamError, match="HTTP 404"):
+            [item async for item in client.stream_json_array("/missing")]
+    assert client.breaker.state == "closed"
+    assert client.breaker.failures == 0
+
+    upstream_sim.configure(upstream_sim.Faults(error_rate=1, status=503))
+    for _ in range(2):
+        with pytest.raises(upstream.UpstreamError, match="HTTP 503"):
+            [item async for item in client.stream_json_array("/v3.1/all")]
+    assert client.breaker.state == "open"
@@ -0,0 +1,42 @@
+import httpx
+
+import upstream_sim
+
+
+def statuses(url, count, path="/v3.1/all?fields=cca3"):
+    with httpx.Client(base_url=url) as client:
+        return [client.get(path).status_code for _ in range(count)]
+
+
+def test_serves_recorded_countries(simulator, upstream_sim_url):
+    response = httpx.get(f"{upstream_sim_url}/v3.1/all", params={"fields": "cca3,name"})
+    assert response.status_code == 200
+    countries = response.json()
+    assert len(countries) == len(upstream_sim.COUNTRIES)
+    assert all(set(country) == {"cca3", "name"} for country in countries)
+
+
+def test_seeded_errors_repeat(simulator, upstream_sim_url):
+    faults = upstream_sim.Faults(error_rate=0.5, status=502, seed=11)
+    upstream_sim.configure(faults)
+    first = statuses(upstream_sim_url, 20)
+    upstream_sim.configure(faults)
+    assert statuses(upstream_sim_url, 20) == first
+    assert set(first) == {200, 502}
+
+
+def test_rate_limit(simulator, upstream_sim_url):
+    upstream_sim.configure(upstream_sim.Faults(rate_limit_rps=0.01, rate_limit_burst=2, retry_after_s=7))
+    assert statuses(upstream_sim_url, 4) == [200, 200, 429, 429]
+    response = httpx.get(f"{upstream_sim_url}/v3.1/all")
+    assert response.headers["Retry-After"] == "7"
+
+
+def test_stats_and_runtime_faults(simulator, upstream_sim_url):
+    with httpx.Client(base_url=upstream_sim_url) as client:
+        assert client.put("/_faults", json={"error_rate": 1, "status": 500}).status_code == 200
+        assert client.get("/v1/forecast", params={"latitude": 1, "longitude": 2}).status_code == 500
+        stats = client.get("/_stats").json()
+    # Control endpoints aren't counted
+    assert stats["requests"] == 1
+    assert stats["statuses"] == {"500": 1}
@@ -0,0 +1,311 @@
+"""
+Local cache of hourly weather series.
+
+Each destination's series is held as dense float32 arrays indexed by hour
+(NaN where nothing was fetched), with a per-day fetch timestamp so callers
+can ask which windows of a date range still need fetching. Past days are
+kept until they fall out of the retention period; days that may still
+change (today and forecasts) expire after ``volatile_ttl``. Series are
+persisted as ``.npz`` files so restarts and other workers reuse them.
+
+Aggregates are computed with vectorized NumPy reductions over a
+``(days, 24)`` view of the hourly arrays.
+"""
+import logging
+import os
+import threading
+import time
+import warnings
+from collections import OrderedDict
+from datetime import date
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+cache_dir = os.environ.get(
+    "TIMESERIES_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "timeseries"),
+)
+
+# Days of history kept per destination (enough for three years of climate)
+retention_days = int(os.environ.get("TIMESERIES_RETENTION_DAYS", 1100))
+
+# How long forecast days (and today) are served before being refetched
+volatile_ttl = float(os.environ.get("TIMESERIES_FORECAST_TTL_SECONDS", 3 * 3600))
+
+# Series kept in memory per worker; older ones are reloaded from disk
+max_series = int(os.environ.get("TIMESERIES_MAX_SERIES", 128))
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+TIMESERIES_SERIES = metrics.registry.gauge(
+    "tourease_timeseries_series",
+    "Hourly series held in memory",
+)
+
+
+def day_number(value: date) -> int:
+    return value.toordinal() - _EPOCH_ORDINAL
+
+
+def day_date(number: int) -> date:
+    return date.fromordinal(number + _EPOCH_ORDINAL)
+
+
+class Series:
+    """
+    Hourly values for one key from ``start_day`` (days since the epoch, in the
+    location's local time) over ``len(fetched_at)`` days.
+    """
+
+    def __init__(self, variables: Sequence[str], start_day: int = 0, days: int = 0):
+        self.start_day = start_day
+        self.values: Dict[str, np.ndarray] = {
+            name: np.full(days * 24, np.nan, dtype=np.float32) for name in variables
+        }
+        self.fetched_at = np.zeros(days, dtype=np.float64)
+        # Modification time of the file this series was loaded from
+        self.mtime = 0.0
+
+    @property
+    def days(self) -> int:
+        return len(self.fetched_at)
+
+    @property
+    def end_day(self) -> int:
+        return self.start_day + self.days
+
+    def _extend(self, start_day: int, end_day: int):
+        if self.days == 0:
+            new_start, new_end = start_day, end_day
+        else:
+            new_start, new_end = min(start_day, self.start_day), max(end_day, self.end_day)
+        if (new_start, new_end) == (self.start_day, self.end_day):
+            return
+        before, after = self.start_day - new_start, new_end - self.end_day
+        if self.days == 0:
+            before, after = 0, new_end - new_start
+        for name, array in self.values.items():
+            self.values[name] = np.concatenate([
+                np.full(before * 24, np.nan, dtype=np.float32),
+                array,
+                np.full(after * 24, np.nan, dtype=np.float32),
+            ])
+        self.fetched_at = np.concatenate([np.zeros(before), self.fetched_at, np.zeros(after)])
+        self.start_day = new_start
+
+    def trim(self, first_day: int):
+        """
+        Drop days before ``first_day``.
+        """
+        cut = first_day - self.start_day
+        if cut <= 0:
+            return
+        cut = min(cut, self.days)
+        for name, array in self.values.items():
+            self.values[name] = array[cut * 24:].copy()
+        self.fetched_at = self.fetched_at[cut:].copy()
+        self.start_day += cut
+
+    def write(self, hours: np.ndarray, values: Dict[str, np.ndarray], start_day: int, end_day: int, now: float):
+        """
+        Store values at ``hours`` (hours since the epoch, local time) and mark
+        days ``start_day..end_day`` (inclusive) as fetched at ``now``.
+        """
+        self._extend(start_day, end_day + 1)
+        index = hours - self.start_day * 24
+        inside = (index >= 0) & (index < self.days * 24)
+        for name, array in values.items():
+            if name in self.values:
+                self.values[name][index[inside]] = array[inside]
+        self.fetched_at[start_day - self.start_day:end_day + 1 - self.start_day] = now
+
+    def window(self, start_day: int, end_day: int) -> Dict[str, np.ndarray]:
+        """
+        ``(days, 24)`` views of each variable for ``start_day..end_day``
+        (inclusive); days outside the stored range are NaN.
+        """
+        days = end_day - start_day + 1
+        result = {}
+        for name, array in self.values.items():
+            out = np.full(days * 24, np.nan, dtype=np.float32)
+            lo, hi = max(start_day, self.start_day), min(end_day + 1, self.end_day)
+            if lo < hi:
+                out[(lo - start_day) * 24:(hi - start_day) * 24] = array[(lo - self.start_day) * 24:(hi - self.start_day) * 24]
+            result[name] = out.reshape(days, 24)
+        return result
+
+    def fetch_times(self, start_day: int, end_day: int) -> np.ndarray:
+        out = np.zeros(end_day - start_day + 1)
+        lo, hi = max(start_day, self.start_day), min(end_day + 1, self.end_day)
+        if lo < hi:
+            out[lo - start_day:hi - start_day] = self.fetched_at[lo - self.start_day:hi - self.start_day]
+        return out
+
+
+class HourlyStore:
+    """
+    Per-key hourly series with retention, persisted under ``directory``.
+    """
+
+    def __init__(self, name: str, variables: Sequence[str], directory: str = cache_dir,
+                 retention_days: int = retention_days, volatile_ttl: float = volatile_ttl,
+                 max_series: int = max_series):
+        self.name = name
+        self.variables = tuple(variables)
+        self.directory = os.path.join(directory, name)
+        self.retention_days = retention_days
+        self.volatile_ttl = volatile_ttl
+        self.max_series = max_series
+        self._series: "OrderedDict[str, Series]" = OrderedDict()
+        self._lock = threading.Lock()
+        TIMESERIES_SERIES.set_function(lambda: len(self._series))
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.npz")
+
+    def _load(self, key: str) -> Series:
+        series = Series(self.variables)
+        try:
+            series.mtime = os.path.getmtime(self._path(key))
+            with np.load(self._path(key)) as data:
+                series.start_day = int(data["start_day"])
+                series.fetched_at = data["fetched_at"].astype(np.float64)
+                for name in self.variables:
+                    if name in data and len(data[name]) == series.days * 24:
+                        series.values[name] = data[name].astype(np.float32)
+                    else:
+                        series.values[name] = np.full(series.days * 24, np.nan, dtype=np.float32)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("Ignoring unreadable series %s: %s", self._path(key), e)
+            series = Series(self.variables)
+        return series
+
+    def _save(self, key: str, series: Series):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        tmp_path = f"{path}.tmp-{os.getpid()}.npz"
+        np.savez_compressed(
+            tmp_path, start_day=np.int64(series.start_day), fetched_at=series.fetched_at, **series.values
+        )
+        os.replace(tmp_path, path)
+        series.mtime = os.path.getmtime(path)
+
+    def _changed_on_disk(self, key, series):
+        # Another worker fetched more of this series
+        try:
+            return os.path.getmtime(self._path(key)) != series.mtime
+        except OSError:
+            return False
+
+    def get(self, key: str) -> Series:
+        with self._lock:
+            series = self._series.pop(key, None)
+            if series is None or self._changed_on_disk(key, series):
+                series = self._load(key)
+            self._series[key] = series
+            while len(self._series) > self.max_series:
+                self._series.popitem(last=False)
+            return series
+
+    def missing_windows(self, key: str, start_day: int, end_day: int,
+                        now: Optional[float] = None) -> List[Tuple[int, int]]:
+        """
+        Contiguous day ranges (inclusive) in ``start_day..end_day`` that have
+        never been fetched, or that were fetched while they could still change
+        and have expired.
+        """
+        now = time.time() if now is None else now
+        fetched_at = self.get(key).fetch_times(start_day, end_day)
+        days = np.arange(start_day, end_day + 1)
+        # A day is final once it had ended everywhere when it was fetched;
+        # until then it may still change and expires after volatile_ttl
+        final = fetched_at >= (days + 2) * 86400.0
+        fresh = (fetched_at > 0) & (final | (now - fetched_at < self.volatile_ttl))
+        missing = ~fresh
+        if not missing.any():
+            return []
+        # Run boundaries of the missing mask
+        edges = np.flatnonzero(np.diff(np.concatenate([[0], missing.view(np.int8), [0]])))
+        return [(start_day + int(a), start_day + int(b) - 1) for a, b in zip(edges[::2], edges[1::2])]
+
+    def update(self, key: str, hours: np.ndarray, values: Dict[str, np.ndarray],
+               start_day: int, end_day: int, today: int, now: Optional[float] = None):
+        now = time.time() if now is None else now
+        with self._lock:
+            series = self._series.get(key)
+            if series is None or self._changed_on_disk(key, series):
+                series = self._load(key)
+            series.write(hours, values, start_day, end_day, now)
+            series.trim(today - self.retention_days)
+            self._series[key] = series
+            self._save(key, series)
+
+    def window(self, key: str, start_day: int, end_day: int) -> Dict[str, np.ndarray]:
+        return self.get(key).window(start_day, end_day)
+
+
+def parse_hours(times: Sequence[str]) -> np.ndarray:
+    """
+    ISO local timestamps ("2024-05-01T13:00") to hours since the epoch.
+    """
+    return np.array(times, dtype="datetime64[h]").astype(np.int64)
+
+
+def to_array(values: Sequence[Optional[float]]) -> np.ndarray:
+    return np.array([np.nan if v is None else v for v in values], dtype=np.float32)
+
+
+def daily(hourly: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """
+    Daily min/max/mean temperature and precipitation totals from ``(days, 24)``
+    arrays; days without any data are NaN.
+    """
+    temperature = hourly["temperature_2m"]
+    precipitation = hourly["precipitation"]
+    with warnings.catch_warnings():
+        # All-NaN days are expected (not fetched) and come out as NaN
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        return {
+            "temperature_min": np.nanmin(temperature, axis=1),
+            "temperature_max": np.nanmax(temperature, axis=1),
+            "temperature_mean": np.nanmean(temperature, axis=1),
+            "precipitation_sum": np.where(
+                np.isnan(precipitation).all(axis=1), np.nan, np.nansum(precipitation, axis=1)
+            ),
+        }
+
+
+# Average length of each calendar month, to turn mean daily precipitation
+# into a monthly total
+_MONTH_DAYS = np.array([31, 28.25, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+
+
+def monthly(start_day: int, days: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """
+    Average daily aggregates by calendar month (index 0 = January) with
+    weighted bincounts. Precipitation is the mean daily total scaled to the
+    month's length, so partially covered months aren't under-counted.
+    """
+    n = len(days["temperature_mean"])
+    months = np.arange(start_day, start_day + n).astype("datetime64[D]").astype("datetime64[M]")
+    month_of_year = months.astype(np.int64) % 12
+
+    result = {}
+    for name in ("temperature_min", "temperature_max", "temperature_mean", "precipitation_sum"):
+        values = days[name]
+        valid = ~np.isnan(values)
+        counts = np.bincount(month_of_year[valid], minlength=12)
+        sums = np.bincount(month_of_year[valid], weights=values[valid], minlength=12)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            result[name] = np.where(counts > 0, sums / counts, np.nan)
+        if name == "temperature_mean":
+            result["days"] = counts
+    result["precipitation_sum"] = result["precipitation_sum"] * _MONTH_DAYS
+    return result
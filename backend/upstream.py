@@ -0,0 +1,441 @@
+import asyncio
+import contextvars
+import json
+import logging
+import math
+import os
+import random
+import time
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Callable, List, Optional
+
+import metrics
+from loop_monitor import run_blocking
+from shared_cache import create_cache
+
+logger = logging.getLogger(__name__)
+
+# Time budget for all upstream calls made while serving one request
+request_budget = float(os.environ.get("UPSTREAM_REQUEST_BUDGET_MS", 5000)) / 1000
+
+# Circuit breaker: consecutive failed calls before it opens, and how long it
+# stays open before letting a trial call through
+breaker_threshold = int(os.environ.get("UPSTREAM_BREAKER_THRESHOLD", 5))
+breaker_reset = float(os.environ.get("UPSTREAM_BREAKER_RESET_SECONDS", 30))
+
+# Base URLs, so the app can be pointed at a local stand-in (see upstream_sim.py)
+open_meteo_base_url = os.environ.get("OPEN_METEO_BASE_URL", "https://api.open-meteo.com")
+open_meteo_archive_base_url = os.environ.get("OPEN_METEO_ARCHIVE_BASE_URL", "https://archive-api.open-meteo.com")
+restcountries_base_url = os.environ.get("RESTCOUNTRIES_BASE_URL", "https://restcountries.com")
+
+UPSTREAM_RETRIES = metrics.registry.counter(
+    "tourease_upstream_retries_total",
+    "Upstream call attempts retried after a transient failure",
+    ["upstream"],
+)
+UPSTREAM_BREAKER_STATE = metrics.registry.gauge(
+    "tourease_upstream_breaker_open",
+    "1 while the upstream's circuit breaker is open or half-open",
+    ["upstream"],
+)
+UPSTREAM_STALE = metrics.registry.counter(
+    "tourease_upstream_stale_total",
+    "Responses served from the last good value because the upstream failed",
+    ["upstream"],
+)
+
+# Absolute (monotonic) deadline of the request being served, if any
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar(
+    "upstream_deadline", default=None
+)
+
+
+class UpstreamError(Exception):
+    """
+    An upstream call failed; ``status_code`` is the HTTP status to report.
+    """
+
+    status_code = 502
+
+    def __init__(self, upstream: str, message: str):
+        self.upstream = upstream
+        super().__init__(f"{upstream}: {message}")
+
+
+class UpstreamTimeout(UpstreamError):
+    status_code = 504
+
+
+class CircuitOpen(UpstreamError):
+    status_code = 503
+
+    def __init__(self, upstream: str, retry_after: float):
+        self.retry_after = retry_after
+        super().__init__(upstream, f"circuit open, retry in {retry_after:.0f}s")
+
+
+@contextmanager
+def deadline(seconds: float):
+    """
+    Limit upstream calls inside the block to ``seconds`` in total. Nested
+    deadlines can only shorten the enclosing one.
+    """
+    current = _deadline.get()
+    new = time.monotonic() + seconds
+    token = _deadline.set(new if current is None else min(current, new))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """
+    Seconds left in the current request budget, or None without a budget.
+    """
+    current = _deadline.get()
+    return None if current is None else current - time.monotonic()
+
+
+class CircuitBreaker:
+    """
+    Opens after ``threshold`` consecutive failures and fails fast until
+    ``reset_timeout`` has passed; then one trial call is let through
+    (half-open) and its outcome closes or re-opens the breaker.
+    """
+
+    def __init__(self, name: str, threshold: int = breaker_threshold, reset_timeout: float = breaker_reset):
+        self.name = name
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        # Start of the half-open trial call, if one is in progress
+        self._trial_at: Optional[float] = None
+        UPSTREAM_BREAKER_STATE.labels(name).set_function(lambda: 0.0 if self.opened_at is None else 1.0)
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        now = time.monotonic()
+        # A trial that never reported back (e.g. cancelled) doesn't block
+        # the next one forever
+        if state == "half-open" and (self._trial_at is None or now - self._trial_at >= self.reset_timeout):
+            self._trial_at = now
+            return True
+        return False
+
+    def record_success(self):
+        if self.opened_at is not None:
+            logger.info("Circuit breaker for %s closed", self.name)
+        self.failures = 0
+        self.opened_at = None
+        self._trial_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self._trial_at is not None or self.failures >= self.threshold:
+            if self.opened_at is None:
+                logger.warning("Circuit breaker for %s opened after %d failures", self.name, self.failures)
+            self.opened_at = time.monotonic()
+            self._trial_at = None
+
+    def retry_after(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return max(self.reset_timeout - (time.monotonic() - self.opened_at), 0.0)
+
+
+class JSONArrayParser:
+    """
+    Incremental parser for a JSON array arriving in chunks: ``feed`` returns
+    the items completed so far, so the whole body is never held at once.
+    """
+
+    def __init__(self):
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._opened = False
+        self.closed = False
+
+    def feed(self, text: str) -> List[Any]:
+        buffer = self._buffer + text
+        items = []
+        pos = 0
+        while not self.closed:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= len(buffer):
+                break
+            if not self._opened:
+                if buffer[pos] != "[":
+                    raise ValueError("Expected a JSON array")
+                self._opened = True
+                pos += 1
+                continue
+            if buffer[pos] == "]":
+                self.closed = True
+                pos += 1
+                break
+            try:
+                item, end = self._decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # Incomplete item; wait for the next chunk
+                break
+            if not isinstance(item, (dict, list, str)) and (
+                end == len(buffer) or buffer[end] not in " \t\r\n,]"
+            ):
+                # A number may continue in the next chunk
+                break
+            items.append(item)
+            pos = end
+        self._buffer = buffer[pos:]
+        return items
+
+    def close(self):
+        if not self.closed or self._buffer.strip():
+            raise ValueError("Truncated or malformed JSON array")
+
+
+class UpstreamClient:
+    """
+    JSON client for one upstream API.
+
+    Every attempt's timeout is capped by the remaining request budget;
+    idempotent calls are retried on timeouts, connection errors, 429 and 5xx
+    with jittered exponential backoff while the budget lasts; and a circuit
+    breaker fails calls fast while the upstream is down.
+
+    Calls share one HTTP client (and its connection pool), created on first
+    use off the event loop since setting up its SSL context blocks. It is
+    replaced when ``transport`` changes or a call comes from another event
+    loop, and closed by ``aclose``.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        base_url: str,
+        timeout: float = 10.0,
+        retries: int = 2,
+        backoff: float = 0.1,
+        max_backoff: float = 1.0,
+        breaker: Optional[CircuitBreaker] = None,
+        transport=None,
+    ):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = breaker or CircuitBreaker(name)
+        # Optional httpx transport, e.g. httpx.ASGITransport(upstream_sim.app)
+        self.transport = transport
+        self._errors = metrics.UPSTREAM_ERRORS.labels(name)
+        self._retries = UPSTREAM_RETRIES.labels(name)
+        self._client = None
+        # Transport and event loop the client was created for
+        self._client_key = None
+
+    def _new_client(self):
+        import httpx
+
+        return httpx.AsyncClient(timeout=self.timeout, transport=self.transport)
+
+    async def _http(self):
+        key = (self.transport, asyncio.get_running_loop())
+        if self._client is not None and self._client_key == key:
+            return self._client
+        previous, previous_key = self._client, self._client_key
+        client = await run_blocking(self._new_client)
+        if self._client is not None and self._client_key == key:
+            # Another call created one meanwhile
+            await client.aclose()
+            return self._client
+        self._client, self._client_key = client, key
+        # A client from a loop that is gone can't be closed any more
+        if previous is not None and previous_key[1] is key[1]:
+            await previous.aclose()
+        return client
+
+    async def aclose(self):
+        client, self._client, self._client_key = self._client, None, None
+        if client is not None:
+            await client.aclose()
+
+    def _attempt_timeout(self):
+        left = remaining()
+        if left is None:
+            return self.timeout
+        if left <= 0:
+            raise UpstreamTimeout(self.name, "request budget exhausted")
+        return min(self.timeout, left)
+
+    def _backoff(self, attempt):
+        # Full jitter keeps retries from many requests from synchronising
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    async def get_json(self, path: str, params: Optional[dict] = None, idempotent: bool = True) -> Any:
+        import httpx
+
+        if not self.breaker.allow():
+            self._errors.inc()
+            raise CircuitOpen(self.name, self.breaker.retry_after())
+
+        url = f"{self.base_url}{path}"
+        attempts = 1 + (self.retries if idempotent else 0)
+        for attempt in range(attempts):
+            try:
+                timeout = self._attempt_timeout()
+                client = await self._http()
+                with metrics.track_upstream(self.name):
+                    # httpx timeouts apply per phase (connect, each read);
+                    # wait_for bounds the whole call
+                    response = await asyncio.wait_for(client.get(url, params=params, timeout=timeout), timeout)
+                    if response.status_code != 429 and response.status_code < 500:
+                        response.raise_for_status()
+                        data = response.json()
+                        self.breaker.record_success()
+                        return data
+                self._errors.inc()
+                error = UpstreamError(self.name, f"HTTP {response.status_code}")
+            except UpstreamTimeout as e:
+                error = e
+                break
+            except (httpx.TimeoutException, asyncio.TimeoutError):
+                error = UpstreamTimeout(self.name, "timed out")
+            except httpx.HTTPStatusError as e:
+                # Other 4xx responses won't succeed on retry and don't mean
+                # the upstream is down
+                self.breaker.record_success()
+                raise UpstreamError(self.name, f"HTTP {e.response.status_code}")
+            except (httpx.TransportError, ValueError) as e:
+                error = UpstreamError(self.name, str(e) or type(e).__name__)
+
+            if attempt + 1 < attempts:
+                delay = self._backoff(attempt)
+                left = remaining()
+                if left is not None and left <= delay:
+                    break
+                self._retries.inc()
+                await asyncio.sleep(delay)
+
+        self.breaker.record_failure()
+        raise error
+
+
+    async def stream_json_array(self, path: str, params: Optional[dict] = None) -> AsyncIterator[Any]:
+        """
+        Yield the items of a JSON array response as they are parsed. Not
+        retried, since a failure part-way would repeat items; callers retry
+        the whole stream.
+        """
+        import httpx
+
+        if not self.breaker.allow():
+            self._errors.inc()
+            raise CircuitOpen(self.name, self.breaker.retry_after())
+
+        parser = JSONArrayParser()
+        client_error = False
+        try:
+            timeout = self._attempt_timeout()
+            client = await self._http()
+            with metrics.track_upstream(self.name):
+                async with client.stream("GET", f"{self.base_url}{path}", params=params, timeout=timeout) as response:
+                    if response.status_code >= 400:
+                        client_error = response.status_code != 429 and response.status_code < 500
+                        raise UpstreamError(self.name, f"HTTP {response.status_code}")
+                    async for chunk in response.aiter_text():
+                        for item in parser.feed(chunk):
+                            yield item
+                    parser.close()
+        except httpx.TimeoutException:
+            self.breaker.record_failure()
+            raise UpstreamTimeout(self.name, "timed out")
+        except (httpx.TransportError, ValueError) as e:
+            self.breaker.record_failure()
+            raise UpstreamError(self.name, str(e) or type(e).__name__)
+        except UpstreamError:
+            if client_error:
+                # As in get_json: other 4xx responses don't mean the
+                # upstream is down
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+
+
+open_meteo = UpstreamClient("open-meteo", open_meteo_base_url, timeout=4.0)
+open_meteo_archive = UpstreamClient("open-meteo-archive", open_meteo_archive_base_url, timeout=4.0)
+restcountries = UpstreamClient("restcountries", restcountries_base_url, timeout=30.0, retries=1)
+clients = (open_meteo, open_meteo_archive, restcountries)
+
+
+async def close():
+    """
+    Close the upstream clients' connections; called at shutdown.
+    """
+    await asyncio.gather(*(client.aclose() for client in clients))
+
+# Last good response for each key, kept without expiry so it can be served
+# (marked stale) while an upstream is failing
+last_good = create_cache("upstream-last-good")
+
+
+def remember(key: str, value: Any) -> Any:
+    """
+    Keep ``value`` as the last good response for ``key``.
+    """
+    last_good.set(key, value)
+    return value
+
+
+def stale_or_raise(key: str, error: UpstreamError, mark_stale: Callable[[Any], Any]) -> Any:
+    """
+    Return the last good response for ``key`` passed through ``mark_stale``,
+    or re-raise ``error`` if there is none.
+    """
+    stale = last_good.get(key)
+    if stale is None:
+        raise error
+    logger.warning("Serving stale %s for %s: %s", error.upstream, key, error)
+    UPSTREAM_STALE.labels(error.upstream).inc()
+    return mark_stale(stale)
+
+
+async def error_handler(request, exc: UpstreamError):
+    from fastapi.responses import JSONResponse
+
+    headers = None
+    if isinstance(exc, CircuitOpen):
+        headers = {"Retry-After": str(max(1, math.ceil(exc.retry_after)))}
+    return JSONResponse({"detail": f"Upstream unavailable ({exc})"}, status_code=exc.status_code, headers=headers)
+
+
+class DeadlineMiddleware:
+    """
+    ASGI middleware giving every request an upstream time budget.
+    """
+
+    def __init__(self, app, budget=request_budget):
+        self.app = app
+        self.budget = budget
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.budget:
+            await self.app(scope, receive, send)
+            return
+        with deadline(self.budget):
+            await self.app(scope, receive, send)
@@ -0,0 +1,411 @@
+"""
+Local fault-injecting stand-in for the upstream APIs (Open-Meteo forecast and
+archive, restcountries), for exercising timeouts, retries, rate limits, the
+circuit breaker and stale fallbacks reproducibly and without the internet.
+
+    python upstream_sim.py --port 8900 --latency-ms 120 --latency-distribution lognormal --seed 1
+    OPEN_METEO_BASE_URL=http://localhost:8900 OPEN_METEO_ARCHIVE_BASE_URL=http://localhost:8900 \
+        RESTCOUNTRIES_BASE_URL=http://localhost:8900 python main.py
+
+Faults apply to every endpoint except the ``/_faults`` and ``/_stats``
+control endpoints, in this order:
+
+- rate limit: beyond ``rate_limit_rps`` (token bucket of ``rate_limit_burst``)
+  requests get 429 with ``Retry-After``;
+- concurrency: at most ``max_concurrency`` requests are served at once, the
+  rest wait for a slot like at a saturated upstream;
+- latency drawn from ``latency_distribution``: ``constant``, ``uniform``
+  (``latency_ms`` +/- ``latency_jitter_ms``), ``normal`` (standard deviation
+  ``latency_jitter_ms``), ``lognormal`` (median ``latency_ms``, shape
+  ``latency_sigma``) or ``exponential`` (mean ``latency_ms``);
+- errors: ``error_rate`` of requests are answered with ``status``;
+- bandwidth: response bodies are sent at ``bandwidth_kbps``.
+
+With ``seed`` set, latencies and errors follow the same sequence on every
+run. Faults are set on the command line or at runtime with ``PUT /_faults``
+(JSON body with the same fields); ``GET /_stats`` counts requests by status
+and the peak concurrency seen (``DELETE /_stats`` resets it). Countries are
+served from the recorded fixture in ``fixtures/restcountries_all.json``.
+
+From tests and benchmarks, ``serve()`` runs the simulator on a free port in
+a background thread and ``attach()`` points the API's upstream clients at
+it (or at the app in-process through ``httpx.ASGITransport``)::
+
+    @pytest.fixture
+    def slow_upstreams():
+        with upstream_sim.serve(upstream_sim.Faults(latency_ms=300, error_rate=0.1, seed=7)) as url:
+            with upstream_sim.attach(url):
+                yield url
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import math
+import os
+import random
+import threading
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+from typing import Literal, Optional, get_args
+
+from fastapi import FastAPI, Query
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field
+
+
+class Faults(BaseModel):
+    # Latency added to every response
+    latency_ms: float = Field(0, ge=0)
+    latency_distribution: Literal["constant", "uniform", "normal", "lognormal", "exponential"] = "constant"
+    latency_jitter_ms: float = Field(0, ge=0)
+    latency_sigma: float = Field(0.5, ge=0)
+    # Share of requests answered with ``status`` instead of data
+    error_rate: float = Field(0, ge=0, le=1)
+    status: int = Field(503, ge=400, le=599)
+    # Requests per second before answering 429 (0: unlimited)
+    rate_limit_rps: float = Field(0, ge=0)
+    rate_limit_burst: float = Field(10, ge=1)
+    # Sent with 429 and 503 responses
+    retry_after_s: int = Field(1, ge=0)
+    # Requests served at once (0: unlimited)
+    max_concurrency: int = Field(0, ge=0)
+    # Response body bandwidth per request in kilobits per second (0: unlimited)
+    bandwidth_kbps: float = Field(0, ge=0)
+    # Seed for reproducible latencies and errors
+    seed: Optional[int] = None
+
+
+class Simulator:
+    """
+    Current faults with the state they need (random generator, token bucket,
+    concurrency slots) and request statistics.
+    """
+
+    def __init__(self, faults: Faults):
+        self.configure(faults)
+        self.reset_stats()
+
+    def configure(self, faults: Faults):
+        self.faults = faults
+        self.rng = random.Random(faults.seed)
+        self.tokens = faults.rate_limit_burst
+        self.refilled_at = time.monotonic()
+        # Created on first use, in the loop serving requests
+        self.slots: Optional[asyncio.Semaphore] = None
+
+    def reset_stats(self):
+        self.requests = 0
+        self.statuses = Counter()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.bytes_sent = 0
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "statuses": {str(code): count for code, count in sorted(self.statuses.items())},
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "bytes_sent": self.bytes_sent,
+        }
+
+    def rate_limited(self) -> bool:
+        rps = self.faults.rate_limit_rps
+        if not rps:
+            return False
+        now = time.monotonic()
+        self.tokens = min(self.faults.rate_limit_burst, self.tokens + (now - self.refilled_at) * rps)
+        self.refilled_at = now
+        if self.tokens < 1:
+            return True
+        self.tokens -= 1
+        return False
+
+    def latency(self) -> float:
+        faults, rng = self.faults, self.rng
+        ms = faults.latency_ms
+        distribution = faults.latency_distribution
+        if distribution == "uniform":
+            ms = rng.uniform(ms - faults.latency_jitter_ms, ms + faults.latency_jitter_ms)
+        elif distribution == "normal":
+            ms = rng.gauss(ms, faults.latency_jitter_ms)
+        elif distribution == "lognormal":
+            ms = ms * math.exp(rng.gauss(0, faults.latency_sigma))
+        elif distribution == "exponential":
+            ms = rng.expovariate(1 / ms) if ms else 0
+        return max(ms, 0) / 1000
+
+    def failed(self) -> bool:
+        return bool(self.faults.error_rate) and self.rng.random() < self.faults.error_rate
+
+
+class FaultInjector:
+    """
+    ASGI middleware applying the simulator's faults to the upstream endpoints.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in ("/_faults", "/_stats"):
+            await self.app(scope, receive, send)
+            return
+        sim = simulator
+        faults = sim.faults
+        sim.requests += 1
+
+        async def counting_send(message):
+            if message["type"] == "http.response.start":
+                sim.statuses[message["status"]] += 1
+            elif message["type"] == "http.response.body":
+                sim.bytes_sent += len(message.get("body", b""))
+            await send(message)
+
+        if sim.rate_limited():
+            await self._error(429, faults, scope, receive, counting_send)
+            return
+        if faults.max_concurrency and sim.slots is None:
+            sim.slots = asyncio.Semaphore(faults.max_concurrency)
+        slots = sim.slots if faults.max_concurrency else None
+        if slots is not None:
+            await slots.acquire()
+        sim.in_flight += 1
+        sim.peak_in_flight = max(sim.peak_in_flight, sim.in_flight)
+        try:
+            delay = sim.latency()
+            if delay:
+                await asyncio.sleep(delay)
+            if sim.failed():
+                await self._error(faults.status, faults, scope, receive, counting_send)
+                return
+            if faults.bandwidth_kbps:
+                await self.app(scope, receive, self._throttled(counting_send, faults.bandwidth_kbps * 125))
+            else:
+                await self.app(scope, receive, counting_send)
+        finally:
+            sim.in_flight -= 1
+            if slots is not None:
+                slots.release()
+
+    async def _error(self, status_code, faults, scope, receive, send):
+        headers = {"Retry-After": str(faults.retry_after_s)} if status_code in (429, 503) else None
+        response = JSONResponse({"error": "injected fault"}, status_code=status_code, headers=headers)
+        await response(scope, receive, send)
+
+    def _throttled(self, send, bytes_per_second):
+        # Bodies go out in pieces of 50 ms worth of bandwidth
+        piece_size = max(int(bytes_per_second / 20), 256)
+
+        async def throttled_send(message):
+            body = message.get("body", b"")
+            if message["type"] != "http.response.body" or len(body) <= piece_size:
+                await send(message)
+                if body:
+                    await asyncio.sleep(len(body) / bytes_per_second)
+                return
+            more_body = message.get("more_body", False)
+            for start in range(0, len(body), piece_size):
+                piece = body[start:start + piece_size]
+                last = start + piece_size >= len(body)
+                await send({"type": "http.response.body", "body": piece, "more_body": more_body or not last})
+                await asyncio.sleep(len(piece) / bytes_per_second)
+
+        return throttled_send
+
+
+app = FastAPI(title="TourEase upstream simulator", docs_url=None, redoc_url=None)
+app.add_middleware(FaultInjector)
+simulator = Simulator(Faults())
+
+# Recorded restcountries /v3.1/all response
+fixtures_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+with open(os.path.join(fixtures_dir, "restcountries_all.json")) as f:
+    COUNTRIES = json.load(f)
+
+
+def configure(faults: Faults) -> Faults:
+    """
+    Replace the current faults (also restarts the seeded random sequence).
+    """
+    simulator.configure(faults)
+    return faults
+
+
+@app.get("/_faults", response_model=Faults)
+async def get_faults():
+    return simulator.faults
+
+
+@app.put("/_faults", response_model=Faults)
+async def set_faults(faults: Faults):
+    return configure(faults)
+
+
+@app.get("/_stats")
+async def get_stats():
+    return simulator.stats()
+
+
+@app.delete("/_stats")
+async def reset_stats():
+    simulator.reset_stats()
+    return simulator.stats()
+
+
+def _hourly(latitude, longitude, variables, start_date, end_date):
+    # Deterministic seasonal and daily cycles derived from the coordinates
+    start, end = date.fromisoformat(start_date), date.fromisoformat(end_date)
+    base = 25 - abs(latitude) / 3
+    hemisphere = 1 if latitude >= 0 else -1
+    times, values = [], {name: [] for name in variables}
+    day = start
+    while day <= end:
+        season = math.cos((day.timetuple().tm_yday - 200) / 365 * 2 * math.pi) * hemisphere
+        for hour in range(24):
+            times.append(f"{day.isoformat()}T{hour:02d}:00")
+            if "temperature_2m" in values:
+                diurnal = -math.cos((hour - 3) / 24 * 2 * math.pi)
+                values["temperature_2m"].append(round(base + 8 * season + 5 * diurnal, 1))
+            if "precipitation" in values:
+                values["precipitation"].append(0.4 if (day.toordinal() + hour + int(abs(longitude))) % 17 == 0 else 0.0)
+        day += timedelta(days=1)
+    units = {"temperature_2m": "°C", "precipitation": "mm"}
+    return {
+        "hourly_units": {"time": "iso8601", **{name: units.get(name, "") for name in variables}},
+        "hourly": {"time": times, **values},
+    }
+
+
+@app.get("/v1/archive")
+async def archive(
+    latitude: float = Query(...),
+    longitude: float = Query(...),
+    start_date: str = Query(...),
+    end_date: str = Query(...),
+    hourly: str = "",
+):
+    return {"latitude": latitude, "longitude": longitude,
+            **_hourly(latitude, longitude, hourly.split(",") if hourly else [], start_date, end_date)}
+
+
+@app.get("/v1/forecast")
+async def forecast(
+    latitude: float = Query(...),
+    longitude: float = Query(...),
+    current: str = "",
+    hourly: str = "",
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+):
+    if hourly:
+        start_date = start_date or date.today().isoformat()
+        end_date = end_date or (date.fromisoformat(start_date) + timedelta(days=6)).isoformat()
+        return {"latitude": latitude, "longitude": longitude,
+                **_hourly(latitude, longitude, hourly.split(","), start_date, end_date)}
+    # Deterministic values derived from the coordinates
+    temperature = round(25 - abs(latitude) / 3, 1)
+    return {
+        "latitude": latitude,
+        "longitude": longitude,
+        "current_units": {
+            "time": "iso8601",
+            "temperature_2m": "°C",
+            "relative_humidity_2m": "%",
+            "apparent_temperature": "°C",
+            "precipitation": "mm",
+            "rain": "mm",
+            "weather_code": "wmo code",
+            "wind_speed_10m": "km/h",
+        },
+        "current": {
+            "time": datetime.now().strftime("%Y-%m-%dT%H:00"),
+            "temperature_2m": temperature,
+            "relative_humidity_2m": 60,
+            "apparent_temperature": temperature - 1,
+            "precipitation": 0.0,
+            "rain": 0.0,
+            "weather_code": int(abs(longitude)) % 4,
+            "wind_speed_10m": 10.0,
+        },
+    }
+
+
+@app.get("/v3.1/all")
+async def all_countries(fields: Optional[str] = None):
+    if not fields:
+        return COUNTRIES
+    wanted = fields.split(",")
+    return [{key: country[key] for key in wanted if key in country} for country in COUNTRIES]
+
+
+@contextlib.contextmanager
+def serve(faults: Optional[Faults] = None, host: str = "127.0.0.1", port: int = 0):
+    """
+    Run the simulator in a background thread (on a free port by default) and
+    yield its base URL; stops it on exit.
+    """
+    import uvicorn
+
+    if faults is not None:
+        configure(faults)
+    simulator.reset_stats()
+    server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning", lifespan="off"))
+    thread = threading.Thread(target=server.run, name="upstream-sim", daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("upstream simulator failed to start")
+        time.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    try:
+        yield f"http://{host}:{port}"
+    finally:
+        server.should_exit = True
+        thread.join(timeout=5)
+
+
+@contextlib.contextmanager
+def attach(base_url: Optional[str] = None):
+    """
+    Point the API's upstream clients at the simulator at ``base_url``, or at
+    this app in-process when no URL is given; restores them on exit.
+    """
+    import httpx
+    import upstream
+
+    clients = upstream.clients
+    saved = [(client.base_url, client.transport) for client in clients]
+    for client in clients:
+        client.base_url = (base_url or "http://upstream-sim").rstrip("/")
+        client.transport = None if base_url else httpx.ASGITransport(app=app)
+    try:
+        yield
+    finally:
+        for client, (saved_url, saved_transport) in zip(clients, saved):
+            client.base_url = saved_url
+            client.transport = saved_transport
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the upstream simulator")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    for name, field in Faults.model_fields.items():
+        option = "--" + name.replace("_", "-")
+        if name == "latency_distribution":
+            parser.add_argument(option, default=field.default, choices=get_args(field.annotation))
+        else:
+            parser.add_argument(option, type=int if field.annotation in (int, Optional[int]) else float,
+                                default=field.default)
+    args = parser.parse_args(argv)
+    configure(Faults(**{name: getattr(args, name) for name in Faults.model_fields}))
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
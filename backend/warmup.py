@@ -0,0 +1,79 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Warm-up steps run in the background once the server is accepting
+# connections, so health checks answer immediately while heavy modules,
+# the catalog and derived indexes load. /ready reports when they finished.
+_steps: List[Tuple[str, Callable[[], Awaitable[None]]]] = []
+_status: Dict[str, dict] = {}
+_task = None
+_ready = False
+
+metrics.registry.gauge("tourease_ready", "1 once background warm-up has finished").set_function(
+    lambda: 1.0 if _ready else 0.0
+)
+
+
+def register(name: str):
+    """
+    Register a coroutine function to run during warm-up, in registration order.
+    """
+    def decorator(func):
+        _steps.append((name, func))
+        _status[name] = {"state": "pending"}
+        return func
+    return decorator
+
+
+async def _run():
+    global _ready
+    for name, func in _steps:
+        _status[name] = {"state": "running"}
+        started = time.perf_counter()
+        try:
+            await func()
+        except Exception as e:
+            # A failed step falls back to loading on first use
+            logger.error("Warm-up step %s failed: %s", name, e)
+            _status[name] = {"state": "failed", "error": str(e)}
+        else:
+            _status[name] = {
+                "state": "done",
+                "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+            }
+    _ready = True
+
+
+def start():
+    """
+    Start warm-up in the background; called from the app lifespan.
+    """
+    global _task
+    if _task is None or _task.done():
+        _task = asyncio.get_running_loop().create_task(_run())
+    return _task
+
+
+async def stop():
+    global _task
+    if _task is not None and not _task.done():
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+    _task = None
+
+
+def is_ready() -> bool:
+    return _ready
+
+
+def status() -> dict:
+    return {name: dict(state) for name, state in _status.items()}